@@ -0,0 +1,101 @@
+# export_retinaface_onnx.py
+# Exports the retinaface package's Keras model to ONNX for the CPU backend
+# (FDRP_DETECTOR_BACKEND=onnx), optionally quantized to int8.
+#
+# Needs TensorFlow + retinaface + tf2onnx (+ onnxruntime for --int8), once, on any machine.
+#
+# Usage (from the FDRP folder):
+#   python FDRP-Workers/export_retinaface_onnx.py [--output FDRP-Workers/models/retinaface.onnx]
+#   python FDRP-Workers/export_retinaface_onnx.py --int8 [--calibration-folder some/event/images]
+import os
+import sys
+import json
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from retinaface_onnx import DEFAULT_MODEL_PATH, read_model_info
+from retinaface_decode import letterbox, canvas_for, parse_canvas
+
+
+def export_fp32(output_path, opset=13):
+    import tensorflow as tf
+    import tf2onnx
+    from retinaface.model import retinaface_model
+
+    model = retinaface_model.build_model()  # Downloads the weights on first use
+    input_name = "image"
+    spec = (tf.TensorSpec((None, None, None, 3), tf.float32, name=input_name),)
+    # NCHW input so OpenCV DNN can feed it directly; outputs stay NHWC like the TF model
+    model_proto, _ = tf2onnx.convert.from_keras(
+        model, input_signature=spec, opset=opset, inputs_as_nchw=[input_name], output_path=output_path
+    )
+    info = {
+        "input": model_proto.graph.input[0].name,
+        "outputs": [output.name for output in model_proto.graph.output],
+        "layout": "NCHW",
+    }
+    with open(output_path + ".json", "w") as f:
+        json.dump(info, f, indent=2)
+    print(f"✅ Exported {output_path} ({len(info['outputs'])} outputs)")
+    return info
+
+
+class LetterboxCalibrationReader:
+    """Feeds letterboxed event images to onnxruntime's static int8 calibration."""
+
+    def __init__(self, folder, input_name, canvas, limit):
+        import cv2
+        self.input_name = input_name
+        self.items = []
+        for name in sorted(os.listdir(folder))[:limit]:
+            img = cv2.imread(os.path.join(folder, name))
+            if img is None:
+                continue
+            tensor, _, _ = letterbox(img, canvas_for(img, canvas))
+            if tensor.shape[1] < tensor.shape[0]:
+                continue  # Calibrate one shape only
+            self.items.append(tensor.transpose(2, 0, 1)[None])
+
+    def get_next(self):
+        if not self.items:
+            return None
+        return {self.input_name: self.items.pop()}
+
+
+def quantize_int8(fp32_path, int8_path, calibration_folder=None, canvas="1824x1024", limit=32):
+    """
+    Static QDQ quantization when calibration images are given (best accuracy and
+    speed), otherwise dynamic weight-only quantization.
+    """
+    from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantType, QuantFormat
+    info = read_model_info(fp32_path)
+    if calibration_folder:
+        reader = LetterboxCalibrationReader(calibration_folder, info["input"], parse_canvas(canvas), limit)
+        if not reader.items:
+            raise ValueError(f"No usable landscape calibration images in {calibration_folder}")
+        quantize_static(fp32_path, int8_path, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    else:
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+    with open(int8_path + ".json", "w") as f:
+        json.dump(info, f, indent=2)
+    print(f"✅ Quantized {int8_path} ({'static' if calibration_folder else 'dynamic'} int8)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export RetinaFace to ONNX for the CPU detector backend.")
+    parser.add_argument("--output", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--opset", type=int, default=13)
+    parser.add_argument("--int8", action="store_true", help="Also write <output>.int8.onnx")
+    parser.add_argument("--calibration-folder", help="Images for static int8 calibration (dynamic if omitted).")
+    parser.add_argument("--canvas", default="1824x1024", help="Calibration input size, as FDRP_RETINAFACE_CANVAS.")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    export_fp32(args.output, args.opset)
+    if args.int8:
+        int8_path = os.path.splitext(args.output)[0] + ".int8.onnx"
+        quantize_int8(args.output, int8_path, args.calibration_folder, args.canvas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# face_detectors.py
+# Face detector backends behind one interface, chosen by FDRP_DETECTOR_BACKEND.
+#
+# Every backend returns what RetinaFace.detect_faces() returns for an image:
+#   {"face_1": {"score": float, "facial_area": [x1, y1, x2, y2],
+#               "landmarks": {"right_eye", "left_eye", "nose", "mouth_right", "mouth_left": [x, y]}}, ...}
+# or {} when there are no faces, so extract_faces does not care which one runs.
+#
+#   tf       the retinaface package on TensorFlow (default; GPU if available)
+#   onnx     the same network exported to ONNX, on CPU (see retinaface_onnx.py)
+#   pytorch  the Pytorch_Retinaface submodule (ResNet50 or MobileNet0.25 weights)
+#   yunet    OpenCV's YuNet, a small CPU detector (cv2.FaceDetectorYN)
+#
+# New backends register themselves with @register_detector("name").
+# benchmarks/detector_benchmark.py compares them on a folder of images.
+import os
+import sys
+import numpy as np
+from retinaface_decode import detect_batch, preprocess_single, nms, SCORE_THRESHOLD, NMS_THRESHOLD
+
+WORKERS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(WORKERS_DIR, "models")
+LANDMARK_NAMES = ["right_eye", "left_eye", "nose", "mouth_right", "mouth_left"]
+
+DETECTORS = {}
+
+
+def register_detector(name):
+    """Class decorator adding a backend to DETECTORS under `name`."""
+    def register(cls):
+        cls.name = name
+        DETECTORS[name] = cls
+        return cls
+    return register
+
+
+def create_detector(name=None):
+    """
+    Builds the backend called `name` (FDRP_DETECTOR_BACKEND when omitted).
+    The model itself is loaded lazily, on build_model() or the first detection.
+    """
+    name = name or os.environ.get("FDRP_DETECTOR_BACKEND", "tf")
+    if name == "onnx":
+        import retinaface_onnx  # noqa: F401 - registers itself, kept out of the import path of the other backends
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}'. Available: {', '.join(available_detectors())}")
+    return DETECTORS[name].from_env()
+
+
+def available_detectors():
+    return sorted(set(DETECTORS) | {"onnx"})
+
+
+def faces_dict(rows):
+    """
+    rows: iterable of (score, [x1, y1, x2, y2], 5x2 landmarks), best first.
+    Returns the RetinaFace.detect_faces() dict for them.
+    """
+    faces = {}
+    for index, (score, box, points) in enumerate(rows):
+        faces[f"face_{index + 1}"] = {
+            "score": float(score),
+            "facial_area": [int(v) for v in box],
+            "landmarks": {name: [float(v) for v in point] for name, point in zip(LANDMARK_NAMES, points)},
+        }
+    return faces
+
+
+class FaceDetector:
+    """
+    Base class of the backends. Subclasses implement detect_faces() and
+    usually build_model(); the rest has working defaults.
+    """
+    name = None
+
+    @classmethod
+    def from_env(cls):
+        """The backend configured from its FDRP_* environment variables."""
+        return cls()
+
+    @property
+    def version(self):
+        """Identifies the model and settings behind the results, e.g. for result_cache.py."""
+        return self.name
+
+    def build_model(self):
+        """Loads the model once. Returns self."""
+        return self
+
+    def detect_faces(self, img, threshold=SCORE_THRESHOLD, allow_upscaling=True):
+        """Faces in one BGR image, as RetinaFace.detect_faces() returns them."""
+        raise NotImplementedError
+
+    def detect_faces_batch(self, images, canvas):
+        """
+        One result dict per BGR image, in input order. Backends without a batched
+        forward pass fall back to one image at a time (`canvas` is then unused).
+        """
+        return [self.detect_faces(img) for img in images]
+
+    def on_device(self, run):
+        """Calls run() on the device this backend should use; CPU backends just call it."""
+        return run()
+
+    def free_memory(self):
+        """Releases what build_model() loaded, when the worker is not kept warm."""
+        pass
+
+
+@register_detector("tf")
+class TfRetinaFace(FaceDetector):
+    """The retinaface package (serengil/retinaface) on TensorFlow."""
+
+    def __init__(self):
+        from retinaface import RetinaFace
+        import tensorflow as tf
+        self.package = RetinaFace
+        self.tf = tf
+
+        # Enable GPU memory growth to avoid memory allocation errors
+        gpus = tf.config.experimental.list_physical_devices('GPU')
+        if gpus:
+            try:
+                for gpu in gpus:
+                    tf.config.experimental.set_memory_growth(gpu, True)
+            except RuntimeError as e:
+                print(e)
+
+    def build_model(self):
+        self.package.build_model()  # Cached by the retinaface package after the first call
+        return self
+
+    def detect_faces(self, img, threshold=SCORE_THRESHOLD, allow_upscaling=True):
+        return self.package.detect_faces(img, threshold=threshold, allow_upscaling=allow_upscaling)
+
+    def detect_faces_batch(self, images, canvas):
+        """Letterboxed batches, one forward pass per canvas shape, decoded like the package does."""
+        model = self.package.build_model()
+        return detect_batch(images, canvas, lambda batch: [out.numpy() for out in model(batch)])
+
+    def on_device(self, run):
+        try:
+            with self.tf.device('/GPU:0'):
+                return run()
+        except self.tf.errors.ResourceExhaustedError:
+            print("Falling back to CPU for face detection due to GPU OOM.")
+            with self.tf.device('/CPU:0'):
+                return run()
+
+    def free_memory(self):
+        print("Freeing Up GPU memory!")
+        self.tf.keras.backend.clear_session()
+
+
+@register_detector("pytorch")
+class PytorchRetinaFace(FaceDetector):
+    """
+    The Pytorch_Retinaface submodule (FDRP-Workers/Pytorch_Retinaface, fetch it with
+    `git submodule update --init`). Weights go in its weights/ folder.
+
+    Args:
+        network (str): 'resnet50' or 'mobile0.25'.
+        weights (str): .pth file; defaults to the submodule's file for `network`.
+        device (str): 'cuda', 'cpu', or '' for cuda when available.
+    """
+    REPO_DIR = os.path.join(WORKERS_DIR, "Pytorch_Retinaface")
+    WEIGHTS = {"resnet50": "Resnet50_Final.pth", "mobile0.25": "mobilenet0.25_Final.pth"}
+    MEAN_BGR = np.array([104, 117, 123], dtype=np.float32)
+    TOP_K = 5000
+
+    def __init__(self, network="resnet50", weights="", device=""):
+        if network not in self.WEIGHTS:
+            raise ValueError(f"Unknown Pytorch_Retinaface network '{network}' (expected 'resnet50' or 'mobile0.25').")
+        self.network = network
+        self.weights = weights or os.path.join(self.REPO_DIR, "weights", self.WEIGHTS[network])
+        self.device_name = device
+        self.net = None
+
+    @property
+    def version(self):
+        return f"{self.name}-{self.network}-{os.path.basename(self.weights)}"
+
+    @classmethod
+    def from_env(cls):
+        return cls(network=os.environ.get("FDRP_PYTORCH_RETINAFACE_NETWORK", "resnet50"),
+                   weights=os.environ.get("FDRP_PYTORCH_RETINAFACE_WEIGHTS", ""),
+                   device=os.environ.get("FDRP_PYTORCH_RETINAFACE_DEVICE", ""))
+
+    def build_model(self):
+        if self.net is not None:
+            return self
+        if not os.path.isdir(os.path.join(self.REPO_DIR, "models")):
+            raise ImportError(f"{self.REPO_DIR} is empty. Run `git submodule update --init` first.")
+        import torch
+        if self.REPO_DIR not in sys.path:
+            sys.path.insert(0, self.REPO_DIR)
+        from data import cfg_mnet, cfg_re50
+        from models.retinaface import RetinaFace
+        from layers.functions.prior_box import PriorBox
+        from utils.box_utils import decode as decode_boxes, decode_landm
+
+        self.torch = torch
+        self.prior_box, self.decode_boxes, self.decode_landm = PriorBox, decode_boxes, decode_landm
+        self.cfg = cfg_re50 if self.network == "resnet50" else cfg_mnet
+        self.device = torch.device(self.device_name or ("cuda" if torch.cuda.is_available() else "cpu"))
+
+        net = RetinaFace(cfg=self.cfg, phase='test')
+        state = torch.load(self.weights, map_location=self.device)
+        # Checkpoints saved from DataParallel prefix every key with 'module.'
+        net.load_state_dict({k[len("module."):] if k.startswith("module.") else k: v for k, v in state.items()},
+                            strict=False)
+        self.net = net.eval().to(self.device)
+        print(f"Loaded Pytorch_Retinaface {self.network} on {self.device}")
+        return self
+
+    def detect_faces(self, img, threshold=SCORE_THRESHOLD, allow_upscaling=True):
+        self.build_model()
+        torch = self.torch
+        tensor, scale, (height, width) = preprocess_single(img, allow_upscaling)  # Same input size as the TF model
+        tensor = tensor[:, :, ::-1] - self.MEAN_BGR  # Back to BGR, minus the training mean
+        batch = torch.from_numpy(np.ascontiguousarray(tensor.transpose(2, 0, 1)))[None].to(self.device)
+        with torch.no_grad():
+            loc, conf, landms = self.net(batch)
+
+        priors = self.prior_box(self.cfg, image_size=(height, width)).forward().to(self.device)
+        variance = self.cfg['variance']
+        boxes = self.decode_boxes(loc[0], priors, variance).cpu().numpy() * np.array([width, height] * 2)
+        points = self.decode_landm(landms[0], priors, variance).cpu().numpy() * np.array([width, height] * 5)
+        scores = conf[0][:, 1].cpu().numpy()
+
+        keep = np.where(scores >= threshold)[0]
+        keep = keep[np.argsort(scores[keep])[::-1]][:self.TOP_K]
+        if keep.size == 0:
+            return {}
+        dets = np.hstack((boxes[keep], scores[keep, np.newaxis])).astype(np.float32)
+        points = points[keep].reshape((-1, 5, 2))
+        kept = nms(dets, NMS_THRESHOLD)
+        return faces_dict((dets[i, 4], dets[i, :4] / scale, points[i] / scale) for i in kept)
+
+    def free_memory(self):
+        if self.net is not None and self.device.type == "cuda":
+            self.net = None
+            self.torch.cuda.empty_cache()
+
+
+@register_detector("yunet")
+class YuNetDetector(FaceDetector):
+    """
+    OpenCV's YuNet (face_detection_yunet_2023mar.onnx from the opencv_zoo repository).
+    Much lighter than RetinaFace; small or blurred faces are where it loses recall.
+
+    Args:
+        model_path (str): The YuNet .onnx file.
+        max_size (int): Long side images are shrunk to before detection (0 keeps them as they are).
+    """
+    DEFAULT_MODEL_PATH = os.path.join(MODELS_DIR, "face_detection_yunet_2023mar.onnx")
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, max_size=0):
+        self.model_path = model_path
+        self.max_size = max_size
+        self.net = None
+
+    @property
+    def version(self):
+        return f"{self.name}-{os.path.basename(self.model_path)}-{self.max_size}"
+
+    @classmethod
+    def from_env(cls):
+        return cls(model_path=os.environ.get("FDRP_YUNET_MODEL", "") or cls.DEFAULT_MODEL_PATH,
+                   max_size=int(os.environ.get("FDRP_YUNET_MAX_SIZE", 0)))
+
+    def build_model(self):
+        if self.net is None:
+            import cv2
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"YuNet model not found at {self.model_path}")
+            self.net = cv2.FaceDetectorYN.create(self.model_path, "", (320, 320), SCORE_THRESHOLD, NMS_THRESHOLD)
+            print(f"Loaded YuNet from {self.model_path}")
+        return self
+
+    def detect_faces(self, img, threshold=SCORE_THRESHOLD, allow_upscaling=True):
+        import cv2
+        self.build_model()
+        scale = 1.0
+        if self.max_size and max(img.shape[:2]) > self.max_size:
+            scale = self.max_size / max(img.shape[:2])
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        height, width = img.shape[:2]
+        self.net.setInputSize((width, height))
+        self.net.setScoreThreshold(threshold)
+        _, rows = self.net.detect(img)
+        if rows is None:
+            return {}
+        # Row: x, y, w, h, right eye, left eye, nose, right and left mouth corners (x, y each), score
+        rows = rows[np.argsort(rows[:, 14])[::-1]]
+        limits = np.array([width - 1, height - 1] * 2)
+        return faces_dict(
+            (row[14], np.clip([row[0], row[1], row[0] + row[2], row[1] + row[3]], 0, limits) / scale,
+             row[4:14].reshape((5, 2)) / scale)
+            for row in rows
+        )
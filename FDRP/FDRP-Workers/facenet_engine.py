@@ -0,0 +1,197 @@
+# facenet_engine.py
+# Batched face embeddings: the DeepFace model is built once per process and
+# crops are fed to it as (N, 160, 160, 3) batches instead of one
+# DeepFace.represent() call per file.
+#
+# Preprocessing reproduces DeepFace.represent(detector_backend='skip',
+# normalization='base'), so embeddings match the per-file path. Batching is
+# opt-in (FDRP_FACENET_BATCHED=1) until benchmarks/facenet_batch_benchmark.py
+# has been run on the production weights and its --report kept; until then
+# the engine calls DeepFace.represent() once per crop.
+import os
+import cv2
+import queue
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+BATCHED = os.environ.get("FDRP_FACENET_BATCHED", "0") == "1"
+BATCH_SIZE = int(os.environ.get("FDRP_FACENET_BATCH_SIZE", 32))
+DECODE_THREADS = int(os.environ.get("FDRP_FACENET_DECODE_THREADS", 2))
+# CropStream: at most this many crops wait for the model; a partial batch runs after BATCH_WAIT seconds without new crops
+STREAM_DEPTH = int(os.environ.get("FDRP_FACENET_STREAM_DEPTH", 64))
+BATCH_WAIT = float(os.environ.get("FDRP_FACENET_BATCH_WAIT", 0.05))
+
+_engines = {}
+
+
+def preprocess_face(img, target_size=(160, 160)):
+    """
+    A BGR crop as DeepFace feeds it to the model: RGB, resized to fit
+    `target_size` (height, width) keeping the aspect ratio, zero-padded to
+    the centre, scaled to [0, 1].
+
+    Returns:
+        np.ndarray: float32 array of shape (height, width, 3).
+    """
+    img = img[:, :, ::-1]
+    factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+    img = cv2.resize(img, (int(img.shape[1] * factor), int(img.shape[0] * factor)))
+    diff_0 = target_size[0] - img.shape[0]
+    diff_1 = target_size[1] - img.shape[1]
+    img = np.pad(img, ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)), "constant")
+    if img.shape[0:2] != target_size:
+        img = cv2.resize(img, target_size)
+    img = img.astype(np.float32)
+    if img.max() > 1:
+        img /= 255.0
+    return img
+
+
+class FaceNetEngine:
+    """
+    Args:
+        model_name (str): DeepFace recognition model ('Facenet512' in production).
+        batch_size (int): Crops per forward pass.
+        batched (bool): Run batched forward passes instead of one DeepFace.represent() per crop.
+    """
+
+    def __init__(self, model_name="Facenet512", batch_size=BATCH_SIZE, batched=BATCHED):
+        from deepface import DeepFace
+        self.represent = DeepFace.represent
+        self.model_name = model_name
+        self.batch_size = max(batch_size, 1)
+        self.batched = batched
+        self.model = DeepFace.build_model(model_name)  # Also cached inside DeepFace
+        self.target_size = tuple(self.model.input_shape[::-1])  # DeepFace stores (width, height)
+
+    def _forward(self, images):
+        batch = np.stack([preprocess_face(img, self.target_size) for img in images])
+        return self.model.model(batch, training=False).numpy().astype(np.float32, copy=False)
+
+    def _embed_one(self, img):
+        """One crop's embedding, or None if it cannot be embedded."""
+        try:
+            if self.batched:
+                return self._forward([img])[0]
+            return np.asarray(self.represent(img_path=img, model_name=self.model_name, enforce_detection=False,
+                                             detector_backend='skip')[0]['embedding'], dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Could not embed a crop: {type(e).__name__} - {e}")
+            return None
+
+    def embed_images(self, images):
+        """
+        Embeds BGR crops, a batch per forward pass, or one DeepFace.represent()
+        call per crop when the engine is not `batched`. A bad crop only loses
+        itself: a batch that fails is run again one crop at a time.
+
+        Returns:
+            list: One float32 np.ndarray per crop, or None where the crop could not be embedded.
+        """
+        embeddings = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            if self.batched:
+                try:
+                    embeddings.extend(self._forward(chunk))
+                    continue
+                except Exception as e:
+                    print(f"⚠️ Batch of {len(chunk)} crop(s) failed, embedding them one by one: {e}")
+            embeddings.extend(self._embed_one(img) for img in chunk)
+        return embeddings
+
+    def embed_files(self, paths):
+        """
+        Embeds crop files, decoding the next batch while the current one runs.
+
+        Returns:
+            dict: {path: list[float]} for every file that could be read and embedded; the rest are left out.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="facenet-decode") as pool:
+            batches = [paths[start:start + self.batch_size] for start in range(0, len(paths), self.batch_size)]
+            pending = pool.map(cv2.imread, batches[0]) if batches else None
+            for index, batch in enumerate(batches):
+                images = list(pending)
+                if index + 1 < len(batches):
+                    pending = pool.map(cv2.imread, batches[index + 1])
+                readable = [(path, img) for path, img in zip(batch, images) if img is not None]
+                if not readable:
+                    continue
+                embeddings = self.embed_images([img for _, img in readable])
+                for (path, _), embedding in zip(readable, embeddings):
+                    if embedding is not None:
+                        results[path] = embedding.tolist()
+        return results
+
+
+class CropStream:
+    """
+    Feeds in-memory BGR crops to an engine from other threads, through a
+    bounded queue that blocks the producers while the model is behind.
+    Crops are embedded in batches on a background thread.
+
+    Crops the engine cannot embed are missing from close()'s result. After an
+    unexpected error the stream keeps draining the queue without embedding,
+    so producers never block forever; those crops are missing too.
+
+    Args:
+        engine (FaceNetEngine): The model to run.
+        depth (int): Crops that may wait in the queue.
+    """
+
+    def __init__(self, engine, depth=STREAM_DEPTH):
+        self.engine = engine
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.embeddings = {}
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="facenet-stream", daemon=True)
+        self._thread.start()
+
+    def put(self, key, img):
+        """Queues one crop under `key` (typically its file name)."""
+        self.queue.put((key, img))
+
+    def close(self):
+        """
+        Waits for every queued crop to be embedded.
+
+        Returns:
+            dict: {key: list[float]} for every crop embedded.
+        """
+        self.queue.put(None)
+        self._thread.join()
+        return self.embeddings
+
+    def _run(self):
+        closed = False
+        while not closed:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.engine.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=BATCH_WAIT))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                closed = True
+                batch.pop()
+            if not batch or self.error is not None:
+                continue
+            try:
+                vectors = self.engine.embed_images([img for _, img in batch])
+            except Exception as e:
+                self.error = e
+                print(f"⚠️ Streaming embedding failed, remaining crops are left for the embedding stage: {e}")
+                continue
+            for (key, _), vector in zip(batch, vectors):
+                if vector is not None:
+                    self.embeddings[key] = vector.tolist()
+
+
+def get_engine(model_name="Facenet512", batch_size=BATCH_SIZE):
+    """The process-wide engine for `model_name`, built on first use."""
+    key = (model_name, batch_size)
+    if key not in _engines:
+        _engines[key] = FaceNetEngine(model_name, batch_size)
+    return _engines[key]
@@ -1,10 +1,12 @@
 import os
-import pickle
-from deepface import DeepFace
+from facenet_engine import get_engine
 # from tqdm import tqdm # tqdm might not be ideal for a background process log
 import logging
 import time # For the main loop example
 import tensorflow as tf
+from result_cache import get_result_cache, file_sha256
+from healpers.face_manifest import read_faces
+from healpers.embedding_store import EmbeddingStore, save_embeddings
 
 # Configure logging (do this once at the start of your manager script)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s')
@@ -16,16 +18,17 @@ GPU = "yes"
 def extract_face_embeddings(cropped_faces_dir, embeddings_output_dir, gpu=GPU, model_name=DEFAULT_MODEL):
     """
     Extracts face embeddings from images in cropped_faces_dir using a specified DeepFace model
-    and saves them to a pickle file named '<model_name>_embeddings.pkl' in embeddings_output_dir.
+    and appends them to the embedding store ('<model_name>_embeddings.npy' + index, see
+    healpers/embedding_store.py) in embeddings_output_dir. Crops already in the store are skipped.
 
     Args:
         cropped_faces_dir (str): Path to the directory containing pre-cropped and aligned face images.
-        embeddings_output_dir (str): Path to the directory where the embeddings pickle file will be saved.
+        embeddings_output_dir (str): Path to the directory holding the embedding store.
                                      This directory will be created if it doesn't exist.
         model_name (str): The DeepFace model to use for generating embeddings (default: 'Facenet').
 
     Returns:
-        str | None: The full path to the saved embeddings pickle file if successful, otherwise None.
+        str | None: The full path to the embedding matrix if new embeddings were saved, otherwise None.
                     Returns None if input directory is invalid, no images are found,
                     no embeddings could be extracted, or saving fails.
     """
@@ -60,26 +63,40 @@ def extract_face_embeddings(cropped_faces_dir, embeddings_output_dir, gpu=GPU, m
         return None # Indicate failure
 
     # --- Define Output File Path (inside the output directory) ---
-    output_file_name = f"{model_name.lower()}_embeddings.pkl"
-    output_file_path = os.path.join(embeddings_output_dir, output_file_name)
+    store = EmbeddingStore(embeddings_output_dir, model_name)
+    output_file_path = store.vectors_path
     logging.info(f"Embeddings will be saved to: '{output_file_path}'")
 
     embeddings_dict = {} # Dictionary to store {filename: embedding}
 
-    # --- List Image Files ---
+    # Crops already embedded (in this or any other event) are looked up by content hash
+    cache = get_result_cache()
+    cache_version = f"{model_name.lower()}-skip"  # Model + detector_backend='skip' on pre-aligned crops
+    cached_count = 0
+
+    # --- List Image Files (from the detection stage's face manifest when there is one) ---
     try:
-        all_files = os.listdir(cropped_faces_dir)
-        image_files = [f for f in all_files if f.lower().endswith(ALLOWED_EXTENSIONS)]
+        manifest = read_faces(embeddings_output_dir)
+        if manifest is not None:
+            image_files = [row["crop"] for row in manifest]
+        else:
+            all_files = os.listdir(cropped_faces_dir)
+            image_files = [f for f in all_files if f.lower().endswith(ALLOWED_EXTENSIONS)]
         if not image_files:
             logging.warning(f"No image files with extensions {ALLOWED_EXTENSIONS} found in '{cropped_faces_dir}'.")
             return None # No images to process
         logging.info(f"Found {len(image_files)} potential image files in '{cropped_faces_dir}'.")
+        stored = set(store.names())  # Earlier runs' rows are kept as they are
+        image_files = [f for f in image_files if f not in stored]
+        if stored:
+            logging.info(f"{len(stored)} crop(s) already embedded, {len(image_files)} left.")
     except OSError as e:
         logging.error(f"Error accessing cropped faces directory '{cropped_faces_dir}': {e}")
         return None
 
-    # --- Process Each Image ---
+    # --- Look Up Each Image in the Cache ---
     processed_count = 0
+    pending = {}  # {img_path: (filename, crop hash)} still to embed
     for filename in image_files:
         img_path = os.path.join(cropped_faces_dir, filename)
 
@@ -87,59 +104,49 @@ def extract_face_embeddings(cropped_faces_dir, embeddings_output_dir, gpu=GPU, m
             logging.warning(f"Skipping '{filename}' as it's not a file (likely a subdirectory).")
             continue
 
-        try:
-            # --- Extract the embedding using DeepFace.represent ---
-            embedding_objs = DeepFace.represent(
-                img_path=img_path,
-                model_name=model_name,
-                enforce_detection=False, # Crucial: Images are already cropped faces
-                detector_backend='skip'  # Explicitly skip detection backend
-            )
-
-            # DeepFace.represent returns a list containing a dictionary [{ 'embedding': [...] }]
-            if embedding_objs and isinstance(embedding_objs, list) and len(embedding_objs) > 0 \
-               and 'embedding' in embedding_objs[0] and isinstance(embedding_objs[0]['embedding'], list):
-                embedding = embedding_objs[0]['embedding']
+        crop_hash = None
+        if cache is not None:
+            try:
+                crop_hash = file_sha256(img_path)
+            except OSError as e:
+                logging.error(f"Skipping '{filename}' from '{cropped_faces_dir}': {e}")
+                continue
+            embedding = cache.get_embedding(crop_hash, cache_version)
+            if embedding is not None:
                 embeddings_dict[filename] = embedding
                 processed_count += 1
-            else:
-                logging.warning(f"Could not extract a valid embedding for '{filename}' from '{cropped_faces_dir}'. DeepFace.represent result format unexpected: {embedding_objs}")
-
-        except ValueError as ve:
-            logging.error(f"Skipping '{filename}' from '{cropped_faces_dir}' due to ValueError (often image format/corruption): {ve}")
-        except AttributeError as ae:
-             logging.error(f"Skipping '{filename}' from '{cropped_faces_dir}' due to AttributeError (backend issue?): {ae}")
-        except Exception as e:
-            logging.error(f"Skipping '{filename}' from '{cropped_faces_dir}' due to unexpected error: {type(e).__name__} - {e}")
-            # For deep debugging:
-            # import traceback
-            # logging.error(traceback.format_exc())
-
-    logging.info(f"Attempted processing {len(image_files)} files. Successfully extracted embeddings for {processed_count} files.")
+                cached_count += 1
+                continue
+
+        pending[img_path] = (filename, crop_hash)
+
+    # --- Embed the remaining crops in batches (one model load, one forward pass per batch) ---
+    if pending:
+        # A crop that fails is left out on its own; the event's other crops are kept
+        embedded = get_engine(model_name).embed_files(list(pending))
+        for img_path, (filename, crop_hash) in pending.items():
+            embedding = embedded.get(img_path)
+            if embedding is None:
+                logging.error(f"Skipping '{filename}' from '{cropped_faces_dir}': could not be read or embedded.")
+                continue
+            embeddings_dict[filename] = embedding
+            processed_count += 1
+            if crop_hash is not None:
+                cache.put_embedding(crop_hash, cache_version, embedding)
+
+    logging.info(f"Attempted processing {len(image_files)} files. Successfully extracted embeddings for {processed_count} files ({cached_count} from cache).")
 
     # --- Save Embeddings ---
     if embeddings_dict:  # Only proceed if we have new embeddings
         try:
-            # Load existing embeddings if the file exists
-            existing_embeddings = {}
-            if os.path.exists(output_file_path):
-                with open(output_file_path, 'rb') as f:
-                    existing_embeddings = pickle.load(f)
-                logging.info(f"Loaded {len(existing_embeddings)} existing embeddings from '{output_file_path}'")
-
-            # Merge old + new embeddings (new ones overwrite old if filenames clash)
-            merged_embeddings = {**existing_embeddings, **embeddings_dict}
-            
-            # Save the merged result
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(merged_embeddings, f)
-            
-            logging.info(f"Saved {len(merged_embeddings)} embeddings ({len(embeddings_dict)} new) to '{output_file_path}'")
+            # Appended after the existing rows; nothing already stored is rewritten
+            output_file_path, total = save_embeddings(embeddings_output_dir, embeddings_dict, model_name)
+            logging.info(f"Saved {total} embeddings ({len(embeddings_dict)} new) to '{output_file_path}'")
             return output_file_path
 
-        except (IOError, pickle.PickleError) as e:  # Combines both IO and pickle errors
+        except (OSError, ValueError) as e:  # Unwritable store, or an embedding size that does not match it
             logging.error(f"Failed to save embeddings to '{output_file_path}': {e}")
             return None
     else:
-        logging.warning(f"No new embeddings extracted. Existing file '{output_file_path}' was not modified.")
+        logging.warning(f"No new embeddings extracted. Existing store '{output_file_path}' was not modified.")
         return None
\ No newline at end of file
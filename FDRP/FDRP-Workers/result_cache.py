@@ -0,0 +1,119 @@
+# result_cache.py
+# Content-addressed cache of per-image work, shared by every event:
+#
+#   <root>/detections/<detection version>/<ab>/<image sha256>/record.json + face_<n>.jpg
+#   <root>/embeddings/<model version>/<ab>/<crop sha256>.npy
+#
+# Keys are hashes of the file bytes plus the version of whatever produced the
+# result, so the same photo in two events, or an event being re-run after a
+# later stage failed, is not detected or embedded twice. Entries are written
+# to a temporary name and renamed into place, so readers never see half an
+# entry. The whole folder can be deleted at any time.
+import os
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+
+CACHE_ENABLED = os.environ.get("FDRP_RESULT_CACHE", "1") == "1"
+CACHE_DIR = os.environ.get("FDRP_RESULT_CACHE_DIR", "Result_Cache")
+RECORD_FILE = "record.json"
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _safe(version):
+    """A model version string usable as a folder name."""
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in version)
+
+
+def _temp_name(path):
+    return f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+
+
+class ResultCache:
+    """
+    Args:
+        root (str): Cache folder (FDRP_RESULT_CACHE_DIR, 'Result_Cache' under the FDRP folder by default).
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+
+    def _detection_dir(self, image_hash, version):
+        return os.path.join(self.root, "detections", _safe(version), image_hash[:2], image_hash)
+
+    def _embedding_path(self, crop_hash, version):
+        return os.path.join(self.root, "embeddings", _safe(version), crop_hash[:2], crop_hash + ".npy")
+
+    def get_detections(self, image_hash, version):
+        """
+        Returns the cached record for an image ({"width", "height", "faces": [...]}), where
+        each face's "crop_path" points at its aligned crop in the cache, or None on a miss.
+        """
+        entry = self._detection_dir(image_hash, version)
+        try:
+            with open(os.path.join(entry, RECORD_FILE)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        for face in record["faces"]:
+            face["crop_path"] = os.path.join(entry, face.pop("file_name"))
+        return record
+
+    def put_detections(self, image_hash, version, record, crop_folder):
+        """
+        Stores an image's detection record and copies its aligned crops (the faces'
+        "file_name"s, inside `crop_folder`) into the cache. An existing entry is kept.
+        """
+        entry = self._detection_dir(image_hash, version)
+        if os.path.exists(entry):
+            return
+        temp = _temp_name(entry)
+        try:
+            os.makedirs(temp)
+            faces = []
+            for face in record["faces"]:
+                cached_name = f"face_{face['face_id']}.jpg"
+                shutil.copyfile(os.path.join(crop_folder, face["file_name"]), os.path.join(temp, cached_name))
+                faces.append(dict(face, file_name=cached_name))
+            with open(os.path.join(temp, RECORD_FILE), "w") as f:
+                json.dump(dict(record, faces=faces), f)
+            os.rename(temp, entry)
+        except OSError as e:
+            if not os.path.exists(entry):  # Losing the race to another worker is fine
+                print(f"⚠️ Could not cache detections for {image_hash[:12]}: {e}")
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def get_embedding(self, crop_hash, version):
+        """The cached embedding (list of floats) for a crop, or None."""
+        try:
+            return np.load(self._embedding_path(crop_hash, version)).tolist()
+        except (OSError, ValueError):
+            return None
+
+    def put_embedding(self, crop_hash, version, embedding):
+        path = self._embedding_path(crop_hash, version)
+        temp = _temp_name(path) + ".npy"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.save(temp, np.asarray(embedding, dtype=np.float64))
+            os.replace(temp, path)
+        except OSError as e:
+            print(f"⚠️ Could not cache embedding for {crop_hash[:12]}: {e}")
+            if os.path.exists(temp):
+                os.remove(temp)
+
+
+def get_result_cache():
+    """The configured cache, or None when FDRP_RESULT_CACHE=0."""
+    return ResultCache(CACHE_DIR) if CACHE_ENABLED else None
@@ -0,0 +1,214 @@
+# retinaface_decode.py
+# Pre- and post-processing for the RetinaFace (ResNet50) network, in plain
+# numpy/cv2 so it can be shared by every backend that runs the raw network.
+# The anchor, box and landmark maths follows the retinaface package, so the
+# decoded faces match RetinaFace.detect_faces().
+import cv2
+import numpy as np
+
+FEAT_STRIDES = [32, 16, 8]
+ANCHORS_FPN = {
+    32: np.array([[-248., -248., 263., 263.], [-120., -120., 135., 135.]], dtype=np.float32),
+    16: np.array([[-56., -56., 71., 71.], [-24., -24., 39., 39.]], dtype=np.float32),
+    8: np.array([[-8., -8., 23., 23.], [0., 0., 15., 15.]], dtype=np.float32),
+}
+NUM_ANCHORS = 2
+TARGET_SIZE = 1024  # RetinaFace scales the short side to this...
+MAX_SIZE = 1980     # ...unless the long side would exceed this
+NMS_THRESHOLD = 0.4
+SCORE_THRESHOLD = 0.9
+
+
+def parse_canvas(value):
+    """'1824x1024' -> (1824, 1024). Both sides are rounded up to a multiple of 32 (the largest stride)."""
+    width, height = [int(v) for v in value.lower().split("x")]
+    return (-(-width // 32) * 32, -(-height // 32) * 32)
+
+
+def canvas_for(img, canvas):
+    """The fixed canvas for `img`: `canvas` for landscape images, the transposed canvas for portrait ones."""
+    width, height = canvas
+    long_side, short_side = max(width, height), min(width, height)
+    img_h, img_w = img.shape[:2]
+    return (long_side, short_side) if img_w >= img_h else (short_side, long_side)
+
+
+def letterbox(img, canvas):
+    """
+    Scales a BGR image to fit `canvas` (width, height) and pads the bottom and
+    right edges with zeros, so detections only need dividing by the scale.
+
+    Returns:
+        tuple: (float32 RGB tensor of shape (height, width, 3), scale, (content_h, content_w))
+    """
+    canvas_w, canvas_h = canvas
+    img_h, img_w = img.shape[:2]
+    scale = min(canvas_w / img_w, canvas_h / img_h)
+    new_w, new_h = min(int(round(img_w * scale)), canvas_w), min(int(round(img_h * scale)), canvas_h)
+    if (new_w, new_h) != (img_w, img_h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    tensor = np.zeros((canvas_h, canvas_w, 3), dtype=np.float32)
+    tensor[:new_h, :new_w] = img[:, :, ::-1]  # BGR -> RGB, as the network expects
+    return tensor, scale, (new_h, new_w)
+
+
+def preprocess_single(img, allow_upscaling=True):
+    """The retinaface package's own scaling, for one image at its natural size."""
+    img_h, img_w = img.shape[:2]
+    im_size_min, im_size_max = min(img_h, img_w), max(img_h, img_w)
+    scale = TARGET_SIZE / float(im_size_min)
+    if not allow_upscaling:
+        scale = min(1.0, scale)
+    if np.round(scale * im_size_max) > MAX_SIZE:
+        scale = MAX_SIZE / float(im_size_max)
+    if scale != 1.0:
+        img = cv2.resize(img, None, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    tensor = img[:, :, ::-1].astype(np.float32)
+    return tensor, scale, img.shape[:2]
+
+
+def anchors_plane(height, width, stride, base_anchors):
+    anchors = base_anchors.shape[0]
+    xs = np.tile(np.arange(width)[np.newaxis, :, np.newaxis, np.newaxis], (height, 1, anchors, 1))
+    ys = np.tile(np.arange(height)[:, np.newaxis, np.newaxis, np.newaxis], (1, width, anchors, 1))
+    shifts = np.concatenate([xs, ys, xs, ys], axis=-1) * stride
+    return shifts + np.tile(base_anchors[np.newaxis, np.newaxis, :, :], (height, width, 1, 1))
+
+
+def _centers(boxes):
+    widths = boxes[:, 2] - boxes[:, 0] + 1.0
+    heights = boxes[:, 3] - boxes[:, 1] + 1.0
+    return widths, heights, boxes[:, 0] + 0.5 * (widths - 1.0), boxes[:, 1] + 0.5 * (heights - 1.0)
+
+
+def bbox_pred(boxes, deltas):
+    widths, heights, ctr_x, ctr_y = _centers(boxes.astype(np.float32))
+    pred_ctr_x = deltas[:, 0] * widths + ctr_x
+    pred_ctr_y = deltas[:, 1] * heights + ctr_y
+    pred_w = np.exp(deltas[:, 2]) * widths
+    pred_h = np.exp(deltas[:, 3]) * heights
+    return np.stack([
+        pred_ctr_x - 0.5 * (pred_w - 1.0),
+        pred_ctr_y - 0.5 * (pred_h - 1.0),
+        pred_ctr_x + 0.5 * (pred_w - 1.0),
+        pred_ctr_y + 0.5 * (pred_h - 1.0),
+    ], axis=1)
+
+
+def landmark_pred(boxes, deltas):
+    widths, heights, ctr_x, ctr_y = _centers(boxes.astype(np.float32))
+    pred = deltas.copy()
+    pred[:, :, 0] = deltas[:, :, 0] * widths[:, np.newaxis] + ctr_x[:, np.newaxis]
+    pred[:, :, 1] = deltas[:, :, 1] * heights[:, np.newaxis] + ctr_y[:, np.newaxis]
+    return pred
+
+
+def nms(dets, threshold):
+    """Greedy non-maximum suppression on rows of (x1, y1, x2, y2, score). Returns kept indices."""
+    x1, y1, x2, y2, scores = dets[:, 0], dets[:, 1], dets[:, 2], dets[:, 3], dets[:, 4]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.maximum(0.0, xx2 - xx1 + 1) * np.maximum(0.0, yy2 - yy1 + 1)
+        overlap = inter / (areas[i] + areas[order[1:]] - inter)
+        order = order[np.where(overlap <= threshold)[0] + 1]
+    return keep
+
+
+def decode(net_out, scale, content_shape, threshold=SCORE_THRESHOLD):
+    """
+    Turns the 9 network outputs for ONE image (batch dimension already
+    removed) into the dict RetinaFace.detect_faces() returns, in the
+    coordinates of the image before letterboxing.
+
+    Args:
+        net_out (list[np.ndarray]): (scores, bbox deltas, landmark deltas) for strides 32, 16, 8.
+        scale (float): Factor the image was resized by.
+        content_shape (tuple): (height, width) of the real content inside the canvas.
+    """
+    proposals_list, scores_list, landmarks_list = [], [], []
+    content_h, content_w = content_shape
+    for index, stride in enumerate(FEAT_STRIDES):
+        scores = net_out[index * 3][:, :, NUM_ANCHORS:]
+        bbox_deltas = net_out[index * 3 + 1]
+        landmark_deltas = net_out[index * 3 + 2]
+        height, width = bbox_deltas.shape[0], bbox_deltas.shape[1]
+
+        anchors = anchors_plane(height, width, stride, ANCHORS_FPN[stride]).reshape((-1, 4))
+        scores = scores.reshape((-1,))
+        order = np.where(scores >= threshold)[0]
+        if order.size == 0:
+            continue
+        anchors = anchors[order]
+
+        proposals = bbox_pred(anchors, bbox_deltas.reshape((-1, 4))[order])
+        # Clip to the real content, never into the letterbox padding
+        proposals[:, 0::2] = np.clip(proposals[:, 0::2], 0, content_w - 1)
+        proposals[:, 1::2] = np.clip(proposals[:, 1::2], 0, content_h - 1)
+        landmarks = landmark_pred(anchors, landmark_deltas.reshape((-1, 5, 2))[order])
+
+        proposals_list.append(proposals / scale)
+        scores_list.append(scores[order])
+        landmarks_list.append(landmarks / scale)
+
+    if not proposals_list:
+        return {}
+
+    proposals = np.vstack(proposals_list)
+    scores = np.concatenate(scores_list)
+    landmarks = np.vstack(landmarks_list).astype(np.float32, copy=False)
+    order = scores.argsort()[::-1]
+    dets = np.hstack((proposals[order], scores[order, np.newaxis])).astype(np.float32, copy=False)
+    landmarks = landmarks[order]
+    keep = nms(dets, NMS_THRESHOLD)
+
+    faces = {}
+    for index, i in enumerate(keep):
+        points = landmarks[i]
+        faces[f"face_{index + 1}"] = {
+            "score": float(dets[i, 4]),
+            "facial_area": [int(v) for v in dets[i, :4]],
+            "landmarks": {
+                "right_eye": [float(v) for v in points[0]],
+                "left_eye": [float(v) for v in points[1]],
+                "nose": [float(v) for v in points[2]],
+                "mouth_right": [float(v) for v in points[3]],
+                "mouth_left": [float(v) for v in points[4]],
+            },
+        }
+    return faces
+
+
+def detect_batch(images, canvas, forward, threshold=SCORE_THRESHOLD):
+    """
+    Batched detection for the backends that run the raw network: images are
+    grouped by canvas orientation (canvas_for), letterboxed and stacked, and
+    each group goes through `forward` once before being decoded per image.
+
+    Args:
+        images (list[np.ndarray]): BGR images.
+        canvas (tuple): (width, height) of the landscape canvas.
+        forward (callable): The backend's forward pass: takes an (N, H, W, 3) float32 RGB
+                            batch and returns the 9 outputs as numpy arrays, batch first.
+
+    Returns:
+        list[dict]: One RetinaFace.detect_faces() dict per image, in input order.
+    """
+    results = [None] * len(images)
+    groups = {}
+    for index, img in enumerate(images):
+        groups.setdefault(canvas_for(img, canvas), []).append(index)
+    for group_canvas, indices in groups.items():
+        prepared = [letterbox(images[index], group_canvas) for index in indices]
+        net_out = forward(np.stack([tensor for tensor, _, _ in prepared]))
+        for position, index in enumerate(indices):
+            _, scale, content_shape = prepared[position]
+            results[index] = decode([out[position] for out in net_out], scale, content_shape, threshold)
+    return results
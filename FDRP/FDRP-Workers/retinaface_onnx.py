@@ -0,0 +1,94 @@
+# retinaface_onnx.py
+# CPU RetinaFace backend: runs the graph exported by export_retinaface_onnx.py
+# through ONNX Runtime or OpenCV DNN, without TensorFlow. Pre- and
+# post-processing are shared with the TF batched path (retinaface_decode.py),
+# so results come back in the same format as RetinaFace.detect_faces().
+import os
+import json
+import numpy as np
+from retinaface_decode import preprocess_single, decode, detect_batch, SCORE_THRESHOLD
+from face_detectors import FaceDetector, register_detector, MODELS_DIR
+
+DEFAULT_MODEL_PATH = os.path.join(MODELS_DIR, "retinaface.onnx")
+
+
+def read_model_info(model_path):
+    """The sidecar written at export time: input name, output names in network order, input layout."""
+    with open(model_path + ".json") as f:
+        return json.load(f)
+
+
+@register_detector("onnx")
+class OnnxRetinaFace(FaceDetector):
+    """
+    The FaceDetector for FDRP_DETECTOR_BACKEND=onnx.
+
+    Args:
+        model_path (str): Exported .onnx file (fp32 or int8).
+        engine (str): 'onnxruntime' or 'opencv'.
+        threads (int): CPU threads for inference; 0 lets the engine decide.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, engine="onnxruntime", threads=0):
+        self.model_path = model_path
+        self.engine = engine
+        self.threads = threads
+        self.info = read_model_info(model_path)
+        self._session = None
+        self._net = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(model_path=os.environ.get("FDRP_RETINAFACE_ONNX_MODEL", "") or DEFAULT_MODEL_PATH,  # e.g. an .int8.onnx
+                   engine=os.environ.get("FDRP_RETINAFACE_ONNX_ENGINE", "onnxruntime"),  # or 'opencv'
+                   threads=int(os.environ.get("FDRP_RETINAFACE_ONNX_THREADS", 0)))
+
+    @property
+    def version(self):
+        return f"{self.name}-{os.path.basename(self.model_path)}"  # fp32 and int8 models are different files
+
+    def build_model(self):
+        """Loads the graph once; later calls are free."""
+        if self._session is not None or self._net is not None:
+            return self
+        if self.engine == "onnxruntime":
+            try:
+                import onnxruntime as ort
+            except ImportError:
+                raise ImportError("FDRP_DETECTOR_BACKEND=onnx with the onnxruntime engine needs `pip install onnxruntime`.")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        elif self.engine == "opencv":
+            import cv2
+            if self.threads:
+                cv2.setNumThreads(self.threads)
+            self._net = cv2.dnn.readNetFromONNX(self.model_path)
+            self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        else:
+            raise ValueError(f"Unknown ONNX engine '{self.engine}' (expected 'onnxruntime' or 'opencv').")
+        print(f"Loaded {self.model_path} with {self.engine}")
+        return self
+
+    def run(self, batch):
+        """Runs an (N, H, W, 3) float32 RGB batch. Returns the 9 outputs, NHWC, in network order."""
+        self.build_model()
+        if self.info.get("layout") == "NCHW":
+            batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        if self._session is not None:
+            return self._session.run(self.info["outputs"], {self.info["input"]: batch})
+        self._net.setInput(batch)
+        return self._net.forward(self.info["outputs"])
+
+    def detect_faces(self, img, threshold=SCORE_THRESHOLD, allow_upscaling=True):
+        """Same scaling, outputs and coordinates as RetinaFace.detect_faces() for one BGR image."""
+        tensor, scale, content_shape = preprocess_single(img, allow_upscaling)
+        net_out = self.run(tensor[np.newaxis])
+        return decode([out[0] for out in net_out], scale, content_shape, threshold)
+
+    def detect_faces_batch(self, images, canvas, threshold=SCORE_THRESHOLD):
+        """Letterboxed batches, one forward pass per canvas shape; see retinaface_decode.detect_batch."""
+        return detect_batch(images, canvas, self.run, threshold)
@@ -0,0 +1,26 @@
+# retinaface_server.py
+# Long-lived RetinaFace worker: loads the face detector once, then
+# crops events sent by retinaface_processing_manager.py until it recycles.
+import os
+import sys
+sys.path.append(".")  # To import healpers from the FDRP root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # To import retinaface_worker
+from retinaface_worker import extract_faces, detector, DEBUG_ARTIFACTS, FUSED_PIPELINE, EMBEDDING_MODEL
+from facenet_engine import get_engine
+from healpers.warm_worker import serve_jobs
+
+
+def handle_job(job):
+    extract_faces(job["input_folder"], job["output_folder"], job.get("image_names"), free_memory=False,
+                  debug_artifacts=job.get("debug_artifacts", DEBUG_ARTIFACTS))
+    return {"event_id": job.get("event_id")}
+
+
+if __name__ == "__main__":
+    print(f"Building {detector.name} face detector...")
+    detector.build_model()  # Kept loaded for every later event
+    if FUSED_PIPELINE:
+        print(f"Building {EMBEDDING_MODEL} for the fused pipeline...")
+        get_engine(EMBEDDING_MODEL)
+    print("Face detector ready. Waiting for events...")
+    serve_jobs(handle_job)
@@ -1,12 +1,24 @@
 import sys
-from retinaface_worker import extract_faces
+sys.path.append(".")  # To import healpers from the FDRP root
+from retinaface_worker import extract_faces, DEBUG_ARTIFACTS
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python retinaface_subprocess_entry.py <input_folder> <output_folder>")
+        print("Usage: python retinaface_subprocess_entry.py <input_folder> <output_folder> [event_id]")
         sys.exit(1)
 
     input_folder = sys.argv[1]
     output_folder = sys.argv[2]
 
-    extract_faces(input_folder, output_folder)
+    image_names = None
+    debug_artifacts = DEBUG_ARTIFACTS
+    if len(sys.argv) > 3:
+        # Read the upload manifest instead of listing the folder
+        from healpers.db_helper import get_event_manifest, get_event_debug_artifacts
+        event_id = int(sys.argv[3])
+        manifest = get_event_manifest(event_id, status='received')
+        if manifest:
+            image_names = {row['file_name']: row['sha256'] for row in manifest}
+        debug_artifacts = get_event_debug_artifacts(event_id, default=DEBUG_ARTIFACTS)
+
+    extract_faces(input_folder, output_folder, image_names, debug_artifacts=debug_artifacts)
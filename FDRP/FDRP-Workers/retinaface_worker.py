@@ -1,224 +1,243 @@
 # retinaface_worker.py
 import gc
 print("Setting Up The Environment. Please Wait...")
-print("importing os, cv2, RetinaFace, tensorflow...")
+print("importing os, cv2, face detector...")
 import os
 import cv2
-from retinaface import RetinaFace
-import tensorflow as tf
+import math
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from retinaface_decode import parse_canvas
+from face_detectors import create_detector
+from result_cache import get_result_cache, file_sha256
+from facenet_engine import get_engine, CropStream
+from healpers.face_manifest import write_face_manifest
+from healpers.embedding_store import save_embeddings, missing_embeddings
+from healpers.detection_checkpoint import DetectionCheckpoint, is_done
 
-GPU = "yes"
-def extract_faces(input_folder, output_folder, gpu=GPU):
-    print("\n\t\t\tYo YO Yo Yo Yo\n")
-    if (gpu == "no"):
-        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
-        print("Using CPU")
-    else:
-        # Enable GPU memory growth to avoid memory allocation errors
-        gpus = tf.config.experimental.list_physical_devices('GPU')
-        if gpus:
-            try:
-                for gpu in gpus:
-                    tf.config.experimental.set_memory_growth(gpu, True)
-                    print("Using GPU")
-            except RuntimeError as e:
-                print(e)
-    # Output folders for faces detected and no face
-    faces_detected_folder = os.path.join(output_folder, 'Face')
-    no_face_folder = os.path.join(output_folder, 'No-Face')
-    cropped_faces_align_folder = os.path.join(output_folder, 'Cropped_Faces_Align')
-    cropped_faces_folder = os.path.join(output_folder, 'Cropped_Faces')
+# 'tf' (the retinaface package), 'onnx', 'pytorch' or 'yunet'; see face_detectors.py
+DETECTOR_BACKEND = os.environ.get("FDRP_DETECTOR_BACKEND", "tf")
 
-    os.makedirs(faces_detected_folder, exist_ok=True)
-    os.makedirs(no_face_folder, exist_ok=True)
-    os.makedirs(cropped_faces_folder, exist_ok=True)
-    os.makedirs(cropped_faces_align_folder, exist_ok=True)
+# Images run through the detector together. 1 keeps the original one-image-at-a-time path.
+BATCH_SIZE = int(os.environ.get("FDRP_RETINAFACE_BATCH_SIZE", 1))
+# Fixed input shape for batches (landscape; portrait images use it transposed).
+# 1824x1024 is what RetinaFace scales a 16:9 photo to on its own.
+CANVAS = parse_canvas(os.environ.get("FDRP_RETINAFACE_CANVAS", "1824x1024"))
+# Overlap disk and decode work with inference: decode threads read ahead, writer threads save behind.
+DECODE_THREADS = int(os.environ.get("FDRP_RETINAFACE_DECODE_THREADS", 2))
+WRITE_THREADS = int(os.environ.get("FDRP_RETINAFACE_WRITE_THREADS", 2))
+PREFETCH_DEPTH = int(os.environ.get("FDRP_RETINAFACE_PREFETCH", 8))        # Decoded images waiting for the detector
+MAX_PENDING_WRITES = int(os.environ.get("FDRP_RETINAFACE_PENDING_WRITES", 8))  # Detected images waiting to be saved
+# Annotated Face/ and No-Face/ copies are for debugging only; later stages read just the aligned
+# crops and the faces.jsonl/images.jsonl manifest. Can be switched on per event (see /events/{event_id}/debug-artifacts).
+DEBUG_ARTIFACTS = os.environ.get("FDRP_DEBUG_ARTIFACTS", "0") == "1"
+# Proxy detection: detect on a copy whose long side is at most this many pixels, then map the
+# boxes and landmarks back and crop from the full-resolution image. 0 disables it.
+# benchmarks/retinaface_proxy_benchmark.py compares recall and latency per size.
+PROXY_SIZE = int(os.environ.get("FDRP_RETINAFACE_PROXY_SIZE", 0))
+# Fused pipeline: aligned crops go from detection straight to the embedding model in memory (no JPEG
+# round trip, no separate FaceNet stage). Crops are still written to Cropped_Faces_Align for display.
+# Crops the stream could not embed are picked up by the FaceNet stage as usual.
+FUSED_PIPELINE = os.environ.get("FDRP_FUSED_PIPELINE", "0") == "1"
+EMBEDDING_MODEL = 'Facenet512'
+# Part of the detection cache key; bump it when align_face or the crop format changes.
+CROP_VERSION = 2
 
-    Total_Faces = 0
-    Total_NoFaces = 0
-    Face_Array = []
-    No_Face_Array = []
+detector = create_detector(DETECTOR_BACKEND)
 
-    def display_statistics(total_faces, total_no_faces):
-        stats_output = (
-            "+----------------------------+\n"
-            "|     Face Detection Stats    |\n"
-            "+----------------------------+\n"
-            "| Images with Faces   | {:5}  |\n".format(total_faces) +
-            "| Images without Face | {:5}  |\n".format(total_no_faces) +
-            "+----------------------------+\n"
-            "| Total Images        | {:5}  |\n".format(total_faces + total_no_faces) +
-            "+----------------------------+\n"
-        )
-        print(stats_output)
-        # with open("Small_Results.txt", "w") as file:
-        #     file.write(stats_output)
 
-    print("Setting Up GPU. Please Wait...")
+def align_face(img, facial_area, landmarks):
+    """
+    Returns the face in `facial_area` rotated so that the eyes are level,
+    using the landmarks from the same detection pass (no second inference).
 
-    def save_cropped_faces_old(image_name, faces, img_resized):
-        face_id = 0
-        for key, face_info in faces.items():
-            facial_area = face_info['facial_area']
-            x1, y1, x2, y2 = facial_area
-            cropped_face = img_resized[y1:y2, x1:x2]
-            cropped_face_name = f"{image_name}_face_{face_id}.jpg"
-            cv2.imwrite(os.path.join(cropped_faces_folder, cropped_face_name), cropped_face)
-            face_id += 1
+    The rotation is done around the eye midpoint on a padded region of the
+    full image, so the corners of the crop are filled with real pixels
+    instead of black borders.
+    """
+    x1, y1, x2, y2 = [int(v) for v in facial_area]
+    eye_a, eye_b = sorted([landmarks['left_eye'], landmarks['right_eye']], key=lambda p: p[0])
+    angle = math.degrees(math.atan2(eye_b[1] - eye_a[1], eye_b[0] - eye_a[0]))
 
-    def save_cropped_faces(image_name, img_resized):
-        try:
-            with tf.device('/GPU:0'):
-                faces = RetinaFace.extract_faces(img_path=img_resized, align=True)
-                num_faces_detected = len(faces)
-                print(f"Number of faces detected in the image '{image_name}': {num_faces_detected}")
-                if num_faces_detected == 0:
-                    print(f"No faces detected in the image: {image_name}")
-                    return
-                face_id = 0
-                for face in faces:
-                    if face is None or face.size == 0:
-                        print(f"Warning: Face {face_id} is empty and will be skipped.")
-                        continue
-                    print(f"Extracted face {face_id} with shape: {face.shape}")
-                    cropped_face_name = f"{image_name}_face_{face_id}.jpg"
-                    if not os.path.exists(cropped_faces_align_folder):
-                        os.makedirs(cropped_faces_align_folder)
-                    success = cv2.imwrite(os.path.join(cropped_faces_align_folder, cropped_face_name), face[:,:,::-1])
-                    if not success:
-                        print(f"Failed to save face {face_id} for image {image_name}")
-                    else:
-                        print(f"Successfully saved face {face_id} as {cropped_face_name}")
-                    face_id += 1
-        except tf.errors.ResourceExhaustedError:
-            print("Falling back to CPU for face extraction due to GPU OOM.")
-            with tf.device('/CPU:0'):
-                faces = RetinaFace.extract_faces(img_path=img_resized, align=True)
-                num_faces_detected = len(faces)
-                print(f"(CPU) Number of faces detected in the image '{image_name}': {num_faces_detected}")
-                if num_faces_detected == 0:
-                    print(f"(CPU) No faces detected in the image: {image_name}")
-                    return
-                face_id = 0
-                for face in faces:
-                    if face is None or face.size == 0:
-                        print(f"(CPU) Warning: Face {face_id} is empty and will be skipped.")
-                        continue
-                    print(f"(CPU) Extracted face {face_id} with shape: {face.shape}")
-                    cropped_face_name = f"{image_name}_face_{face_id}.jpg"
-                    if not os.path.exists(cropped_faces_align_folder):
-                        os.makedirs(cropped_faces_align_folder)
-                    success = cv2.imwrite(os.path.join(cropped_faces_align_folder, cropped_face_name), face[:,:,::-1])
-                    if not success:
-                        print(f"(CPU) Failed to save face {face_id} for image {image_name}")
-                    else:
-                        print(f"(CPU) Successfully saved face {face_id} as {cropped_face_name}")
-                    face_id += 1
+    # Region large enough to hold the box at any rotation
+    pad = int(math.ceil(math.hypot(x2 - x1, y2 - y1) / 2))
+    height, width = img.shape[:2]
+    rx1, ry1 = max(x1 - pad, 0), max(y1 - pad, 0)
+    rx2, ry2 = min(x2 + pad, width), min(y2 + pad, height)
+    region = img[ry1:ry2, rx1:rx2]
 
-    def resize_image_if_needed(img, max_width=1920, max_height=1080):
-        height, width = img.shape[:2]
-        if height > max_height or width > max_width:
-            scaling_factor = min(max_width / width, max_height / height)
-            new_size = (int(width * scaling_factor), int(height * scaling_factor))
-            img_resized = cv2.resize(img, new_size)
-            return img_resized
-        else:
-            return img
+    eye_center = ((eye_a[0] + eye_b[0]) / 2 - rx1, (eye_a[1] + eye_b[1]) / 2 - ry1)
+    rotation = cv2.getRotationMatrix2D(eye_center, angle, 1.0)
+    rotated = cv2.warpAffine(region, rotation, (region.shape[1], region.shape[0]),
+                             flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return rotated[y1 - ry1:y2 - ry1, x1 - rx1:x2 - rx1]
 
-    def detect_faces_retinaface(image_path):
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"Warning: Unable to load image at {image_path}. Skipping...")
-            return None, None, []
-        img_resized = resize_image_if_needed(img)
-        try:
-            with tf.device('/GPU:0'):
-                faces = RetinaFace.detect_faces(img_resized)
-        except tf.errors.ResourceExhaustedError:
-            print("Falling back to CPU for face detection due to GPU OOM.")
-            with tf.device('/CPU:0'):
-                faces = RetinaFace.detect_faces(img_resized)
-        if faces == {}:
-            return img_resized, img_resized, []
-        img_resized_for_cropping = img_resized.copy()
-        for key, face_info in faces.items():
-            facial_area = face_info['facial_area']
-            x1, y1, x2, y2 = facial_area
-            cv2.rectangle(img_resized, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        return img_resized, img_resized_for_cropping, faces
 
-    # --- Process all images in the input folder ---
-    if not os.listdir(input_folder):
-        print("Error: Input folder is empty!")
-        return
+def detect_faces_batch(images, canvas=CANVAS):
+    """
+    Detects faces in several BGR images with one forward pass per canvas shape.
+    Each image is letterboxed into the fixed canvas for its orientation, so
+    all images in a pass have the same shape.
 
-    for image_name in os.listdir(input_folder):
-        image_path = os.path.join(input_folder, image_name)
-        annotated_img, img_resized_for_cropping, faces = detect_faces_retinaface(image_path)
-        if annotated_img is None:
-            continue
-        if len(faces) == 0:
-            print(image_name, "No Face")
-            cv2.imwrite(os.path.join(no_face_folder, image_name), annotated_img)
-            No_Face_Array.append(image_name)
-            Total_NoFaces += 1
-        else:
-            print(image_name, "Face Found")
-            cv2.imwrite(os.path.join(faces_detected_folder, image_name), annotated_img)
-            save_cropped_faces_old(image_name, faces, img_resized_for_cropping)
-            save_cropped_faces(image_name, img_resized_for_cropping)
-            Face_Array.append(image_name)
-            Total_Faces += 1
-        # --- ✅ Remove the original image after processing ---
-        try:
-            os.remove(image_path)
-            print(f"Removed original: {image_name}")
-        except Exception as e:
-            print(f"Failed to delete {image_name}: {e}")
+    Returns:
+        list[dict]: One RetinaFace.detect_faces()-style dict per image, in input order.
+    """
+    return detector.detect_faces_batch(images, canvas)
 
-    print("Images Have Been Successfully Filtered Out.")
-    display_statistics(Total_Faces, Total_NoFaces)
 
-    # with open("small_faces_detected_list.txt", "w") as f:
-    #     f.write("\n".join(Face_Array))
-    # with open("small_no_faces_detected_list.txt", "w") as f:
-    #     f.write("\n".join(No_Face_Array))
-    return
-# retinaface_worker.py
+def make_proxy(img, proxy_size):
+    """Returns (downscaled copy with its long side at most `proxy_size`, scale factor used)."""
+    height, width = img.shape[:2]
+    scale = min(1.0, proxy_size / max(height, width))
+    if scale == 1.0:
+        return img, 1.0
+    new_size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA), scale
+
+
+def perceptual_hash(img):
+    """64-bit difference hash (dHash) of an image as 16 hex digits; burst shots and re-uploads land a few bits apart."""
+    gray = cv2.cvtColor(cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def map_detections(faces, factor):
+    """Scales the boxes and landmarks of a detect_faces() dict by `factor`, e.g. from proxy to full resolution."""
+    mapped = {}
+    for key, face_info in faces.items():
+        mapped[key] = dict(face_info)
+        mapped[key]['facial_area'] = [int(round(v * factor)) for v in face_info['facial_area']]
+        mapped[key]['landmarks'] = {
+            name: [float(c) * factor for c in point] for name, point in face_info['landmarks'].items()
+        }
+    return mapped
+
+
+def detect_faces_images(images, batch_size=BATCH_SIZE, proxy_size=0):
+    """
+    The detection pass for a list of BGR images, one result dict per image.
+    With `proxy_size`, detection runs on downscaled copies and the results are
+    mapped back to the coordinates of `images`.
+    """
+    if not proxy_size:
+        if batch_size > 1:
+            return detect_faces_batch(images)
+        return [detector.detect_faces(img) for img in images]
+
+    proxies = [make_proxy(img, proxy_size) for img in images]
+    small = [proxy for proxy, _ in proxies]
+    if batch_size > 1:
+        canvas = parse_canvas(f"{proxy_size}x{proxy_size * CANVAS[1] // CANVAS[0]}")
+        found = detect_faces_batch(small, canvas=canvas)
+    else:
+        # Without allow_upscaling=False RetinaFace would blow the proxy back up to 1024px
+        found = [detector.detect_faces(proxy, allow_upscaling=False) for proxy in small]
+    return [
+        map_detections(faces, 1.0 / scale) if isinstance(faces, dict) and faces else faces
+        for faces, (_, scale) in zip(found, proxies)
+    ]
 
-print("Setting Up The Environment. Please Wait...")
-print("importing os, cv2, RetinaFace, tensorflow...")
-import os
-import cv2
-from retinaface import RetinaFace
-import tensorflow as tf
 
-# Enable GPU memory growth to avoid memory allocation errors
-gpus = tf.config.experimental.list_physical_devices('GPU')
-if gpus:
+def detection_version(batch_size=BATCH_SIZE, proxy_size=PROXY_SIZE):
+    """Cache key for what extract_faces produces per image with the current detector and settings."""
+    version = f"{detector.version}-crop{CROP_VERSION}"
+    if batch_size > 1:
+        version += f"-canvas{CANVAS[0]}x{CANVAS[1]}"  # Letterboxed batches can shift boxes by a pixel
+    if proxy_size:
+        version += f"-proxy{proxy_size}"
+    return version
+
+
+def start_crop_stream():
+    """The in-memory crop stream to the embedding model, or None if the model cannot be loaded."""
+    try:
+        return CropStream(get_engine(EMBEDDING_MODEL))
+    except Exception as e:
+        print(f"⚠️ Fused pipeline off for this event, crops are left for the embedding stage: {e}")
+        return None
+
+
+def embed_missing_crops(output_folder, crop_folder):
+    """
+    Embeds, from disk, the manifest's crops the stream did not see: cache hits
+    (never decoded) and crops saved by an interrupted earlier run. Uses the same
+    embedding cache entries as facenet_worker.
+
+    Returns:
+        int: Number of crops embedded or taken from the cache.
+    """
+    cache = get_result_cache()
+    cache_version = f"{EMBEDDING_MODEL.lower()}-skip"
+    found = {}
+    pending = {}  # {crop path: (crop name, crop hash)}
+    for crop in missing_embeddings(output_folder, EMBEDDING_MODEL):
+        crop_path = os.path.join(crop_folder, crop)
+        if not os.path.isfile(crop_path):
+            continue
+        crop_hash = file_sha256(crop_path) if cache is not None else None
+        embedding = cache.get_embedding(crop_hash, cache_version) if cache is not None else None
+        if embedding is not None:
+            found[crop] = embedding
+        else:
+            pending[crop_path] = (crop, crop_hash)
+    embedded = get_engine(EMBEDDING_MODEL).embed_files(list(pending)) if pending else {}
+    for crop_path, (crop, crop_hash) in pending.items():
+        if crop_path in embedded:
+            found[crop] = embedded[crop_path]
+            if crop_hash is not None:
+                cache.put_embedding(crop_hash, cache_version, embedded[crop_path])
+    if found:
+        save_embeddings(output_folder, found, EMBEDDING_MODEL)
+    return len(found)
+
+
+def finish_crop_stream(stream, output_folder, crop_folder):
+    """
+    Saves what the stream embedded and fills in the manifest's remaining crops.
+    Failures only leave embeddings missing; the manager then hands the event
+    to the FaceNet stage instead of skipping it.
+    """
     try:
-        for gpu in gpus:
-            tf.config.experimental.set_memory_growth(gpu, True)
-    except RuntimeError as e:
-        print(e)
+        streamed = stream.close()
+        if streamed:
+            save_embeddings(output_folder, streamed, EMBEDDING_MODEL)
+        from_disk = embed_missing_crops(output_folder, crop_folder) if stream.error is None else 0
+        print(f"Fused embeddings: {len(streamed)} crop(s) streamed, {from_disk} from disk or cache.")
+    except Exception as e:
+        print(f"⚠️ Fused embedding failed, the embedding stage will finish the event: {e}")
+
 
-def extract_faces(input_folder, output_folder):
+def extract_faces(input_folder, output_folder, image_names=None, free_memory=True, batch_size=BATCH_SIZE,
+                  debug_artifacts=DEBUG_ARTIFACTS, proxy_size=PROXY_SIZE, fused=FUSED_PIPELINE):
     print("\n\t\t\tYo YO Yo Yo Yo\n")
     # Output folders for faces detected and no face
     faces_detected_folder = os.path.join(output_folder, 'Face')
     no_face_folder = os.path.join(output_folder, 'No-Face')
     cropped_faces_align_folder = os.path.join(output_folder, 'Cropped_Faces_Align')
-    cropped_faces_folder = os.path.join(output_folder, 'Cropped_Faces')
 
-    os.makedirs(faces_detected_folder, exist_ok=True)
-    os.makedirs(no_face_folder, exist_ok=True)
-    os.makedirs(cropped_faces_folder, exist_ok=True)
+    if debug_artifacts:
+        os.makedirs(faces_detected_folder, exist_ok=True)
+        os.makedirs(no_face_folder, exist_ok=True)
     os.makedirs(cropped_faces_align_folder, exist_ok=True)
 
+    # Images finished by an earlier, interrupted run of this event are not processed again
+    checkpoint = DetectionCheckpoint(output_folder)
+    finished = checkpoint.load()
+    # With the manifest's hashes, a re-upload under a finished image's name is not mistaken for it
+    expected_hashes = image_names if isinstance(image_names, dict) else {}
+
+    def done(image_name):
+        return is_done(finished, image_name, expected_hashes.get(image_name))
+
     Total_Faces = 0
     Total_NoFaces = 0
-    Face_Array = []
-    No_Face_Array = []
+
+    # Images seen before (in any event) reuse their cached detections and crops
+    cache = get_result_cache()
+    version = detection_version(batch_size, proxy_size)
 
     def display_statistics(total_faces, total_no_faces):
         stats_output = (
@@ -237,64 +256,36 @@ def extract_faces(input_folder, output_folder):
 
     print("Setting Up GPU. Please Wait...")
 
-    def save_cropped_faces_old(image_name, faces, img_resized):
+    def save_cropped_faces(image_name, faces, img_resized):
+        """
+        Writes one aligned crop per detected face, from the boxes and landmarks already found.
+        Returns the detection record of every face saved.
+        """
+        saved = []
         face_id = 0
         for key, face_info in faces.items():
-            facial_area = face_info['facial_area']
-            x1, y1, x2, y2 = facial_area
-            cropped_face = img_resized[y1:y2, x1:x2]
+            face = align_face(img_resized, face_info['facial_area'], face_info['landmarks'])
+            if face is None or face.size == 0:
+                print(f"Warning: Face {face_id} is empty and will be skipped.")
+                continue
             cropped_face_name = f"{image_name}_face_{face_id}.jpg"
-            cv2.imwrite(os.path.join(cropped_faces_folder, cropped_face_name), cropped_face)
+            success = cv2.imwrite(os.path.join(cropped_faces_align_folder, cropped_face_name), face)
+            if not success:
+                print(f"Failed to save face {face_id} for image {image_name}")
+            else:
+                print(f"Successfully saved face {face_id} as {cropped_face_name}")
+                if stream is not None:
+                    stream.put(cropped_face_name, face)  # Blocks while the embedding model is behind
+                saved.append({
+                    "face_id": face_id,
+                    "file_name": cropped_face_name,
+                    "facial_area": [int(v) for v in face_info['facial_area']],
+                    "landmarks": {k: [float(c) for c in v] for k, v in face_info['landmarks'].items()},
+                    "score": float(face_info['score']),
+                    "crop_size": [int(face.shape[1]), int(face.shape[0])],
+                })
             face_id += 1
-
-    def save_cropped_faces(image_name, img_resized):
-        try:
-            with tf.device('/GPU:0'):
-                faces = RetinaFace.extract_faces(img_path=img_resized, align=True)
-                num_faces_detected = len(faces)
-                print(f"Number of faces detected in the image '{image_name}': {num_faces_detected}")
-                if num_faces_detected == 0:
-                    print(f"No faces detected in the image: {image_name}")
-                    return
-                face_id = 0
-                for face in faces:
-                    if face is None or face.size == 0:
-                        print(f"Warning: Face {face_id} is empty and will be skipped.")
-                        continue
-                    print(f"Extracted face {face_id} with shape: {face.shape}")
-                    cropped_face_name = f"{image_name}_face_{face_id}.jpg"
-                    if not os.path.exists(cropped_faces_align_folder):
-                        os.makedirs(cropped_faces_align_folder)
-                    success = cv2.imwrite(os.path.join(cropped_faces_align_folder, cropped_face_name), face[:,:,::-1])
-                    if not success:
-                        print(f"Failed to save face {face_id} for image {image_name}")
-                    else:
-                        print(f"Successfully saved face {face_id} as {cropped_face_name}")
-                    face_id += 1
-        except tf.errors.ResourceExhaustedError:
-            print("Falling back to CPU for face extraction due to GPU OOM.")
-            with tf.device('/CPU:0'):
-                faces = RetinaFace.extract_faces(img_path=img_resized, align=True)
-                num_faces_detected = len(faces)
-                print(f"(CPU) Number of faces detected in the image '{image_name}': {num_faces_detected}")
-                if num_faces_detected == 0:
-                    print(f"(CPU) No faces detected in the image: {image_name}")
-                    return
-                face_id = 0
-                for face in faces:
-                    if face is None or face.size == 0:
-                        print(f"(CPU) Warning: Face {face_id} is empty and will be skipped.")
-                        continue
-                    print(f"(CPU) Extracted face {face_id} with shape: {face.shape}")
-                    cropped_face_name = f"{image_name}_face_{face_id}.jpg"
-                    if not os.path.exists(cropped_faces_align_folder):
-                        os.makedirs(cropped_faces_align_folder)
-                    success = cv2.imwrite(os.path.join(cropped_faces_align_folder, cropped_face_name), face[:,:,::-1])
-                    if not success:
-                        print(f"(CPU) Failed to save face {face_id} for image {image_name}")
-                    else:
-                        print(f"(CPU) Successfully saved face {face_id} as {cropped_face_name}")
-                    face_id += 1
+        return saved
 
     def resize_image_if_needed(img, max_width=1920, max_height=1080):
         height, width = img.shape[:2]
@@ -306,67 +297,203 @@ def extract_faces(input_folder, output_folder):
         else:
             return img
 
-    def detect_faces_retinaface(image_path):
+    def load_image(image_path):
+        """
+        Returns (image, content hash, cached record). Cache hits are not decoded
+        (image is None); unreadable images come back as (None, None, None).
+        Images that exist but cannot be decoded are checkpointed as done, so they
+        do not hold the event back; missing ones are left for a retry.
+        """
+        image_hash = None
+        if cache is not None:
+            try:
+                image_hash = file_sha256(image_path)
+            except OSError as e:
+                print(f"Warning: Unable to read {image_path}: {e}. Skipping...")
+                return None, None, None
+            cached = cache.get_detections(image_hash, version)
+            if cached is not None:
+                return None, image_hash, cached
         img = cv2.imread(image_path)
         if img is None:
             print(f"Warning: Unable to load image at {image_path}. Skipping...")
-            return None, None, []
-        img_resized = resize_image_if_needed(img)
-        try:
-            with tf.device('/GPU:0'):
-                faces = RetinaFace.detect_faces(img_resized)
-        except tf.errors.ResourceExhaustedError:
-            print("Falling back to CPU for face detection due to GPU OOM.")
-            with tf.device('/CPU:0'):
-                faces = RetinaFace.detect_faces(img_resized)
-        if faces == {}:
-            return img_resized, img_resized, []
-        img_resized_for_cropping = img_resized.copy()
-        for key, face_info in faces.items():
-            facial_area = face_info['facial_area']
-            x1, y1, x2, y2 = facial_area
-            cv2.rectangle(img_resized, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        return img_resized, img_resized_for_cropping, faces
+            if os.path.exists(image_path):
+                image_name = os.path.basename(image_path)
+                checkpoint.record({"image": image_name, "sha256": expected_hashes.get(image_name),
+                                   "error": "unreadable"})
+            return None, None, None
+        if proxy_size:
+            return img, image_hash, None  # Crops come from the full-resolution image; only detection is downscaled
+        return resize_image_if_needed(img), image_hash, None
 
-    # --- Process all images in the input folder ---
-    if not os.listdir(input_folder):
-        print("Error: Input folder is empty!")
-        return
+    def prefetch_images(names):
+        """
+        Yields (image_name, load_image() result) in order while the decode
+        pool reads and resizes up to PREFETCH_DEPTH images ahead.
+        """
+        with ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="decode") as pool:
+            pending = deque()
+            names = iter(names)
+            for name in names:
+                pending.append((name, pool.submit(load_image, os.path.join(input_folder, name))))
+                if len(pending) >= PREFETCH_DEPTH:
+                    break
+            while pending:
+                name, future = pending.popleft()
+                next_name = next(names, None)
+                if next_name is not None:
+                    pending.append((next_name, pool.submit(load_image, os.path.join(input_folder, next_name))))
+                yield name, future.result()
 
-    for image_name in os.listdir(input_folder):
-        image_path = os.path.join(input_folder, image_name)
-        annotated_img, img_resized_for_cropping, faces = detect_faces_retinaface(image_path)
-        if annotated_img is None:
-            continue
-        if len(faces) == 0:
-            print(image_name, "No Face")
-            cv2.imwrite(os.path.join(no_face_folder, image_name), annotated_img)
-            No_Face_Array.append(image_name)
-            Total_NoFaces += 1
-        else:
-            print(image_name, "Face Found")
-            cv2.imwrite(os.path.join(faces_detected_folder, image_name), annotated_img)
-            save_cropped_faces_old(image_name, faces, img_resized_for_cropping)
-            save_cropped_faces(image_name, img_resized_for_cropping)
-            Face_Array.append(image_name)
-            Total_Faces += 1
+    def prefetch_chunks(names, on_cached):
+        """
+        Groups the prefetched, loadable images into chunks of (image_name, image, hash)
+        of `batch_size`. Cache hits go to on_cached(image_name, record) instead.
+        """
+        chunk = []
+        for image_name, (img, image_hash, cached) in prefetch_images(names):
+            if cached is not None:
+                on_cached(image_name, cached)
+                continue
+            if img is None:
+                continue
+            chunk.append((image_name, img, image_hash))
+            if len(chunk) >= max(batch_size, 1):
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run_detector(images):
+        # The only inference pass for these images: boxes and landmarks together
+        return detect_faces_images(images, batch_size=batch_size, proxy_size=proxy_size)
+
+    def detect_faces_retinaface(chunk):
+        """Detects faces in a chunk of (image_name, image, hash). Returns one faces dict (or []) per image."""
+        images = [img for _, img, _ in chunk]
+        detections = detector.on_device(lambda: run_detector(images))
+        return [faces if isinstance(faces, dict) and faces != {} else [] for faces in detections]
+
+    def remove_original(image_name):
         # --- ✅ Remove the original image after processing ---
         try:
-            os.remove(image_path)
+            os.remove(os.path.join(input_folder, image_name))
             print(f"Removed original: {image_name}")
         except Exception as e:
             print(f"Failed to delete {image_name}: {e}")
 
+    def write_outputs(image_name, img_resized, faces, image_hash):
+        """
+        Runs on the writer pool: aligned crops, the annotated copy when debug
+        artifacts are on, the cache entry, then removal of the original.
+        Returns the image's detection record.
+        """
+        saved = []
+        phash = perceptual_hash(img_resized)  # Before any boxes are drawn
+        if len(faces) == 0:
+            if debug_artifacts:
+                cv2.imwrite(os.path.join(no_face_folder, image_name), img_resized)
+        else:
+            saved = save_cropped_faces(image_name, faces, img_resized)  # Crop before the boxes are drawn
+            if debug_artifacts:
+                for key, face_info in faces.items():
+                    x1, y1, x2, y2 = face_info['facial_area']
+                    cv2.rectangle(img_resized, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.imwrite(os.path.join(faces_detected_folder, image_name), img_resized)
+        height, width = img_resized.shape[:2]
+        if cache is not None:
+            cache.put_detections(image_hash, version,
+                                 {"width": width, "height": height, "phash": phash, "faces": saved},
+                                 cropped_faces_align_folder)
+        record = {"image": image_name, "sha256": expected_hashes.get(image_name),
+                  "width": width, "height": height, "phash": phash, "faces": saved}
+        checkpoint.record(record)  # Crops are on disk; only now may the original go
+        remove_original(image_name)
+        return record
+
+    def restore_outputs(image_name, cached):
+        """
+        Runs on the writer pool for cache hits: copies the cached crops under this
+        event's names. No debug artifacts, as the image is never decoded.
+        """
+        saved = []
+        for face in cached["faces"]:
+            cropped_face_name = f"{image_name}_face_{face['face_id']}.jpg"
+            shutil.copyfile(face.pop("crop_path"), os.path.join(cropped_faces_align_folder, cropped_face_name))
+            saved.append(dict(face, file_name=cropped_face_name))
+        record = {"image": image_name, "sha256": expected_hashes.get(image_name),
+                  "width": cached["width"], "height": cached["height"],
+                  "phash": cached.get("phash"), "faces": saved}  # No phash in entries cached before it existed
+        checkpoint.record(record)
+        remove_original(image_name)
+        return record
+
+    # --- Process all images listed in the manifest (or the whole input folder) ---
+    if image_names is None:
+        image_names = sorted(set(os.listdir(input_folder)) | set(finished))
+    if not image_names:
+        print("Error: Input folder is empty!")
+        return
+
+    if finished:
+        for image_name in image_names:
+            if done(image_name) and finished[image_name].get("error") is None \
+                    and os.path.exists(os.path.join(input_folder, image_name)):
+                remove_original(image_name)  # Checkpointed just before an earlier run stopped
+        print(f"Resuming: {sum(map(done, image_names))} of {len(image_names)} image(s) already done.")
+    remaining = [name for name in image_names if not done(name)]
+
+    # Embeddings of fresh crops are computed from the array, before any JPEG encoding
+    stream = start_crop_stream() if fused else None
+    write_slots = threading.BoundedSemaphore(MAX_PENDING_WRITES)  # Caps images held for the writers
+    write_futures = []
+    with ThreadPoolExecutor(max_workers=WRITE_THREADS, thread_name_prefix="write") as writers:
+        def count_image(image_name, face_count):
+            nonlocal Total_Faces, Total_NoFaces
+            if face_count == 0:
+                print(image_name, "No Face")
+                Total_NoFaces += 1
+            else:
+                print(image_name, "Face Found")
+                print(f"Number of faces detected in the image '{image_name}': {face_count}")
+                Total_Faces += 1
+
+        def submit_write(fn, *args):
+            write_slots.acquire()  # Blocks the detector if the writers fall behind
+            future = writers.submit(fn, *args)
+            future.add_done_callback(lambda _: write_slots.release())
+            write_futures.append(future)
+
+        def on_cached(image_name, cached):
+            print(f"{image_name}: cached detections reused")
+            count_image(image_name, len(cached["faces"]))
+            submit_write(restore_outputs, image_name, cached)
+
+        for chunk in prefetch_chunks(remaining, on_cached):
+            for (image_name, img_resized, image_hash), faces in zip(chunk, detect_faces_retinaface(chunk)):
+                count_image(image_name, len(faces))
+                submit_write(write_outputs, image_name, img_resized, faces, image_hash)
+
+    # All writes are finished once the pool has shut down; surface any that failed
+    for future in write_futures:
+        if future.exception() is not None:
+            print(f"Failed to write outputs: {future.exception()}")
+
+    # faces.jsonl / images.jsonl: what the embedding, clustering and album stages join on
+    finished.update(checkpoint.load())
+    records = [record for record in finished.values() if "error" not in record]  # Earlier uploads to the event too
+    face_count = write_face_manifest(output_folder, records)
+    print(f"Face manifest written: {face_count} face(s) in {len(records)} image(s).")
+    if stream is not None:
+        finish_crop_stream(stream, output_folder, cropped_faces_align_folder)
+    unaccounted = len([name for name in image_names if not done(name)])
+    if unaccounted:
+        print(f"⚠️ {unaccounted} image(s) not processed; the event will be retried from this checkpoint.")
+
     print("Images Have Been Successfully Filtered Out.")
     display_statistics(Total_Faces, Total_NoFaces)
-    print("Freeing Up GPU memory!")
-    tf.keras.backend.clear_session()
-    gc.collect()
-    output_path = os.path.join(output_folder, "faces.txt")
-    with open(output_path, "w") as f:
-        f.write("\n".join(Face_Array))
-    output_path = os.path.join(output_folder, "no_faces.txt")
-    with open(output_path, "w") as f:
-        f.write("\n".join(No_Face_Array))
+    if free_memory:  # A warm worker keeps the model loaded for the next event
+        detector.free_memory()
+        gc.collect()
 
     return
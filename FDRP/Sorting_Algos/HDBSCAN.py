@@ -5,40 +5,19 @@ from collections import defaultdict
 import os
 import shutil
 from sklearn.metrics.pairwise import cosine_distances, cosine_similarity
+from healpers.embedding_store import EmbeddingStore
+from Sorting_Algos.face_dedup import DEDUP_ENABLED, collapse_duplicates
 
-def cluster_faces_hdbscan(base_directory, min_cluster_size=3, min_samples=None, similarity_threshold=0.6):
-    embeddings_file_path = os.path.join(base_directory, 'facenet512_embeddings.pkl')
-    output_album_dir = os.path.join(base_directory, 'albums_dbscan')
-    custom_source_path = os.path.join(base_directory, 'Cropped_Faces_Align')
-
-    try:
-        with open(embeddings_file_path, 'rb') as f:
-            embeddings_dict = pickle.load(f)
-        print(f"Successfully loaded {len(embeddings_dict)} face embeddings from '{embeddings_file_path}'.")
-    except FileNotFoundError:
-        print(f"Error: File not found at {embeddings_file_path}")
-        return
-    except pickle.UnpicklingError:
-        print("Error: The file does not contain a valid pickled dictionary.")
-        return
-    except Exception as e:
-        print(f"An unexpected error occurred while loading embeddings: {e}")
-        return
-
-    if not embeddings_dict:
-        print("No face embeddings loaded. Exiting clustering.")
-        return
-
-    face_names = list(embeddings_dict.keys())
-    embedding_vectors = np.array(list(embeddings_dict.values()))
-    num_faces = len(face_names)
-
-    if num_faces == 0:
-        print("No face embeddings found. Exiting clustering.")
-        return
+def hdbscan_labels(embedding_vectors, min_cluster_size=3, min_samples=None, similarity_threshold=0.6):
+    """
+    HDBSCAN on cosine distances, then clusters whose centroids are at least
+    `similarity_threshold` similar are merged.
 
-    # Step 1: Compute cosine distance matrix
-    distance_matrix = cosine_distances(embedding_vectors)
+    Returns:
+        list: The merged cluster label of each row of `embedding_vectors` (-1 for noise).
+    """
+    # Step 1: Compute cosine distance matrix (HDBSCAN's precomputed metric needs float64)
+    distance_matrix = cosine_distances(np.asarray(embedding_vectors, dtype=np.float64))
 
     # Step 2: Run HDBSCAN with loosened selection epsilon
     clusterer = hdbscan.HDBSCAN(
@@ -50,10 +29,8 @@ def cluster_faces_hdbscan(base_directory, min_cluster_size=3, min_samples=None,
     cluster_labels = clusterer.fit_predict(distance_matrix)
 
     # Step 3: Group faces by cluster label
-    clustered_faces = defaultdict(list)
     label_to_indices = defaultdict(list)
     for i, label in enumerate(cluster_labels):
-        clustered_faces[label].append(face_names[i])
         label_to_indices[label].append(i)
 
     # Step 4: Compute centroids for merging similar clusters
@@ -93,10 +70,50 @@ def cluster_faces_hdbscan(base_directory, min_cluster_size=3, min_samples=None,
         label_mapping[label] = root
 
     # Step 5: Remap clusters with merged labels
+    return [label_mapping.get(label, label) for label in cluster_labels]
+
+def cluster_faces_hdbscan(base_directory, min_cluster_size=3, min_samples=None, similarity_threshold=0.6,
+                          dedup=DEDUP_ENABLED):
+    store = EmbeddingStore(base_directory)
+    output_album_dir = os.path.join(base_directory, 'albums_dbscan')
+    custom_source_path = os.path.join(base_directory, 'Cropped_Faces_Align')
+
+    if not store.exists():
+        print(f"Error: File not found at {store.vectors_path}")
+        return
+    try:
+        # Row i belongs to face_names[i]; memory-mapped unless the store is int8 or pq
+        face_names, embedding_vectors = store.read()
+        print(f"Successfully loaded {len(face_names)} face embeddings from '{store.vectors_path}'.")
+    except Exception as e:
+        print(f"An unexpected error occurred while loading embeddings: {e}")
+        return
+
+    num_faces = len(face_names)
+
+    if num_faces == 0:
+        print("No face embeddings found. Exiting clustering.")
+        return
+
+    # Near-duplicates are clustered once, through their representative (see face_dedup.py)
+    members = {name: [name] for name in face_names}
+    if dedup:
+        representatives, members = collapse_duplicates(base_directory, face_names, embedding_vectors)
+        print(f"Near-duplicate suppression: clustering {len(representatives)} of {num_faces} faces.")
+        face_names = [face_names[i] for i in representatives]
+        embedding_vectors = embedding_vectors[representatives]
+
+    if len(face_names) > 1:
+        final_labels = hdbscan_labels(embedding_vectors, min_cluster_size, min_samples, similarity_threshold)
+    else:
+        final_labels = [-1]  # HDBSCAN needs at least two points
+    next_label = max(final_labels) + 1
     final_clustered_faces = defaultdict(list)
-    for i, label in enumerate(cluster_labels):
-        new_label = label_mapping.get(label, label)
-        final_clustered_faces[new_label].append(face_names[i])
+    for name, label in zip(face_names, final_labels):
+        if label == -1 and len(members[name]) >= min_cluster_size:
+            label = next_label  # A group big enough to be a cluster on its own, as it was before suppression
+            next_label += 1
+        final_clustered_faces[label].extend(members[name])  # Expanded back for the albums
 
     print("\nClustered Faces (merged by centroid similarity):")
     for cluster_id, names in final_clustered_faces.items():
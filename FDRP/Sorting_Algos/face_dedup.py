@@ -0,0 +1,125 @@
+import os
+import json
+import numpy as np
+from collections import defaultdict
+from healpers.face_manifest import read_faces, read_images
+
+# Near-duplicate faces (burst shots, the same photo uploaded twice) are collapsed
+# into one representative before clustering, and expanded back afterwards.
+# Opt-in (FDRP_DEDUP=1) until its effect on clustering quality and time has been measured on real events.
+DEDUP_ENABLED = os.environ.get("FDRP_DEDUP", "0") == "1"
+# Faces at least this cosine-similar are the same shot; different photos of one person stay well below
+DEDUP_SIMILARITY = float(os.environ.get("FDRP_DEDUP_SIMILARITY", 0.95))
+# Photos whose dHash differ in at most this many of 64 bits are the same scene; their faces are paired by position
+DEDUP_PHASH_DISTANCE = int(os.environ.get("FDRP_DEDUP_PHASH_DISTANCE", 5))
+DEDUP_BOX_IOU = 0.5  # Minimum overlap of two faces' boxes (relative to their photos) in matching photos
+DUPLICATES_FILE = "face_duplicates.json"
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class _Groups:
+    """Union-find over face indices."""
+
+    def __init__(self, count):
+        self.parent = list(range(count))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def similar_pairs(embedding_vectors, threshold=DEDUP_SIMILARITY, chunk=1024):
+    """
+    Index pairs (i < j) of rows whose cosine similarity is at least `threshold`,
+    computed a block of rows at a time so memory stays at chunk x N.
+    """
+    vectors = np.asarray(embedding_vectors, dtype=np.float32)
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    for start in range(0, len(unit), chunk):
+        similarity = unit[start:start + chunk] @ unit.T
+        rows, cols = np.nonzero(similarity >= threshold)
+        for i, j in zip(rows + start, cols):
+            if i < j:
+                yield int(i), int(j)
+
+
+def matching_photos(images, max_distance=DEDUP_PHASH_DISTANCE, chunk=256):
+    """Pairs of images.jsonl rows whose perceptual hashes are at most `max_distance` bits apart."""
+    hashed = [row for row in images if row.get("phash") and row["face_ids"]]
+    if len(hashed) < 2:
+        return
+    hashes = np.array([int(row["phash"], 16) for row in hashed], dtype=np.uint64)
+    for start in range(0, len(hashes), chunk):
+        xor = hashes[start:start + chunk, None] ^ hashes[None, :]
+        distance = _POPCOUNT[xor.view(np.uint8)].reshape(len(xor), len(hashes), 8).sum(axis=2)
+        rows, cols = np.nonzero(distance <= max_distance)
+        for i, j in zip(rows + start, cols):
+            if i < j:
+                yield hashed[i], hashed[j]
+
+
+def _relative_iou(box_a, size_a, box_b, size_b):
+    """IoU of two boxes, each scaled to its own photo's size, so resized copies still line up."""
+    a = [box_a[0] / size_a[0], box_a[1] / size_a[1], box_a[2] / size_a[0], box_a[3] / size_a[1]]
+    b = [box_b[0] / size_b[0], box_b[1] / size_b[1], box_b[2] / size_b[0], box_b[3] / size_b[1]]
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    overlap = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def collapse_duplicates(event_folder, face_names, embedding_vectors):
+    """
+    Groups near-duplicate faces: pairs at least DEDUP_SIMILARITY cosine-similar, and
+    faces at the same position in photos whose perceptual hashes (images.jsonl) match.
+    Each group keeps the face with the highest detection score as its representative.
+    The groups are also written to face_duplicates.json for inspection.
+
+    Returns:
+        tuple[list[int], dict]: Indices of the representatives in `face_names`, and
+        {representative name: [member names, representative first]}.
+    """
+    groups = _Groups(len(face_names))
+    for i, j in similar_pairs(embedding_vectors):
+        groups.union(i, j)
+
+    faces = read_faces(event_folder) or []
+    images = read_images(event_folder) or []
+    index_of = {name: i for i, name in enumerate(face_names)}
+    crop_of = {row["face_id"]: row for row in faces}
+    for photo_a, photo_b in matching_photos(images):
+        size_a, size_b = (photo_a["width"], photo_a["height"]), (photo_b["width"], photo_b["height"])
+        for face_a in (crop_of[face_id] for face_id in photo_a["face_ids"] if face_id in crop_of):
+            for face_b in (crop_of[face_id] for face_id in photo_b["face_ids"] if face_id in crop_of):
+                if face_a["crop"] in index_of and face_b["crop"] in index_of and \
+                        _relative_iou(face_a["bbox"], size_a, face_b["bbox"], size_b) >= DEDUP_BOX_IOU:
+                    groups.union(index_of[face_a["crop"]], index_of[face_b["crop"]])
+
+    score_of = {row["crop"]: row.get("score") or 0.0 for row in faces}
+    grouped = defaultdict(list)
+    for i in range(len(face_names)):
+        grouped[groups.find(i)].append(i)
+    representatives = []
+    members = {}
+    for indices in grouped.values():
+        best = max(indices, key=lambda i: score_of.get(face_names[i], 0.0))
+        representatives.append(best)
+        members[face_names[best]] = [face_names[best]] + [face_names[i] for i in indices if i != best]
+    representatives.sort()
+
+    duplicates = {name: names for name, names in members.items() if len(names) > 1}
+    try:
+        with open(os.path.join(event_folder, DUPLICATES_FILE), "w") as f:
+            json.dump(duplicates, f, indent=1)
+    except OSError as e:
+        print(f"⚠️ Could not write {DUPLICATES_FILE}: {e}")
+    return representatives, members
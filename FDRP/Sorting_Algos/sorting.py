@@ -1,9 +1,10 @@
-import pickle
-import numpy as np
 import os
+import sys
 import shutil
 from sklearn.metrics.pairwise import cosine_similarity
 from collections import defaultdict
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # To import healpers from the FDRP root
+from healpers.embedding_store import EmbeddingStore
 
 def cluster_faces_first_match(base_directory, threshold=0.575):
     """
@@ -11,8 +12,8 @@ def cluster_faces_first_match(base_directory, threshold=0.575):
     first existing cluster it exceeds the similarity threshold with.
 
     Args:
-        base_directory (str): Base directory containing
-                               'facenet512_embeddings.pkl' and 'Cropped_Faces_Align'.
+        base_directory (str): Base directory containing the
+                               facenet512 embedding store and 'Cropped_Faces_Align'.
         threshold (float, optional): Similarity threshold for clustering.
                                      Defaults to 0.575.
 
@@ -20,30 +21,20 @@ def cluster_faces_first_match(base_directory, threshold=0.575):
         dict: A dictionary where keys are cluster IDs (integers) and
               values are lists of face names. Returns an empty dict on error.
     """
-    file_path = os.path.join(base_directory, 'facenet512_embeddings.pkl')
+    store = EmbeddingStore(base_directory)
     output_album_dir = os.path.join(base_directory, 'albums')
     custom_source_path = os.path.join(base_directory, 'Cropped_Faces_Align')
 
-    try:
-        with open(file_path, 'rb') as f:
-            embeddings_dict = pickle.load(f)
-        print(f"Successfully loaded {len(embeddings_dict)} face embeddings.")
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return {}
-    except pickle.UnpicklingError:
-        print("Error: The file does not contain a valid pickled dictionary.")
+    if not store.exists():
+        print(f"Error: File not found at {store.vectors_path}")
         return {}
+    try:
+        face_names, embedding_vectors = store.read()
+        print(f"Successfully loaded {len(face_names)} face embeddings.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return {}
 
-    if not embeddings_dict:
-        print("No face embeddings loaded.")
-        return {}
-
-    face_names = list(embeddings_dict.keys())
-    embedding_vectors = np.array(list(embeddings_dict.values()))
     num_faces = len(face_names)
 
     if num_faces == 0:
@@ -84,16 +75,12 @@ def refine_clusters_by_highest_similarity(initial_clusters, base_directory, thre
         dict: A dictionary representing the refined clusters.  Empty dict on error.
     """
 
-    file_path = os.path.join(base_directory, 'facenet512_embeddings.pkl')
     try:
-        with open(file_path, 'rb') as f:
-            embeddings_dict = pickle.load(f)
+        face_names, embedding_vectors = EmbeddingStore(base_directory).read()
     except Exception as e:
         print(f"Error loading embeddings: {e}")
         return {}
 
-    face_names = list(embeddings_dict.keys())
-    embedding_vectors = np.array(list(embeddings_dict.values()))
     num_faces = len(face_names)
     if num_faces == 0:
         return {}
@@ -0,0 +1,36 @@
+# detection_metrics.py
+# Box matching and image capping shared by the detector benchmarks.
+import cv2
+
+
+def iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def count_matches(reference, found, threshold):
+    """Greedy one-to-one matching of reference boxes to found boxes by IoU."""
+    unused = list(found)
+    matched = 0
+    for ref_box in reference:
+        best = max(unused, key=lambda box: iou(ref_box, box), default=None)
+        if best is not None and iou(ref_box, best) >= threshold:
+            unused.remove(best)
+            matched += 1
+    return matched
+
+
+def boxes(faces):
+    return [face['facial_area'] for face in faces.values()] if isinstance(faces, dict) else []
+
+
+def cap_image(img, max_width=1920, max_height=1080):
+    """Same cap as resize_image_if_needed in extract_faces. Returns (image, scale)."""
+    height, width = img.shape[:2]
+    scale = min(1.0, max_width / width, max_height / height)
+    if scale == 1.0:
+        return img, 1.0
+    return cv2.resize(img, (int(width * scale), int(height * scale))), scale
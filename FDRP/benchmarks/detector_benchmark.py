@@ -0,0 +1,149 @@
+# detector_benchmark.py
+# Compares face detector backends (face_detectors.py) on a local image folder:
+# model load time, images/s, p50/p99 latency per image, peak RSS and recall.
+#
+# Each backend runs in its own process, so peak RSS is that backend's alone.
+# There are no labels: recall is measured against the --reference backend
+# (a reference face counts as found if a detection overlaps it with IoU >= --iou).
+#
+# Usage (from the FDRP folder):
+#   python benchmarks/detector_benchmark.py <image_folder> [--backends tf,onnx,pytorch,yunet]
+#       [--reference tf] [--limit 100] [--iou 0.5]
+# Backend options come from the usual environment variables (FDRP_YUNET_MODEL, FDRP_RETINAFACE_ONNX_MODEL, ...).
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+sys.path.append("FDRP-Workers")
+import cv2
+import numpy as np
+from detection_metrics import cap_image, count_matches, boxes
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB (0 where it cannot be read)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except ImportError:
+            return 0
+
+
+def load_images(folder, limit):
+    """(name, image) pairs, capped at 1920x1080 like extract_faces does."""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        img = cv2.imread(os.path.join(folder, name))
+        if img is not None:
+            images.append((name, cap_image(img)[0]))
+        if len(images) >= limit:
+            break
+    return images
+
+
+def run_backend(name, folder, limit, out_path):
+    """Child process: times one backend over the folder and writes the raw results to `out_path`."""
+    from face_detectors import create_detector
+    images = load_images(folder, limit)
+    started = time.perf_counter()
+    detector = create_detector(name).build_model()
+    load_seconds = time.perf_counter() - started
+    detector.detect_faces(images[0][1])  # Warm-up: graph tracing is not part of the measurement
+
+    latencies, found = [], {}
+    for image_name, img in images:
+        started = time.perf_counter()
+        faces = detector.on_device(lambda: detector.detect_faces(img))
+        latencies.append(time.perf_counter() - started)
+        found[image_name] = boxes(faces)
+    with open(out_path, "w") as f:
+        json.dump({"load_seconds": load_seconds, "latencies": latencies, "boxes": found,
+                   "peak_rss_mb": peak_rss_mb()}, f)
+
+
+def measure(name, folder, limit):
+    """Runs one backend in a fresh process. Returns its results, or None if it failed."""
+    fd, out_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        command = [sys.executable, os.path.abspath(__file__), folder, "--limit", str(limit),
+                   "--run-one", name, "--out", out_path]
+        if subprocess.run(command).returncode != 0:
+            print(f"❌ Backend '{name}' failed, skipping it.")
+            return None
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput, latency, memory and recall of face detector backends.")
+    parser.add_argument("image_folder")
+    parser.add_argument("--backends", default="tf,yunet", help="Comma-separated backend names.")
+    parser.add_argument("--reference", help="Backend recall is measured against (default: the first one).")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum number of images to load.")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed for a reference face to count as found.")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_backend(args.run_one, args.image_folder, args.limit, args.out)
+        return
+
+    if not load_images(args.image_folder, 1):
+        print(f"No readable images in {args.image_folder}")
+        sys.exit(1)
+    names = args.backends.split(",")
+    reference_name = args.reference or names[0]
+    if reference_name not in names:
+        names.insert(0, reference_name)
+    results = {}
+    for name in names:
+        print(f"Benchmarking {name}...")
+        result = measure(name, args.image_folder, args.limit)
+        if result:
+            results[name] = result
+    if not results:
+        sys.exit(1)
+
+    reference = results.get(reference_name)
+    total_ref = sum(len(b) for b in reference["boxes"].values()) if reference else 0
+    print(f"\n{len(next(iter(results.values()))['latencies'])} image(s); recall against '{reference_name}' "
+          f"({total_ref} face(s), IoU >= {args.iou})")
+    print("+------------+--------+----------+--------+--------+----------+-------+--------+")
+    print("| backend    | load s | images/s | p50 ms | p99 ms | peak MiB | faces | recall |")
+    print("+------------+--------+----------+--------+--------+----------+-------+--------+")
+    for name, result in results.items():
+        latencies = np.array(result["latencies"]) * 1000
+        faces = sum(len(b) for b in result["boxes"].values())
+        if reference is None:
+            recall = "   n/a"
+        else:
+            matched = sum(count_matches(ref, result["boxes"].get(image_name, []), args.iou)
+                          for image_name, ref in reference["boxes"].items())
+            recall = f"{matched / total_ref if total_ref else 1.0:6.1%}"
+        print(f"| {name:<10} | {result['load_seconds']:6.1f} | {len(latencies) / (latencies.sum() / 1000):8.2f} "
+              f"| {np.percentile(latencies, 50):6.1f} | {np.percentile(latencies, 99):6.1f} "
+              f"| {result['peak_rss_mb']:8.0f} | {faces:5} | {recall} |")
+    print("+------------+--------+----------+--------+--------+----------+-------+--------+")
+
+
+if __name__ == "__main__":
+    main()
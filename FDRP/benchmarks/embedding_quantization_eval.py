@@ -0,0 +1,86 @@
+# embedding_quantization_eval.py
+# How much each embedding-store codec (FDRP_EMBEDDING_DTYPE) changes the results,
+# measured on real events against their full-precision embeddings:
+#   ARI      adjusted Rand index between the HDBSCAN albums (hdbscan_labels) of the
+#            quantized and the float32 embeddings; 1.0 means identical albums
+#   top-1    share of faces whose nearest other face (cosine, as in match_face.py)
+#            is the same with quantized and float32 embeddings
+# Exits with status 1 if any codec falls below --min-ari or --min-top1 on any event.
+#
+# Usage (from the FDRP folder; the events must have float32 stores):
+#   python benchmarks/embedding_quantization_eval.py Cropped_Events/event_1 [Cropped_Events/event_2 ...]
+#       [--codecs float16,int8,pq] [--pq-subspaces 64] [--min-ari 0.95] [--min-top1 0.98]
+import sys
+import argparse
+sys.path.append(".")  # To import healpers and Sorting_Algos from the FDRP root
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+from healpers.embedding_store import EmbeddingStore
+from healpers.embedding_codecs import PQ_MIN_TRAIN, train_pq, encode, decode, encoded_size
+from Sorting_Algos.HDBSCAN import hdbscan_labels
+
+
+def nearest_neighbours(vectors, chunk=1024):
+    """Index of each row's most cosine-similar other row."""
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    nearest = np.empty(len(unit), dtype=np.intp)
+    for start in range(0, len(unit), chunk):
+        similarity = unit[start:start + chunk] @ unit.T
+        similarity[np.arange(len(similarity)), np.arange(start, start + len(similarity))] = -np.inf
+        nearest[start:start + chunk] = similarity.argmax(axis=1)
+    return nearest
+
+
+def round_trip(codec, vectors, pq_subspaces):
+    """`vectors` as the store would give them back with `codec` (same pq fallback as EmbeddingStore)."""
+    if codec == "pq" and len(vectors) < PQ_MIN_TRAIN:
+        codec = "float16"
+    codebook = train_pq(vectors, pq_subspaces) if codec == "pq" else None
+    return codec, np.asarray(decode(codec, encode(codec, vectors, codebook), codebook), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clustering ARI and match top-1 agreement of quantized embeddings.")
+    parser.add_argument("event_folders", nargs="+")
+    parser.add_argument("--codecs", default="float16,int8,pq", help="Comma-separated codecs to evaluate.")
+    parser.add_argument("--pq-subspaces", type=int, default=64)
+    parser.add_argument("--min-ari", type=float, default=0.95)
+    parser.add_argument("--min-top1", type=float, default=0.98)
+    parser.add_argument("--min-cluster-size", type=int, default=3)
+    parser.add_argument("--similarity-threshold", type=float, default=0.6)
+    args = parser.parse_args()
+
+    failures = 0
+    print("+----------------------+------------+-------+-----------+--------+--------+")
+    print("| event                | codec      | faces | bytes/row |    ARI |  top-1 |")
+    print("+----------------------+------------+-------+-----------+--------+--------+")
+    for folder in args.event_folders:
+        store = EmbeddingStore(folder)
+        if store.meta()["dtype"] != "float32":
+            print(f"Skipping {folder}: its store is {store.meta()['dtype']}, not full precision")
+            continue
+        names, full = store.read()
+        if len(names) < 2:
+            print(f"Skipping {folder}: fewer than two embeddings")
+            continue
+        full = np.asarray(full, dtype=np.float32)
+        reference_labels = hdbscan_labels(full, args.min_cluster_size, None, args.similarity_threshold)
+        reference_nearest = nearest_neighbours(full)
+        for codec in args.codecs.split(","):
+            used, vectors = round_trip(codec, full, args.pq_subspaces)
+            ari = adjusted_rand_score(reference_labels,
+                                      hdbscan_labels(vectors, args.min_cluster_size, None, args.similarity_threshold))
+            top1 = float((nearest_neighbours(vectors) == reference_nearest).mean())
+            ok = ari >= args.min_ari and top1 >= args.min_top1
+            failures += not ok
+            label = codec if used == codec else f"{codec}>{used}"
+            print(f"| {folder[-20:]:>20} | {label:>10} | {len(names):5} | "
+                  f"{encoded_size(used, full.shape[1], args.pq_subspaces):9} | {ari:6.3f} | {top1:6.3f} |"
+                  + ("" if ok else "  <- below guardrail"))
+    print("+----------------------+------------+-------+-----------+--------+--------+")
+    print(f"{failures} codec/event pair(s) below the guardrails (ARI >= {args.min_ari}, top-1 >= {args.min_top1}).")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# facenet_batch_benchmark.py
+# Crops per second of Facenet512 embedding against batch size (facenet_engine.py),
+# compared with the old one-DeepFace.represent()-call-per-file path. Also checks
+# that both paths give the same embeddings, and exits with status 1 if any batch
+# size differs by more than --max-diff. Keep the --report of a passing run on the
+# production weights before setting FDRP_FACENET_BATCHED=1.
+#
+# Usage (from the FDRP folder):
+#   python benchmarks/facenet_batch_benchmark.py <cropped_faces_folder> [--batch-sizes 1,8,32,64] [--repeats 3] [--limit 256]
+#       [--max-diff 1e-3] [--report facenet_parity.json]
+#   Set CUDA_VISIBLE_DEVICES=-1 to benchmark the CPU path on a GPU host.
+import os
+import sys
+import json
+import time
+import argparse
+sys.path.append("FDRP-Workers")
+import numpy as np
+from deepface import DeepFace
+from facenet_engine import FaceNetEngine
+
+
+def represent_files(paths, model_name):
+    """The per-file path facenet_worker used before the engine."""
+    embeddings = []
+    for path in paths:
+        result = DeepFace.represent(img_path=path, model_name=model_name, enforce_detection=False,
+                                    detector_backend='skip')
+        embeddings.append(result[0]['embedding'])
+    return np.array(embeddings, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Facenet512 crops/s: batched engine vs DeepFace.represent.")
+    parser.add_argument("crops_folder")
+    parser.add_argument("--model", default="Facenet512")
+    parser.add_argument("--batch-sizes", default="1,8,32,64", help="Comma-separated batch sizes to try.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per setting; the best one is reported.")
+    parser.add_argument("--limit", type=int, default=256, help="Maximum number of crops to load.")
+    parser.add_argument("--max-diff", type=float, default=1e-3,
+                        help="Largest allowed |difference| of any embedding value from the per-file path.")
+    parser.add_argument("--report", help="Also write the settings and results to this JSON file.")
+    args = parser.parse_args()
+
+    paths = [os.path.join(args.crops_folder, name) for name in sorted(os.listdir(args.crops_folder))
+             if name.lower().endswith(('.jpg', '.jpeg', '.png'))][:args.limit]
+    if not paths:
+        print(f"No crops in {args.crops_folder}")
+        sys.exit(1)
+    print(f"{len(paths)} crop(s); CUDA_VISIBLE_DEVICES={os.environ.get('CUDA_VISIBLE_DEVICES')}")
+
+    represent_files(paths[:2], args.model)  # Warm-up: model build is not part of the measurement
+    best = None
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        reference = represent_files(paths, args.model)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("+------------------+-----------+---------+---------+-----------------+")
+    print("| path             | best time | crops/s | speedup | max |diff| vs old |")
+    print("+------------------+-----------+---------+---------+-----------------+")
+    print(f"| {'represent/file':>16} | {best:8.2f}s | {len(paths) / best:7.1f} | {1.0:6.2f}x | {0.0:15.2e} |")
+    rows = []
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        engine = FaceNetEngine(args.model, batch_size, batched=True)
+        engine.embed_files(paths[:batch_size])  # Warm-up for this batch shape
+        timings = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            embedded = engine.embed_files(paths)
+            timings.append(time.perf_counter() - started)
+        elapsed = min(timings)
+        diff = float(np.abs(np.array([embedded[path] for path in paths], dtype=np.float32) - reference).max())
+        rows.append({"batch_size": batch_size, "seconds": elapsed, "crops_per_s": len(paths) / elapsed,
+                     "max_abs_diff": diff, "ok": diff <= args.max_diff})
+        print(f"| {'batch ' + str(batch_size):>16} | {elapsed:8.2f}s | {len(paths) / elapsed:7.1f} "
+              f"| {best / elapsed:6.2f}x | {diff:15.2e} |" + ("" if diff <= args.max_diff else "  <- above --max-diff"))
+    print("+------------------+-----------+---------+---------+-----------------+")
+    failures = sum(not row["ok"] for row in rows)
+    print(f"{failures} batch size(s) differ from the per-file path by more than {args.max_diff}.")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({
+                "model": args.model, "crops": len(paths), "cuda_visible_devices": os.environ.get("CUDA_VISIBLE_DEVICES"),
+                "max_diff": args.max_diff, "represent_seconds": best, "batches": rows, "failures": failures,
+            }, f, indent=1)
+        print(f"Report written to {args.report}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# retinaface_batch_benchmark.py
+# Images per second of RetinaFace detection against batch size, CPU only.
+#
+# Usage (from the FDRP folder):
+#   python benchmarks/retinaface_batch_benchmark.py <image_folder> [--batch-sizes 1,2,4,8] [--repeats 3] [--limit 32]
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")  # Benchmark the CPU path, even on a GPU host
+import sys
+import time
+import argparse
+sys.path.append(".")  # To import healpers from the FDRP root
+sys.path.append("FDRP-Workers")
+import cv2
+from retinaface import RetinaFace
+from retinaface_worker import detect_faces_batch, CANVAS
+
+
+def load_images(folder, limit, max_width=1920, max_height=1080):
+    """Reads and pre-shrinks images the same way extract_faces does."""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        img = cv2.imread(os.path.join(folder, name))
+        if img is None:
+            continue
+        height, width = img.shape[:2]
+        if height > max_height or width > max_width:
+            scaling_factor = min(max_width / width, max_height / height)
+            img = cv2.resize(img, (int(width * scaling_factor), int(height * scaling_factor)))
+        images.append(img)
+        if len(images) >= limit:
+            break
+    return images
+
+
+def time_run(images, batch_size):
+    started = time.perf_counter()
+    faces = 0
+    if batch_size == 0:  # The original one-image-at-a-time path
+        for img in images:
+            faces += len(RetinaFace.detect_faces(img) or {})
+    else:
+        for start in range(0, len(images), batch_size):
+            faces += sum(len(result) for result in detect_faces_batch(images[start:start + batch_size]))
+    return time.perf_counter() - started, faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RetinaFace images/s against batch size (CPU).")
+    parser.add_argument("image_folder")
+    parser.add_argument("--batch-sizes", default="1,2,4,8", help="Comma-separated batch sizes to try.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per batch size; the best one is reported.")
+    parser.add_argument("--limit", type=int, default=32, help="Maximum number of images to load.")
+    args = parser.parse_args()
+
+    images = load_images(args.image_folder, args.limit)
+    if not images:
+        print(f"No readable images in {args.image_folder}")
+        sys.exit(1)
+    print(f"Loaded {len(images)} image(s); canvas {CANVAS[0]}x{CANVAS[1]}; "
+          f"CUDA_VISIBLE_DEVICES={os.environ.get('CUDA_VISIBLE_DEVICES')}")
+
+    RetinaFace.build_model()
+    time_run(images[:2], 0)  # Warm-up: graph tracing is not part of the measurement
+
+    rows = [("per-image", 0)] + [(str(size), size) for size in (int(b) for b in args.batch_sizes.split(","))]
+    print("+------------+-----------+------------+-------+")
+    print("| batch size | best time |   images/s | faces |")
+    print("+------------+-----------+------------+-------+")
+    for label, batch_size in rows:
+        if batch_size:
+            time_run(images[:batch_size], batch_size)  # Trace this input shape first
+        best, faces = min(time_run(images, batch_size) for _ in range(args.repeats))
+        print(f"| {label:>10} | {best:8.2f}s | {len(images) / best:10.2f} | {faces:5} |")
+    print("+------------+-----------+------------+-------+")
+
+
+if __name__ == "__main__":
+    main()
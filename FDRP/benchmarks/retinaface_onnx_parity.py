@@ -0,0 +1,98 @@
+# retinaface_onnx_parity.py
+# Checks that the ONNX backend (FDRP_DETECTOR_BACKEND=onnx) gives the same faces
+# as the TensorFlow retinaface package on a folder of images, within tolerance.
+# Exits with status 1 if any image is out of tolerance.
+#
+# Run it on the production weights and keep the --report file before making the
+# ONNX backend the default for any deployment.
+#
+# Usage (from the FDRP folder; needs TensorFlow + retinaface and onnxruntime/opencv):
+#   python benchmarks/retinaface_onnx_parity.py <image_folder> --model FDRP-Workers/models/retinaface.onnx
+#       [--engine onnxruntime|opencv] [--box-tol 2] [--landmark-tol 2] [--score-tol 0.01] [--report parity.json]
+import os
+import sys
+import json
+import argparse
+sys.path.append("FDRP-Workers")
+import cv2
+import numpy as np
+from retinaface import RetinaFace
+from retinaface_onnx import OnnxRetinaFace
+from detection_metrics import iou, cap_image
+
+
+def compare(reference, candidate, iou_threshold=0.5):
+    """
+    Pairs faces by IoU. Returns (max box diff px, max landmark diff px, max score diff, unmatched count).
+    """
+    reference = list(reference.values()) if isinstance(reference, dict) else []
+    candidate = list(candidate.values()) if isinstance(candidate, dict) else []
+    box_diff = landmark_diff = score_diff = 0.0
+    unused = list(candidate)
+    unmatched = 0
+    for ref in reference:
+        best = max(unused, key=lambda c: iou(ref['facial_area'], c['facial_area']), default=None)
+        if best is None or iou(ref['facial_area'], best['facial_area']) < iou_threshold:
+            unmatched += 1
+            continue
+        unused.remove(best)
+        box_diff = max(box_diff, float(np.abs(np.subtract(ref['facial_area'], best['facial_area'])).max()))
+        for name, point in ref['landmarks'].items():
+            landmark_diff = max(landmark_diff, float(np.abs(np.subtract(point, best['landmarks'][name])).max()))
+        score_diff = max(score_diff, abs(float(ref['score']) - float(best['score'])))
+    return box_diff, landmark_diff, score_diff, unmatched + len(unused)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TF vs ONNX RetinaFace parity check.")
+    parser.add_argument("image_folder")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--engine", default="onnxruntime", choices=["onnxruntime", "opencv"])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--box-tol", type=float, default=2.0, help="Max box coordinate difference in pixels.")
+    parser.add_argument("--landmark-tol", type=float, default=2.0, help="Max landmark difference in pixels.")
+    parser.add_argument("--score-tol", type=float, default=0.01)
+    parser.add_argument("--unmatched-tol", type=int, default=0,
+                        help="Faces allowed to appear in only one backend (int8 models may need 1-2 near the threshold).")
+    parser.add_argument("--report", help="Also write the tolerances and per-image results to this JSON file.")
+    args = parser.parse_args()
+
+    onnx_detector = OnnxRetinaFace(args.model, engine=args.engine).build_model()
+    RetinaFace.build_model()
+
+    failures = 0
+    worst = [0.0, 0.0, 0.0, 0]
+    rows = []
+    names = [n for n in sorted(os.listdir(args.image_folder))][:args.limit]
+    for name in names:
+        img = cv2.imread(os.path.join(args.image_folder, name))
+        if img is None:
+            continue
+        img, _ = cap_image(img)  # What extract_faces feeds the detector
+        result = compare(RetinaFace.detect_faces(img), onnx_detector.detect_faces(img))
+        worst = [max(w, r) for w, r in zip(worst, result)]
+        ok = (result[0] <= args.box_tol and result[1] <= args.landmark_tol
+              and result[2] <= args.score_tol and result[3] <= args.unmatched_tol)
+        failures += 0 if ok else 1
+        rows.append({"image": name, "box_px": result[0], "landmark_px": result[1], "score": result[2],
+                     "unmatched": result[3], "ok": ok})
+        print(f"{'✅' if ok else '❌'} {name}: box {result[0]:.2f}px, landmarks {result[1]:.2f}px, "
+              f"score {result[2]:.4f}, unmatched {result[3]}")
+
+    print(f"\nWorst: box {worst[0]:.2f}px, landmarks {worst[1]:.2f}px, score {worst[2]:.4f}, unmatched {worst[3]}")
+    print(f"{failures} image(s) out of tolerance.")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({
+                "model": args.model, "engine": args.engine,
+                "tolerances": {"box_px": args.box_tol, "landmark_px": args.landmark_tol,
+                               "score": args.score_tol, "unmatched": args.unmatched_tol},
+                "worst": {"box_px": worst[0], "landmark_px": worst[1], "score": worst[2], "unmatched": worst[3]},
+                "failures": failures, "images": rows,
+            }, f, indent=1)
+        print(f"Report written to {args.report}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# retinaface_proxy_benchmark.py
+# Recall and latency of proxy detection (FDRP_RETINAFACE_PROXY_SIZE) for several proxy sizes.
+# The reference is the normal path: detection on the image capped at 1920x1080.
+# A reference face counts as found if a proxy detection overlaps it with IoU >= --iou.
+#
+# Usage (from the FDRP folder):
+#   python benchmarks/retinaface_proxy_benchmark.py <image_folder> [--sizes 480,640,800,1024] [--limit 50]
+import os
+import sys
+import time
+import argparse
+sys.path.append(".")  # To import healpers from the FDRP root
+sys.path.append("FDRP-Workers")
+import cv2
+from retinaface_worker import detect_faces_images, map_detections
+from detection_metrics import cap_image, count_matches, boxes
+
+
+def timed_detect(images, batch_size, proxy_size):
+    started = time.perf_counter()
+    results = detect_faces_images(images, batch_size=batch_size, proxy_size=proxy_size)
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy detection recall/latency against the 1920x1080 reference.")
+    parser.add_argument("image_folder")
+    parser.add_argument("--sizes", default="480,640,800,1024", help="Comma-separated proxy long-side sizes.")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of images to load.")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed for a reference face to count as found.")
+    args = parser.parse_args()
+
+    names = sorted(os.listdir(args.image_folder))
+    images = [img for img in (cv2.imread(os.path.join(args.image_folder, n)) for n in names) if img is not None]
+    images = images[:args.limit]
+    if not images:
+        print(f"No readable images in {args.image_folder}")
+        sys.exit(1)
+
+    # Reference: what production does without a proxy, mapped to full resolution
+    capped = [cap_image(img) for img in images]
+    detect_faces_images([capped[0][0]], batch_size=args.batch_size)  # Warm-up
+    found, ref_seconds = timed_detect([small for small, _ in capped], args.batch_size, 0)
+    reference = [boxes(map_detections(f, 1.0 / scale) if f else f) for f, (_, scale) in zip(found, capped)]
+    total_ref = sum(len(r) for r in reference)
+    print(f"{len(images)} image(s), {total_ref} reference face(s), "
+          f"{ref_seconds / len(images) * 1000:.1f} ms/image at 1920x1080")
+
+    print("+------------+------------+---------+--------+-------------+")
+    print("| proxy size | ms / image | speedup | recall | extra boxes |")
+    print("+------------+------------+---------+--------+-------------+")
+    for size in (int(s) for s in args.sizes.split(",")):
+        detect_faces_images([images[0]], batch_size=args.batch_size, proxy_size=size)  # Trace this shape first
+        found, seconds = timed_detect(images, args.batch_size, size)
+        matched = sum(count_matches(ref, boxes(f), args.iou) for ref, f in zip(reference, found))
+        extra = sum(len(boxes(f)) for f in found) - matched
+        recall = matched / total_ref if total_ref else 1.0
+        print(f"| {size:>10} | {seconds / len(images) * 1000:10.1f} | {ref_seconds / seconds:6.2f}x "
+              f"| {recall:6.1%} | {extra:11} |")
+    print("+------------+------------+---------+--------+-------------+")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,66 @@
+import os
 import sys
-import time
 import subprocess
 sys.path.append("FDRP-Workers")
 from datetime import datetime
-from healpers.db_helper import get_cropped_event, update_event_status, update_facenet_time, get_duration_string
+from healpers.db_helper import update_facenet_time, get_duration_string
+from healpers.work_queue import WorkQueue
+from healpers.embedding_store import missing_embeddings
+
+WORKER_COUNT = int(os.environ.get("FDRP_FACENET_WORKERS", 1))  # Events embedded at the same time
 
 print("FaceNet Working......")
 print("Looking For cropped events")
 
-def run_embedding_subprocess(input_folder, output_folder):
-    try:
-        result = subprocess.run(
-            [sys.executable, "FDRP-Workers/facenet_subprocess_entry.py", input_folder, output_folder],
-            capture_output=True, text=True
-        )
-        if result.returncode != 0:
-            print(f"[ERROR] Subprocess failed with code {result.returncode}")
-            print("STDOUT:\n", result.stdout)
-            print("STDERR:\n", result.stderr)
-        else:
-            print("[INFO] Subprocess completed successfully.")
-            print("STDOUT:\n", result.stdout)
-    except Exception as e:
-        print(f"[EXCEPTION] Failed to run subprocess: {e}")
-
-def main_processing_loop(db_path='database.db', check_interval=5):
-    while True:
-        event_id_result = get_cropped_event(db_path)
-        if event_id_result:
-            event_id = event_id_result[0][0]
-            print(f"Processing event_id: {event_id}")
-            input_folder = f"Cropped_Events/event_{event_id}/Cropped_Faces_Align"
-            output_folder = f"Cropped_Events/event_{event_id}"
-            start_time = datetime.now().isoformat()
-            run_embedding_subprocess(input_folder, output_folder)
-            end_time = datetime.now().isoformat()
-            duration_str = get_duration_string(start_time, end_time)
-            update_facenet_time(event_id,duration_str)
-            update_event_status(event_id, "emb_ext")
-            print("FaceNet Working......")
-            print("Looking For cropped events")
-
-        time.sleep(check_interval)
+def run_embedding_subprocess(input_folder, output_folder, job):
+    """
+    Raises:
+        RuntimeError: If the subprocess exits with an error, so the queue retries the event.
+    """
+    process = subprocess.Popen(
+        [sys.executable, "FDRP-Workers/facenet_subprocess_entry.py", input_folder, output_folder],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    # A lost lease kills the subprocess; embeddings it already stored are skipped by the new owner
+    with job.aborting(process.kill):
+        stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        print(f"[ERROR] Subprocess failed with code {process.returncode}")
+        print("STDOUT:\n", stdout)
+        print("STDERR:\n", stderr)
+        raise RuntimeError(f"Embedding subprocess for {input_folder} failed with code {process.returncode}")
+    print("[INFO] Subprocess completed successfully.")
+    print("STDOUT:\n", stdout)
+
+def process_event(job):
+    """
+    Embeds the crops of one event. Crops embedded by an earlier attempt are
+    skipped by the worker.
+
+    Args:
+        job (Job): The claimed event.
+
+    Returns:
+        str: 'emb_ext' once every crop in the face manifest has an embedding.
+        Raises otherwise, so the queue retries the event.
+    """
+    event_id = job.event_id
+    input_folder = f"Cropped_Events/event_{event_id}/Cropped_Faces_Align"
+    output_folder = f"Cropped_Events/event_{event_id}"
+    start_time = datetime.now().isoformat()
+    run_embedding_subprocess(input_folder, output_folder, job)
+    job.check()
+    missing = missing_embeddings(output_folder)
+    if missing:
+        raise RuntimeError(f"{len(missing)} crop(s) of event {event_id} have no embedding (first: {missing[0]})")
+    end_time = datetime.now().isoformat()
+    duration_str = get_duration_string(start_time, end_time)
+    update_facenet_time(event_id,duration_str)
+    return "emb_ext"
+
+def main_processing_loop(db_path='database.db', worker_count=WORKER_COUNT):
+    queue = WorkQueue("cropped", "embedding", "failed_embedding", db_path=db_path)
+    queue.run_workers(process_event, count=worker_count, name="facenet")
 
 if __name__ == "__main__":
     main_processing_loop()
@@ -1,65 +1,88 @@
-import time
 import requests
-from healpers.db_helper import get_embeding_extracted_event, update_event_status, delete_sorted_event, get_duration_string, update_hdbscan_time
+from healpers.db_helper import delete_sorted_event, get_duration_string, update_hdbscan_time
+from healpers.work_queue import WorkQueue
 from Sorting_Algos.HDBSCAN import cluster_faces_hdbscan
 from healpers.folder_healper import delete_folders_in_event_folder
+from healpers.face_manifest import faces_by_crop, no_face_images, read_images
 import os
 from datetime import datetime
+
+WORKER_COUNT = int(os.environ.get("FDRP_HDBSCAN_WORKERS", 1))  # Events clustered at the same time
+
 print("HDBSCAN Working......")
 print("Looking For emb_ext events")
-def main_processing_loop(db_path='database.db', check_interval=5):
-    while True:  # Infinite loop to keep checking for new events
-        event_id_result = get_embeding_extracted_event(db_path)  # Get unsorted event IDs
-        if event_id_result:
-            # print("event_id_result: ", event_id_result)
-            event_id = event_id_result[0][0]
-            print(f"Processing event_id: {event_id}")
-            input_folder = f"Cropped_Events/event_{event_id}"
+def process_event(job):
+    """
+    Clusters one event and sends the albums to Flask. Stops with LeaseLost
+    before posting or deleting anything once the lease is lost.
+
+    Args:
+        job (Job): The claimed event.
+
+    Returns:
+        str: 'sorted', or 'failed_sorting' if HDBSCAN found nothing.
+        Raises if Flask could not be reached, so the queue retries the event.
+    """
+    event_id = job.event_id
+    input_folder = f"Cropped_Events/event_{event_id}"
+
+    start_time = datetime.now().isoformat()
+    clustered_data = cluster_faces_hdbscan(input_folder)  # Assuming this returns the clustered data
+    if not clustered_data:
+        print("HDBSCAN returned no cluster data.")
+        return "failed_sorting" # Or some other appropriate status
+
+    print("Clustered Data:", clustered_data)
+    # Albums list source photos: each clustered crop is looked up in the face manifest
+    faces = faces_by_crop(input_folder)
+    processed_data = {}
+    for key, value in clustered_data.items():
+        images = []
+        for crop in value:
+            image = faces[crop]["image"] if crop in faces else crop  # Flask strips _face_<n>.jpg itself
+            if image not in images:
+                images.append(image)
+        processed_data[str(key)] = images
+
+    if read_images(input_folder) is not None:
+        processed_data["No Face"] = no_face_images(input_folder)
+    else:
+        no_face_path = os.path.join(input_folder, "no_faces.txt")  # Events detected before the manifest
+        if os.path.exists(no_face_path):
+            with open(no_face_path, "r") as f:
+                processed_data["No Face"] = [line.strip() for line in f if line.strip()]
+    print("\n=================processed_data=================\n",processed_data)
+    # Include the event_id in the payload
+    payload = {
+        'event_id': event_id,
+        'albums': processed_data
+    }
+    print("=====================payload Data=====================:\n", payload)
+    job.check()  # Another worker owns the event now; it sends the albums
+    try:
+        headers = {'Content-Type': 'application/json'}
+        # For Disturbutive Computing
+        # response = requests.post("http://192.168.100.9:5000/albums/process_album_data", headers=headers, json=payload)
+        # For The Same Machine
+        response = requests.post("http://127.0.0.1:5000/albums/process_album_data", headers=headers, json=payload)
+        response.raise_for_status()
+        print("Data sent to Flask endpoint successfully.")
+        print("Response:", response.json())
+    except requests.exceptions.RequestException as e:
+        print(f"Error sending data to Flask endpoint: {e}")
+        raise
+
+    end_time = datetime.now().isoformat()
+    duration_str = get_duration_string(start_time, end_time)
+    update_hdbscan_time(event_id,duration_str)
+    # delete_sorted_event(event_id)
+    job.check()  # Keep the folders the new owner is reading
+    delete_folders_in_event_folder(event_id)
+    return "sorted"
 
-            start_time = datetime.now().isoformat()
-            clustered_data = cluster_faces_hdbscan(input_folder)  # Assuming this returns the clustered data
-            if clustered_data:
-                print("Clustered Data:", clustered_data)
-                processed_data = {}
-                for key, value in clustered_data.items():
-                    processed_data[str(key)] = value
+def main_processing_loop(db_path='database.db', worker_count=WORKER_COUNT):
+    queue = WorkQueue("emb_ext", "sorting", "failed_sorting", db_path=db_path)
+    queue.run_workers(process_event, count=worker_count, name="hdbscan")
 
-                no_face_path = os.path.join(input_folder, "no_faces.txt")
-                if os.path.exists(no_face_path):
-                    with open(no_face_path, "r") as f:
-                        no_face_files = [line.strip() for line in f if line.strip()]
-                    processed_data["No Face"] = no_face_files
-                print("\n=================processed_data=================\n",processed_data)
-                # Include the event_id in the payload
-                payload = {
-                    'event_id': event_id,
-                    'albums': processed_data
-                }
-                print("=====================payload Data=====================:\n", payload)
-                try:
-                    headers = {'Content-Type': 'application/json'}
-                    # For Disturbutive Computing
-                    # response = requests.post("http://192.168.100.9:5000/albums/process_album_data", headers=headers, json=payload)
-                    # For The Same Machine
-                    response = requests.post("http://127.0.0.1:5000/albums/process_album_data", headers=headers, json=payload)
-                    response.raise_for_status()
-                    print("Data sent to Flask endpoint successfully.")
-                    print("Response:", response.json())
-                    update_event_status(event_id, "sorted")
-                    end_time = datetime.now().isoformat()
-                    duration_str = get_duration_string(start_time, end_time)
-                    update_hdbscan_time(event_id,duration_str)
-                    # delete_sorted_event(event_id)
-                    delete_folders_in_event_folder(event_id)
-                except requests.exceptions.RequestException as e:
-                    print(f"Error sending data to Flask endpoint: {e}")
-                    print("HDBSCAN Working......")
-                    print("Looking For emb_ext events")
-            else:
-                print("HDBSCAN returned no cluster data.")
-                update_event_status(event_id, "failed_sorting") # Or some other appropriate status
-        # else:
-        #     print("HDBSCAN: No emb_ext events found.")
-        time.sleep(check_interval)  # Wait for the specified interval before checking again
 if __name__ == "__main__":
-    main_processing_loop()
\ No newline at end of file
+    main_processing_loop()
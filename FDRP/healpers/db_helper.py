@@ -1,5 +1,10 @@
 import sqlite3
+import uuid
 from datetime import datetime
+
+# deepface_jobs statuses in which a stage worker holds the event's lease (see work_queue.py)
+RUNNING_STATUSES = ('cropping', 'embedding', 'sorting')
+
 # Function to get a database connection
 def get_db_connection(db_path='database.db', timeout=10):
     conn = sqlite3.connect(db_path, timeout=timeout)
@@ -16,7 +21,84 @@ def init_deepface_jobs_table(db_path='database.db'):
             status TEXT DEFAULT 'unsorted',
             retinaface_time TEXT,
             facenet_time TEXT,
-            hdbscan_time TEXT
+            hdbscan_time TEXT,
+            claimed_by TEXT,
+            lease_expires_at REAL,
+            attempts INTEGER DEFAULT 0,
+            rerun INTEGER DEFAULT 0
+        )
+    """)
+    # One row per received image, written in the same transaction as the job row
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS image_manifest (
+            event_id INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            status TEXT DEFAULT 'received',
+            received_at TEXT,
+            PRIMARY KEY (event_id, file_name)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_image_manifest_hash
+        ON image_manifest (event_id, sha256)
+    """)
+    # Resumable chunked uploads: one open session per event, one row per expected file
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            session_id TEXT PRIMARY KEY,
+            event_id INTEGER NOT NULL,
+            status TEXT DEFAULT 'open',
+            created_at TEXT,
+            finalized_at TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_session_files (
+            session_id TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (session_id, file_name)
+        )
+    """)
+    # Per-event processing switches; kept apart from deepface_jobs so re-uploads do not reset them
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_options (
+            event_id INTEGER PRIMARY KEY,
+            debug_artifacts INTEGER DEFAULT 0
+        )
+    """)
+    conn.commit()
+    conn.close()
+    ensure_queue_schema(db_path)
+
+def ensure_queue_schema(db_path='database.db'):
+    """
+    Adds the work queue columns to a deepface_jobs table created before they
+    existed, and creates the table stage workers register their wakeup ports in.
+    Called by init_deepface_jobs_table(); safe to run from every process on startup.
+    """
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(deepface_jobs)")
+    columns = {row[1] for row in cursor.fetchall()}
+    for name, column_type in (("claimed_by", "TEXT"), ("lease_expires_at", "REAL"), ("attempts", "INTEGER DEFAULT 0"),
+                              ("rerun", "INTEGER DEFAULT 0")):
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE deepface_jobs ADD COLUMN {name} {column_type}")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_deepface_jobs_status
+        ON deepface_jobs (status, lease_expires_at)
+    """)
+    # Idle workers listen on a localhost UDP port and are woken when jobs reach their status
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS queue_waiters (
+            waiter_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            port INTEGER NOT NULL,
+            last_seen REAL NOT NULL
         )
     """)
     conn.commit()
@@ -34,6 +116,218 @@ def insert_event_into_deepface_jobs(event_id, db_path='database.db'):
     conn.commit()
     conn.close()
 
+def enqueue_upload_batch(event_id, manifest_rows, db_path='database.db'):
+    """
+    Records one upload batch in a single transaction: the image manifest rows
+    and the deepface_jobs row that makes the event visible to RetinaFace.
+    File names must be new to the event's manifest (see get_manifest_names):
+    a clash raises sqlite3.IntegrityError instead of overwriting the earlier
+    image's hash and status.
+    An event a stage worker is still running keeps its status and lease; it is
+    flagged with rerun = 1 instead, and WorkQueue.complete() sends it back to
+    'unsorted' once that stage finishes.
+
+    Args:
+        event_id (int): The event the batch belongs to.
+        manifest_rows (list[dict]): One dict per saved file with the keys
+                                    'file_name', 'size_bytes' and 'sha256'.
+    """
+    received_at = datetime.now().isoformat()
+    conn = get_db_connection(db_path)
+    try:
+        with conn:  # Commits on success, rolls back on error
+            conn.executemany("""
+                INSERT INTO image_manifest (event_id, file_name, size_bytes, sha256, status, received_at)
+                VALUES (?, ?, ?, ?, 'received', ?)
+            """, [
+                (event_id, row['file_name'], row['size_bytes'], row['sha256'], received_at)
+                for row in manifest_rows
+            ])
+            running = ", ".join("?" * len(RUNNING_STATUSES))
+            conn.execute(f"""
+                INSERT INTO deepface_jobs (event_id, status)
+                VALUES (?, 'unsorted')
+                ON CONFLICT(event_id) DO UPDATE SET
+                    status = 'unsorted', claimed_by = NULL, lease_expires_at = NULL, attempts = 0, rerun = 0
+                WHERE status NOT IN ({running})
+            """, (event_id, *RUNNING_STATUSES))
+            conn.execute(f"""
+                UPDATE deepface_jobs SET rerun = 1
+                WHERE event_id = ? AND status IN ({running})
+            """, (event_id, *RUNNING_STATUSES))
+    finally:
+        conn.close()
+
+def get_event_manifest(event_id, status=None, db_path='database.db'):
+    """
+    Returns the manifest rows of an event as dicts, optionally filtered by status.
+    Downstream stages use this instead of listing received_images/event_X.
+    """
+    conn = get_db_connection(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    query = """
+        SELECT file_name, size_bytes, sha256, status, received_at
+        FROM image_manifest
+        WHERE event_id = ?
+    """
+    params = [event_id]
+    if status is not None:
+        query += " AND status = ?"
+        params.append(status)
+    cursor.execute(query + " ORDER BY file_name", params)
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def get_manifest_hashes(event_id, db_path='database.db'):
+    """
+    Returns {sha256: file_name} for every image already received for an event,
+    whatever stage it has reached. Used to skip re-sent duplicates.
+    """
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT sha256, file_name
+        FROM image_manifest
+        WHERE event_id = ?
+    """, (event_id,))
+    hashes = {sha256: file_name for sha256, file_name in cursor.fetchall()}
+    conn.close()
+    return hashes
+
+def get_manifest_names(event_id, db_path='database.db'):
+    """
+    Returns the set of file names already in an event's manifest, whatever stage
+    they have reached. New uploads must not reuse them, even once detection has
+    removed the original from received_images/event_X.
+    """
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT file_name
+        FROM image_manifest
+        WHERE event_id = ?
+    """, (event_id,))
+    names = {file_name for (file_name,) in cursor.fetchall()}
+    conn.close()
+    return names
+
+def update_manifest_status(event_id, from_status, to_status, db_path='database.db'):
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE image_manifest
+        SET status = ?
+        WHERE event_id = ? AND status = ?
+    """, (to_status, event_id, from_status))
+    conn.commit()
+    conn.close()
+
+def open_upload_session(event_id, files, db_path='database.db'):
+    """
+    Returns the open upload session of an event, creating it if needed, and
+    sets the files it expects. Calling it again after an interrupted
+    transfer returns the same session, so uploads resume instead of restarting.
+
+    Args:
+        event_id (int): The event being uploaded.
+        files (list[dict]): Expected files with 'file_name', 'size_bytes' and 'sha256'.
+
+    Returns:
+        str: The session id.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT session_id
+                FROM upload_sessions
+                WHERE event_id = ? AND status = 'open'
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (event_id,))
+            row = cursor.fetchone()
+            if row:
+                session_id = row[0]
+            else:
+                session_id = uuid.uuid4().hex
+                cursor.execute("""
+                    INSERT INTO upload_sessions (session_id, event_id, status, created_at)
+                    VALUES (?, ?, 'open', ?)
+                """, (session_id, event_id, datetime.now().isoformat()))
+            # The sender's current list replaces the old one; received bytes are kept on disk by hash
+            cursor.execute("DELETE FROM upload_session_files WHERE session_id = ?", (session_id,))
+            cursor.executemany("""
+                INSERT OR REPLACE INTO upload_session_files (session_id, file_name, size_bytes, sha256)
+                VALUES (?, ?, ?, ?)
+            """, [(session_id, f['file_name'], f['size_bytes'], f['sha256']) for f in files])
+    finally:
+        conn.close()
+    return session_id
+
+def get_upload_session(session_id, db_path='database.db'):
+    """
+    Returns {'session_id', 'event_id', 'status', 'files': [...]} or None if the session does not exist.
+    """
+    conn = get_db_connection(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT session_id, event_id, status
+        FROM upload_sessions
+        WHERE session_id = ?
+    """, (session_id,))
+    row = cursor.fetchone()
+    if row is None:
+        conn.close()
+        return None
+    session = dict(row)
+    cursor.execute("""
+        SELECT file_name, size_bytes, sha256
+        FROM upload_session_files
+        WHERE session_id = ?
+        ORDER BY file_name
+    """, (session_id,))
+    session['files'] = [dict(f) for f in cursor.fetchall()]
+    conn.close()
+    return session
+
+def close_upload_session(session_id, status='finalized', db_path='database.db'):
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE upload_sessions
+        SET status = ?, finalized_at = ?
+        WHERE session_id = ?
+    """, (status, datetime.now().isoformat(), session_id))
+    conn.commit()
+    conn.close()
+
+def set_event_debug_artifacts(event_id, enabled, db_path='database.db'):
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO event_options (event_id, debug_artifacts)
+        VALUES (?, ?)
+        ON CONFLICT(event_id) DO UPDATE SET debug_artifacts = excluded.debug_artifacts
+    """, (event_id, 1 if enabled else 0))
+    conn.commit()
+    conn.close()
+
+def get_event_debug_artifacts(event_id, default=False, db_path='database.db'):
+    """
+    Returns whether RetinaFace should keep annotated debug images for this event,
+    or `default` if the event has no explicit setting.
+    """
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT debug_artifacts FROM event_options WHERE event_id = ?", (event_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return bool(row[0]) if row else default
+
 # Function to get unsorted/cropped events from deepface_jobs table
 def get_unsorted_event(db_path='database.db'):
     conn = get_db_connection(db_path)
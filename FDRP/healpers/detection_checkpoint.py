@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+
+# Journal of finished images, in Cropped_Events/event_<id>/
+CHECKPOINT_FILE = "detection_checkpoint.jsonl"
+
+
+class DetectionCheckpoint:
+    """
+    Append-only journal of the images the detection stage has finished, one
+    JSON record per line. Each record is written with a single write and
+    fsynced before the original image is deleted, so after a crash every
+    image is either in the journal (crops saved) or still waiting in
+    received_images. A torn last line from a crash mid-write is dropped
+    when the journal is loaded.
+
+    Args:
+        event_folder (str): The event's output folder.
+    """
+
+    def __init__(self, event_folder):
+        self.path = os.path.join(event_folder, CHECKPOINT_FILE)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Returns:
+            dict: {image_name: record} for every image finished so far.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                print(f"⚠️ Dropping a torn checkpoint record in {self.path}")
+                f.truncate(complete)
+        records = {}
+        for line in data[:complete].splitlines():
+            if line.strip():
+                record = json.loads(line)
+                records[record["image"]] = record
+        return records
+
+    def record(self, record):
+        """Durably appends one finished image's record (called from several writer threads)."""
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def is_done(records, image_name, sha256=None):
+    """
+    Whether the checkpoint has finished this image. Originals are removed once
+    they are done, so a later upload may get the same name back: with the
+    manifest's sha256 the record must be for that same content. Records
+    written before hashes were kept match on the name alone.
+
+    Args:
+        records (dict): DetectionCheckpoint.load() output.
+        image_name (str): The image's file name.
+        sha256 (str | None): Its content hash from the upload manifest, if known.
+
+    Returns:
+        bool: True if the image needs no more detection.
+    """
+    record = records.get(image_name)
+    if record is None:
+        return False
+    return sha256 is None or record.get("sha256") in (None, sha256)
+
+
+def missing_images(event_folder, image_names=None, input_folder=None):
+    """
+    The images the detection stage has not accounted for yet.
+
+    Args:
+        event_folder (str): The event's output folder, holding the checkpoint.
+        image_names (dict[str, str] | list[str] | None): Every image the event should contain
+                                   (the upload manifest, as {file_name: sha256} or just the names).
+        input_folder (str | None): Used instead when there is no manifest: images still
+                                   waiting there are the unaccounted ones.
+
+    Returns:
+        list[str]: Names missing from the checkpoint (empty when the event is complete).
+    """
+    done = DetectionCheckpoint(event_folder).load()
+    if image_names is None:
+        image_names = os.listdir(input_folder) if input_folder and os.path.isdir(input_folder) else []
+    hashes = image_names if isinstance(image_names, dict) else {}
+    return [name for name in image_names if not is_done(done, name, hashes.get(name))]
@@ -0,0 +1,97 @@
+import numpy as np
+
+# How the embedding store keeps its rows (bytes per 512-d embedding):
+#   float32  2048, exact
+#   float16  1024, about 3 significant digits
+#   int8      516, symmetric per-row scale: row ~= codes * scale
+#   pq        PQ_SUBSPACES (64 by default), product quantization: each 8-d slice of a row
+#             is replaced by the nearest of 256 centroids trained on the store's first rows
+# benchmarks/embedding_quantization_eval.py reports the clustering and matching
+# agreement of each codec against float32 on real events.
+CODECS = ("float32", "float16", "int8", "pq")
+PQ_CENTROIDS = 256  # Codes are uint8
+PQ_MIN_TRAIN = 256  # Fewer rows than this cannot train a useful codebook
+
+
+def train_pq(vectors, subspaces, iterations=20, seed=0):
+    """
+    Trains a product-quantization codebook with k-means in each subspace.
+
+    Args:
+        vectors (np.ndarray): (rows, dim) float32 training rows; dim must be divisible by `subspaces`.
+        subspaces (int): Number of slices each row is split into (bytes per encoded row).
+
+    Returns:
+        np.ndarray: float32 codebook of shape (subspaces, centroids, dim // subspaces).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rows, dim = vectors.shape
+    if dim % subspaces:
+        raise ValueError(f"Embedding size {dim} is not divisible into {subspaces} subspaces")
+    width = dim // subspaces
+    centroids = min(PQ_CENTROIDS, rows)
+    rng = np.random.default_rng(seed)
+    codebook = np.empty((subspaces, centroids, width), dtype=np.float32)
+    for m in range(subspaces):
+        part = vectors[:, m * width:(m + 1) * width]
+        centers = part[rng.choice(rows, centroids, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = _nearest(part, centers)
+            for k in range(centroids):
+                members = part[nearest == k]
+                if len(members):
+                    centers[k] = members.mean(axis=0)
+        codebook[m] = centers
+    return codebook
+
+
+def _nearest(part, centers):
+    """Index of the nearest center (squared L2) for every row of `part`."""
+    distances = (part ** 2).sum(axis=1)[:, None] - 2 * part @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return distances.argmin(axis=1)
+
+
+def encode(codec, vectors, codebook=None):
+    """
+    Returns:
+        dict: {column name: array} to store for `vectors`. "vectors" is always present;
+        int8 adds "scales" (rows, 1).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if codec == "float32":
+        return {"vectors": vectors}
+    if codec == "float16":
+        return {"vectors": vectors.astype(np.float16)}
+    if codec == "int8":
+        scales = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+        return {"vectors": codes, "scales": scales.astype(np.float32)}
+    if codec == "pq":
+        subspaces, _, width = codebook.shape
+        codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+        for m in range(subspaces):
+            codes[:, m] = _nearest(vectors[:, m * width:(m + 1) * width], codebook[m])
+        return {"vectors": codes}
+    raise ValueError(f"Unknown embedding codec '{codec}', expected one of {', '.join(CODECS)}")
+
+
+def decode(codec, columns, codebook=None):
+    """
+    Inverse of encode(). float32 and float16 rows are returned as stored (a memory
+    map stays a memory map); int8 and pq rows are expanded to float32.
+    """
+    codes = columns["vectors"]
+    if codec in ("float32", "float16"):
+        return codes
+    if codec == "int8":
+        return np.asarray(codes, dtype=np.float32) * np.asarray(columns["scales"], dtype=np.float32)
+    if codec == "pq":
+        subspaces = codebook.shape[0]
+        return codebook[np.arange(subspaces), np.asarray(codes, dtype=np.intp)].reshape(len(codes), -1)
+    raise ValueError(f"Unknown embedding codec '{codec}', expected one of {', '.join(CODECS)}")
+
+
+def encoded_size(codec, dim, subspaces):
+    """Bytes stored per embedding."""
+    return {"float32": 4 * dim, "float16": 2 * dim, "int8": dim + 4, "pq": subspaces}[codec]
@@ -0,0 +1,259 @@
+import os
+import json
+import pickle
+import numpy as np
+from healpers.face_manifest import read_faces
+from healpers.embedding_codecs import CODECS, PQ_MIN_TRAIN, train_pq, encode, decode
+
+# Per event (or user) folder, next to Cropped_Faces_Align:
+#   facenet512_embeddings.npy          (faces, 512) matrix, a standard .npy file
+#   facenet512_embeddings.index.jsonl  {"row", "crop"} per matrix row, in row order
+#                                      (join faces.jsonl on "crop": face ids are renumbered by every detection run)
+#   facenet512_embeddings.meta.json    {"version", "model", "dim", "dtype"}
+#   facenet512_embeddings.scales.npy   int8 stores only: per-row scale
+#   facenet512_embeddings.codebook.npy pq stores only: the trained codebook
+#
+# "dtype" is the codec (see embedding_codecs.py), chosen with FDRP_EMBEDDING_DTYPE
+# when the store is created; existing stores keep theirs.
+#
+# Readers np.load(mmap_mode='r') the matrix: no parsing, and only the rows
+# used are paged in. Appends write the new rows after the existing ones, then
+# the index lines, and only then the row count in the .npy header, so a crash
+# mid-append leaves the store as it was. If a crop is appended again, its
+# last row wins.
+STORE_VERSION = 1
+HEADER_SIZE = 128  # Fixed .npy header length, so the row count can be updated in place
+EMBEDDING_DTYPE = os.environ.get("FDRP_EMBEDDING_DTYPE", "float32")  # float32, float16, int8 or pq
+PQ_SUBSPACES = int(os.environ.get("FDRP_EMBEDDING_PQ_SUBSPACES", 64))  # Bytes per embedding with pq
+
+
+def embeddings_path(event_folder, model_name='Facenet512'):
+    """The event's embedding matrix, e.g. Cropped_Events/event_1/facenet512_embeddings.npy."""
+    return os.path.join(event_folder, f"{model_name.lower()}_embeddings.npy")
+
+
+def legacy_embeddings_path(event_folder, model_name='Facenet512'):
+    """The pickled {crop: list[float]} dict written before the store existed."""
+    return os.path.join(event_folder, f"{model_name.lower()}_embeddings.pkl")
+
+
+def _npy_header(count, dim, dtype):
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False,
+                   'shape': (count, dim)})
+    body = HEADER_SIZE - 10  # Magic string, version and header length come first
+    return np.lib.format.MAGIC_PREFIX + b"\x01\x00" + body.to_bytes(2, "little") + \
+        header.ljust(body - 1).encode("latin1") + b"\n"
+
+
+class EmbeddingStore:
+    """
+    Append-only embedding matrix of one event.
+
+    Args:
+        event_folder (str): The event's (or user's) output folder.
+        model_name (str): Recognition model the embeddings come from.
+        codec (str): Storage codec for a new store (float32, float16, int8 or pq).
+    """
+
+    def __init__(self, event_folder, model_name='Facenet512', codec=EMBEDDING_DTYPE):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown embedding codec '{codec}', expected one of {', '.join(CODECS)}")
+        self.event_folder = event_folder
+        self.model_name = model_name
+        self.codec = codec
+        self.vectors_path = embeddings_path(event_folder, model_name)
+        base = self.vectors_path[:-len(".npy")]
+        self.index_path = base + ".index.jsonl"
+        self.meta_path = base + ".meta.json"
+        self.scales_path = base + ".scales.npy"
+        self.codebook_path = base + ".codebook.npy"
+        self.legacy_path = legacy_embeddings_path(event_folder, model_name)
+
+    def exists(self):
+        return os.path.exists(self.vectors_path) or os.path.exists(self.legacy_path)
+
+    def meta(self):
+        """The store's meta.json ({"dtype": "float32"} for a store written before it existed)."""
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"dtype": "float32"}
+
+    def _columns(self, codec):
+        """{column name: .npy path} for a codec; "vectors" is the row count's source of truth."""
+        return {"vectors": self.vectors_path, "scales": self.scales_path} if codec == "int8" \
+            else {"vectors": self.vectors_path}
+
+    def _shape(self, path=None):
+        """(rows, width, dtype) from a column's .npy header."""
+        with open(path or self.vectors_path, "rb") as f:
+            np.lib.format.read_magic(f)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        return shape[0], shape[1], dtype
+
+    def _index_rows(self, count):
+        """The first `count` index records and the byte length they take up."""
+        rows = []
+        size = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    if len(rows) == count or not line.endswith(b"\n"):
+                        break  # Lines past the header's count belong to an unfinished append
+                    rows.append(json.loads(line))
+                    size += len(line)
+        return rows, size
+
+    def _read_legacy(self):
+        with open(self.legacy_path, "rb") as f:
+            embeddings = pickle.load(f)
+        if not embeddings:
+            return [], None
+        return list(embeddings), np.asarray(list(embeddings.values()), dtype=np.float32)
+
+    def read(self):
+        """
+        Returns:
+            tuple[list[str], np.ndarray]: Crop names and the (len(names), dim) matrix, row i
+            belonging to names[i]. float32 and float16 stores come back as a read-only
+            memory map (unless a crop was appended more than once); int8 and pq rows are
+            expanded to float32. ([], None) for an event without embeddings.
+        """
+        if not os.path.exists(self.vectors_path):
+            return self._read_legacy() if os.path.exists(self.legacy_path) else ([], None)
+        count = self._shape()[0]
+        meta = self.meta()
+        codec = meta["dtype"]
+        if count == 0:
+            return [], np.zeros((0, meta.get("dim", 0)), dtype=np.float32)
+        # A column other than "vectors" may hold rows of an unfinished append; only `count` are valid
+        columns = {name: np.load(path, mmap_mode="r")[:count] for name, path in self._columns(codec).items()}
+        codebook = np.load(self.codebook_path) if codec == "pq" else None
+        matrix = decode(codec, columns, codebook)
+        names = [row["crop"] for row in self._index_rows(count)[0]]
+        latest = {name: row for row, name in enumerate(names)}
+        if len(latest) < len(names):
+            keep = sorted(latest.values())
+            return [names[row] for row in keep], matrix[keep]
+        return names, matrix
+
+    def names(self):
+        """Crop names that have an embedding."""
+        if not os.path.exists(self.vectors_path):
+            return self._read_legacy()[0] if os.path.exists(self.legacy_path) else []
+        return list(dict.fromkeys(row["crop"] for row in self._index_rows(self._shape()[0])[0]))
+
+    def append(self, embeddings):
+        """
+        Appends {crop name: embedding} rows without touching the existing ones.
+        An event with only the legacy pickle is converted first.
+
+        Returns:
+            int: Number of rows in the store.
+
+        Raises:
+            OSError, ValueError: If the store cannot be written or the dimension differs.
+        """
+        if not os.path.exists(self.vectors_path) and os.path.exists(self.legacy_path):
+            legacy_names, legacy_vectors = self._read_legacy()
+            if legacy_names:
+                self._append(legacy_names, legacy_vectors)
+                print(f"📦 Converted {self.legacy_path} ({len(legacy_names)} embeddings) to {self.vectors_path}")
+        if not embeddings:
+            return self._shape()[0] if os.path.exists(self.vectors_path) else 0
+        names = list(embeddings)
+        return self._append(names, np.asarray([embeddings[name] for name in names], dtype=np.float32))
+
+    def _create(self, vectors):
+        """Writes the meta file, the codebook (pq) and empty columns for a new store."""
+        codec = self.codec
+        if codec == "pq" and len(vectors) < PQ_MIN_TRAIN:
+            print(f"⚠️ {len(vectors)} embedding(s) are too few to train a pq codebook, storing float16 instead")
+            codec = "float16"
+        meta = {"version": STORE_VERSION, "model": self.model_name, "dim": int(vectors.shape[1]), "dtype": codec}
+        codebook = None
+        if codec == "pq":
+            codebook = train_pq(vectors, PQ_SUBSPACES)
+            np.save(self.codebook_path, codebook)
+            meta["pq_subspaces"] = PQ_SUBSPACES
+        for name, column in encode(codec, vectors[:1], codebook).items():
+            with open(self._columns(codec)[name], "wb") as f:
+                f.write(_npy_header(0, column.shape[1], column.dtype))
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def _append(self, names, vectors):
+        if not os.path.exists(self.vectors_path):
+            self._create(vectors)
+        meta = self.meta()
+        count = self._shape()[0]
+        if vectors.shape[1] != meta.get("dim", vectors.shape[1]):
+            raise ValueError(f"Embedding size {vectors.shape[1]} does not match the store's {meta['dim']}")
+        if not len(names):
+            return count
+
+        codec = meta["dtype"]
+        paths = self._columns(codec)
+        codebook = np.load(self.codebook_path) if codec == "pq" else None
+        columns = encode(codec, vectors, codebook)
+        _, index_size = self._index_rows(count)
+        for name, column in columns.items():
+            _, width, dtype = self._shape(paths[name])
+            with open(paths[name], "r+b") as f:
+                f.seek(HEADER_SIZE + count * width * dtype.itemsize)
+                f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+        with open(self.index_path, "ab") as f:
+            f.truncate(index_size)  # Drops lines left by an append that never finished
+            for offset, name in enumerate(names):
+                f.write((json.dumps({"row": count + offset, "crop": name}) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        for name in sorted(columns, key=lambda name: name == "vectors"):  # "vectors" last: it commits the rows
+            _, width, dtype = self._shape(paths[name])
+            with open(paths[name], "r+b") as f:
+                f.write(_npy_header(count + len(names), width, dtype))
+                f.flush()
+                os.fsync(f.fileno())
+        return count + len(names)
+
+
+def read_embeddings(event_folder, model_name='Facenet512'):
+    """Crop names and their embedding matrix; see EmbeddingStore.read()."""
+    return EmbeddingStore(event_folder, model_name).read()
+
+
+def load_embeddings(event_folder, model_name='Facenet512'):
+    """
+    Returns:
+        dict: {crop file name: embedding row} ({} if the event has none yet).
+    """
+    names, matrix = read_embeddings(event_folder, model_name)
+    return dict(zip(names, matrix)) if names else {}
+
+
+def save_embeddings(event_folder, embeddings, model_name='Facenet512'):
+    """
+    Appends `embeddings` ({crop name: embedding}) to the event's store; a crop
+    that is already stored is superseded by its new row.
+
+    Returns:
+        tuple[str, int]: The matrix path and the number of rows it now holds.
+
+    Raises:
+        OSError, ValueError: If the store cannot be written.
+    """
+    store = EmbeddingStore(event_folder, model_name)
+    return store.vectors_path, store.append(embeddings)
+
+
+def missing_embeddings(event_folder, model_name='Facenet512'):
+    """
+    Crops listed in the event's face manifest that have no embedding yet
+    ([] for events without a manifest).
+    """
+    stored = set(EmbeddingStore(event_folder, model_name).names())
+    return [row["crop"] for row in read_faces(event_folder) or [] if row["crop"] not in stored]
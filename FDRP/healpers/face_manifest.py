@@ -0,0 +1,85 @@
+import os
+import json
+
+# Written by the detection stage into Cropped_Events/event_<id>/
+FACES_MANIFEST = "faces.jsonl"    # One row per saved face crop
+IMAGES_MANIFEST = "images.jsonl"  # One row per processed photo, with or without faces
+
+
+def write_face_manifest(event_folder, image_records):
+    """
+    Writes the per-event manifests from the detection records of each image.
+
+    faces.jsonl rows:
+        {"face_id": 0, "image": "IMG_1.jpg", "face_index": 0, "crop": "IMG_1.jpg_face_0.jpg",
+         "bbox": [x1, y1, x2, y2], "landmarks": {...}, "score": 0.99, "crop_size": [w, h]}
+    images.jsonl rows:
+        {"image": "IMG_1.jpg", "width": 1920, "height": 1080, "phash": "c3e1...", "face_ids": [0, 1]}
+
+    face_id is unique within the event and stable for the same input (images
+    are numbered in name order), so later stages can join on it.
+
+    Args:
+        event_folder (str): The event's output folder.
+        image_records (list[dict]): {"image", "width", "height", "phash", "faces": [...]} per image,
+                                    as produced by extract_faces.
+
+    Returns:
+        int: Number of faces written.
+    """
+    face_id = 0
+    with open(os.path.join(event_folder, FACES_MANIFEST), "w") as faces_file, \
+            open(os.path.join(event_folder, IMAGES_MANIFEST), "w") as images_file:
+        for record in sorted(image_records, key=lambda r: r["image"]):
+            face_ids = []
+            for face in sorted(record["faces"], key=lambda f: f["face_id"]):
+                faces_file.write(json.dumps({
+                    "face_id": face_id,
+                    "image": record["image"],
+                    "face_index": face["face_id"],
+                    "crop": face["file_name"],
+                    "bbox": face["facial_area"],
+                    "landmarks": face["landmarks"],
+                    "score": face["score"],
+                    "crop_size": face.get("crop_size"),
+                }) + "\n")
+                face_ids.append(face_id)
+                face_id += 1
+            images_file.write(json.dumps({
+                "image": record["image"], "width": record["width"], "height": record["height"],
+                "phash": record.get("phash"), "face_ids": face_ids,
+            }) + "\n")
+    return face_id
+
+
+def _read_jsonl(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_faces(event_folder):
+    """
+    Returns:
+        list[dict] | None: The faces.jsonl rows ordered by face_id, or None for events detected before the manifest existed.
+    """
+    return _read_jsonl(os.path.join(event_folder, FACES_MANIFEST))
+
+
+def read_images(event_folder):
+    """
+    Returns:
+        list[dict] | None: The images.jsonl rows, or None if the event has no manifest.
+    """
+    return _read_jsonl(os.path.join(event_folder, IMAGES_MANIFEST))
+
+
+def faces_by_crop(event_folder):
+    """Maps each crop file name to its faces.jsonl row ({} without a manifest)."""
+    return {row["crop"]: row for row in read_faces(event_folder) or []}
+
+
+def no_face_images(event_folder):
+    """Names of the event's photos in which no face was saved ([] without a manifest)."""
+    return [row["image"] for row in read_images(event_folder) or [] if not row["face_ids"]]
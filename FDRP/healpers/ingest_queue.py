@@ -0,0 +1,105 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue already holds the maximum number of waiting uploads."""
+
+
+class IngestGate:
+    """
+    Admission control for /upload-images/.
+
+    Uploads for different events run concurrently, up to `max_active` at a time.
+    Uploads for the same event are serialized behind a per-event lock, so two
+    batches never race on the same received_images/event_X folder.
+    At most `max_waiting` uploads may be queued; beyond that callers are rejected
+    with IngestQueueFull instead of piling up on the server.
+    """
+
+    def __init__(self, max_active=4, max_waiting=16, history=100):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        # asyncio primitives are created lazily so they bind to the running loop
+        self._slots = None
+        self._event_locks = {}   # event_id -> asyncio.Lock
+        self._event_users = {}   # event_id -> number of requests holding/waiting on the lock
+        self._waiting = 0
+        self._active = {}        # event_id -> monotonic start time
+        self._wait_times = deque(maxlen=history)
+        self._admitted = 0
+        self._rejected = 0
+
+    def _get_slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_active)
+        return self._slots
+
+    @asynccontextmanager
+    async def admit(self, event_id):
+        """
+        Waits until this event may ingest, then holds its slot for the duration of the block.
+
+        Raises:
+            IngestQueueFull: If `max_waiting` uploads are already queued.
+        """
+        if self._waiting >= self.max_waiting:
+            self._rejected += 1
+            raise IngestQueueFull(f"Ingest queue is full ({self._waiting} waiting).")
+
+        queued_at = time.monotonic()
+        self._waiting += 1
+        self._event_users[event_id] = self._event_users.get(event_id, 0) + 1
+        lock = self._event_locks.setdefault(event_id, asyncio.Lock())
+        slots = self._get_slots()
+        lock_held = False
+        slot_held = False
+        try:
+            try:
+                # Same-event requests wait here without occupying a global slot
+                await lock.acquire()
+                lock_held = True
+                await slots.acquire()
+                slot_held = True
+            finally:
+                self._waiting -= 1
+
+            waited = time.monotonic() - queued_at
+            self._wait_times.append(waited)
+            self._admitted += 1
+            self._active[event_id] = time.monotonic()
+            yield waited
+        finally:
+            self._active.pop(event_id, None)
+            if slot_held:
+                slots.release()
+            if lock_held:
+                lock.release()
+            self._event_users[event_id] -= 1
+            if self._event_users[event_id] == 0:
+                del self._event_users[event_id]
+                del self._event_locks[event_id]
+
+    def snapshot(self):
+        """Returns queue depth, active events and wait-time statistics for /status."""
+        now = time.monotonic()
+        waits = list(self._wait_times)
+        return {
+            "active_events": {
+                str(event_id): round(now - started, 3) for event_id, started in self._active.items()
+            },
+            "active_count": len(self._active),
+            "max_active": self.max_active,
+            "queue_depth": self._waiting,
+            "max_queue_depth": self.max_waiting,
+            "admitted_total": self._admitted,
+            "rejected_total": self._rejected,
+            "wait_seconds": {
+                "last": round(waits[-1], 3) if waits else 0.0,
+                "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "max": round(max(waits), 3) if waits else 0.0,
+                "samples": len(waits),
+            },
+        }
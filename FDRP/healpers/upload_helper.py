@@ -0,0 +1,178 @@
+import os
+import uuid
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB per read/write
+FSYNC_BATCH_SIZE = 32     # Files written between fsync passes
+INCOMING_FOLDER_NAME = ".incoming"  # Staging area for files whose hash is not known yet
+
+
+def reserve_unique_path(folder, filename, taken=()):
+    """
+    Returns a path in `folder` for `filename` that does not exist yet, appending
+    _1, _2, ... to the base name on collision. The file is created empty so that
+    a concurrent writer cannot claim the same name.
+
+    Names in `taken` are skipped as well: detection empties received_images/event_X,
+    so the folder alone does not show which names the event's manifest already holds.
+    """
+    base, extension = os.path.splitext(filename)
+    file_path = os.path.join(folder, filename)
+    counter = 1
+    while True:
+        if os.path.basename(file_path) in taken:
+            file_path = os.path.join(folder, f"{base}_{counter}{extension}")
+            counter += 1
+            continue
+        try:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            os.close(fd)
+            return file_path
+        except FileExistsError:
+            file_path = os.path.join(folder, f"{base}_{counter}{extension}")
+            counter += 1
+
+
+def incoming_path(upload_directory, event_id):
+    """
+    Returns a fresh staging path for one incoming file of an event.
+    Staged files live outside received_images/event_X so no stage ever sees a
+    file before its content hash has been checked.
+    """
+    folder = os.path.join(upload_directory, INCOMING_FOLDER_NAME, f"event_{event_id}")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{uuid.uuid4().hex}.part")
+
+
+def commit_staged_file(staged_path, folder, filename, taken=()):
+    """
+    Moves a staged file into `folder` under `filename`, or under a _1, _2, ...
+    variant if that name is already taken (in the folder or in `taken`).
+    Returns the final path.
+    """
+    file_path = reserve_unique_path(folder, filename, taken)
+    os.replace(staged_path, file_path)
+    return file_path
+
+
+def session_folder(upload_directory, session_id):
+    """Returns the staging folder that holds the partial files of a chunked upload session."""
+    return os.path.join(upload_directory, INCOMING_FOLDER_NAME, f"session_{session_id}")
+
+
+def session_part_path(upload_directory, session_id, sha256):
+    """
+    Returns where the partial data of one file in a chunked upload session is kept.
+    Parts are named after the expected content hash, never after client input.
+    """
+    folder = session_folder(upload_directory, session_id)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{sha256}.part")
+
+
+def current_offset(part_path):
+    """Returns how many bytes of a session file have been received so far."""
+    try:
+        return os.path.getsize(part_path)
+    except FileNotFoundError:
+        return 0
+
+
+def hash_file(file_path, chunk_size=CHUNK_SIZE):
+    """Returns the SHA-256 hex digest of a file on disk. Blocking."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+FICLONE = 0x40049409  # Linux ioctl: share the source file's extents (btrfs, XFS, ...)
+
+
+def is_under_roots(path, roots):
+    """True if the real path of `path` lies inside one of the allowed root folders."""
+    real_path = os.path.realpath(path)
+    for root in roots:
+        real_root = os.path.realpath(root)
+        if os.path.commonpath([real_path, real_root]) == real_root:
+            return True
+    return False
+
+
+def link_or_clone(source_path, target_path):
+    """
+    Makes `target_path` refer to the bytes of `source_path` without copying them:
+    a hardlink when both paths are on the same filesystem, otherwise a reflink
+    where the filesystem supports it.
+
+    Returns:
+        str: 'hardlink' or 'reflink'.
+
+    Raises:
+        OSError: If neither is possible; the caller must fall back to uploading.
+    """
+    try:
+        os.link(source_path, target_path)
+        return "hardlink"
+    except OSError as link_error:
+        try:
+            import fcntl
+        except ImportError:  # Windows: no reflink support
+            raise link_error
+        with open(source_path, "rb") as src, open(target_path, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                dst.close()
+                os.remove(target_path)
+                raise link_error
+        return "reflink"
+
+
+def write_stream_to_file(source, file_path, chunk_size=CHUNK_SIZE):
+    """
+    Copies a binary file-like object to `file_path` in fixed-size chunks,
+    hashing the content on the way through.
+    Blocking; call it from a worker thread, never from the event loop.
+    The data is flushed to the OS but not fsync'd, see fsync_files().
+
+    Returns:
+        tuple: (bytes written, SHA-256 hex digest of the content)
+    """
+    written = 0
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            digest.update(chunk)
+            written += len(chunk)
+    return written, digest.hexdigest()
+
+
+def fsync_files(file_paths, folder=None):
+    """
+    Forces a batch of already written files to stable storage, then syncs the
+    containing folder so the new directory entries survive a crash too.
+    Blocking; call it from a worker thread.
+    """
+    for file_path in file_paths:
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except OSError as e:
+            print(f"⚠️ Could not open {file_path} for fsync: {e}")
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    if folder and hasattr(os, "O_DIRECTORY"):  # Directory fsync is not available on Windows
+        fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import traceback
+from multiprocessing.connection import Listener, Client
+
+AUTHKEY_ENV = "FDRP_WORKER_AUTHKEY"
+ADDRESS_FILE_ENV = "FDRP_WORKER_ADDRESS_FILE"
+
+
+def current_rss_mb():
+    """Resident memory of this process in MiB, or 0 where it cannot be read cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # Peak instead of current RSS, but good enough as a leak guard
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:  # Windows
+        return 0
+
+
+class WarmWorker:
+    """
+    Client side of a long-lived worker process that keeps a model loaded
+    between jobs.
+
+    The worker script is started once and listens on a local multiprocessing
+    connection (127.0.0.1, random port, random auth key) once its model is
+    loaded; it publishes the port through a temp file.
+    Jobs are plain dicts; run() sends one and blocks for the reply. The worker
+    exits on its own after `max_jobs` jobs or above `max_rss_mb` MiB of
+    memory, and the next run() transparently starts a fresh one.
+
+    Args:
+        script (str): Path of the worker entry script, e.g. "FDRP-Workers/retinaface_server.py".
+        max_jobs (int): Jobs served before the worker recycles itself.
+        max_rss_mb (int): Memory threshold after which the worker recycles itself (0 disables it).
+    """
+
+    def __init__(self, script, max_jobs=50, max_rss_mb=0, start_timeout=600):
+        self.script = script
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.start_timeout = start_timeout  # Model loading can take a while on first start
+        self.process = None
+        self.conn = None
+
+    def _start(self):
+        authkey = os.urandom(16)
+        fd, address_file = tempfile.mkstemp(prefix="fdrp-worker-", suffix=".addr")
+        os.close(fd)
+        os.remove(address_file)  # The worker creates it once it is listening
+        env = dict(os.environ)
+        env[AUTHKEY_ENV] = authkey.hex()
+        env[ADDRESS_FILE_ENV] = address_file
+        env["FDRP_WORKER_MAX_JOBS"] = str(self.max_jobs)
+        env["FDRP_WORKER_MAX_RSS_MB"] = str(self.max_rss_mb)
+        print(f"[WARM-WORKER] Starting {self.script}...")
+        started = time.monotonic()
+        # Output is not captured, so the worker's logs show up in this window as they happen
+        self.process = subprocess.Popen([sys.executable, self.script], env=env)
+        try:
+            while not os.path.exists(address_file):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.script} exited during startup (exit code {self.process.returncode}).")
+                if time.monotonic() - started > self.start_timeout:
+                    self.process.kill()
+                    raise RuntimeError(f"{self.script} was not ready within {self.start_timeout}s.")
+                time.sleep(0.2)
+            with open(address_file) as f:
+                port = int(f.read())
+            self.conn = Client(("127.0.0.1", port), authkey=authkey)
+        except Exception:
+            self.process.wait()
+            self.process = None
+            raise
+        finally:
+            if os.path.exists(address_file):
+                os.remove(address_file)
+        print(f"[WARM-WORKER] {self.script} ready (PID {self.process.pid}) after "
+              f"{time.monotonic() - started:.1f}s")
+
+    def _stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def run(self, job):
+        """
+        Sends one job to the worker and returns its result.
+
+        Raises:
+            RuntimeError: If the job failed in the worker or the worker died.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self._stop()
+            self._start()
+        try:
+            self.conn.send(job)
+            reply = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self._stop()
+            raise RuntimeError(f"Worker exited while running a job: {e!r}")
+
+        if reply.get("recycle"):
+            print(f"[WARM-WORKER] Worker is recycling: {reply['recycle']}")
+            self._stop()
+        if not reply.get("ok"):
+            raise RuntimeError(f"Worker job failed: {reply.get('error')}")
+        return reply.get("result")
+
+    def abort(self):
+        """
+        Kills the worker process; safe to call from another thread. A run() in
+        progress raises RuntimeError, and the next run() starts a fresh worker.
+        """
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)  # Asks the worker to exit
+            except OSError:
+                pass
+        self._stop()
+
+
+def serve_jobs(handle_job):
+    """
+    Worker side of WarmWorker: accepts the manager's connection and runs
+    `handle_job(job)` for each job until told to stop or until it is time
+    to recycle. Call it from the worker script after loading the model.
+    """
+    authkey = bytes.fromhex(os.environ[AUTHKEY_ENV])
+    address_file = os.environ[ADDRESS_FILE_ENV]
+    max_jobs = int(os.environ.get("FDRP_WORKER_MAX_JOBS", 50))
+    max_rss_mb = float(os.environ.get("FDRP_WORKER_MAX_RSS_MB", 0))
+
+    with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        # Write-then-rename so the manager never reads a half-written port
+        with open(address_file + ".tmp", "w") as f:
+            f.write(str(listener.address[1]))
+        os.replace(address_file + ".tmp", address_file)
+        conn = listener.accept()
+    jobs_done = 0
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break  # Manager went away
+            if job is None:
+                break
+
+            try:
+                reply = {"ok": True, "result": handle_job(job)}
+            except Exception as e:
+                traceback.print_exc()
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            jobs_done += 1
+
+            rss_mb = current_rss_mb()
+            if jobs_done >= max_jobs:
+                reply["recycle"] = f"served {jobs_done} jobs"
+            elif max_rss_mb and rss_mb >= max_rss_mb:
+                reply["recycle"] = f"RSS {rss_mb:.0f} MiB >= {max_rss_mb:.0f} MiB"
+            conn.send(reply)
+            if "recycle" in reply:
+                break
+    finally:
+        conn.close()
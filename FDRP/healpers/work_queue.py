@@ -0,0 +1,405 @@
+import os
+import time
+import uuid
+import socket
+import threading
+from contextlib import contextmanager
+from healpers.db_helper import get_db_connection, init_deepface_jobs_table
+
+# Each stage moves an event from its ready status, through a running status
+# while a worker holds the lease, to the next stage's ready status:
+#   unsorted -> cropping -> cropped -> embedding -> emb_ext -> sorting -> sorted
+# (with FDRP_FUSED_PIPELINE=1 the cropping stage embeds too and moves events straight to emb_ext)
+WAITER_STALE_AFTER = 120  # Seconds without a refresh before a waiter stops receiving wakeups
+
+
+def notify_waiters(status, db_path='database.db'):
+    """
+    Wakes the idle workers waiting for jobs in `status`. Call it after making
+    jobs visible in that status. Wakeups are hints only; a lost datagram just
+    means the worker notices the job on its next poll.
+    """
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT port FROM queue_waiters
+        WHERE status = ? AND last_seen > ?
+    """, (status, time.time() - WAITER_STALE_AFTER))
+    ports = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for port in ports:
+            try:
+                sock.sendto(status.encode("utf-8"), ("127.0.0.1", port))
+            except OSError:
+                pass  # Waiter went away; its row goes stale on its own
+
+
+class LeaseLost(RuntimeError):
+    """Raised by Job.check() once the job's lease was lost; the job must not be finished."""
+
+
+class Job:
+    """
+    A claimed deepface_jobs row. `lost` becomes True once the worker no longer
+    holds the lease (it expired and another worker took the job over); handlers
+    call check() between images and stages to stop working on it.
+    """
+
+    def __init__(self, event_id, attempts, worker_id):
+        self.event_id = event_id
+        self.attempts = attempts
+        self.worker_id = worker_id
+        self.lost_event = threading.Event()
+        self._aborts = []
+        self._lock = threading.Lock()
+
+    @property
+    def lost(self):
+        return self.lost_event.is_set()
+
+    def mark_lost(self):
+        """Flags the lease as lost and runs the abort callbacks of aborting() blocks."""
+        with self._lock:
+            if self.lost_event.is_set():
+                return
+            self.lost_event.set()
+            aborts = list(self._aborts)
+        for abort in aborts:
+            try:
+                abort()
+            except Exception as e:
+                print(f"⚠️ Could not abort work on event {self.event_id}: {e}")
+
+    def check(self):
+        """Raises LeaseLost if the lease was lost."""
+        if self.lost:
+            raise LeaseLost(f"Lease on event {self.event_id} was lost")
+
+    @contextmanager
+    def aborting(self, abort):
+        """
+        Calls `abort()` (from the heartbeat thread) if the lease is lost while the
+        block runs, e.g. to kill the subprocess doing the work. Raises LeaseLost
+        when the block ends, or fails because it was aborted, with the lease lost.
+        """
+        with self._lock:
+            self._aborts.append(abort)
+        try:
+            self.check()
+            yield
+        except Exception as e:
+            if self.lost and not isinstance(e, LeaseLost):
+                raise LeaseLost(f"Lease on event {self.event_id} was lost") from e
+            raise
+        finally:
+            with self._lock:
+                self._aborts.remove(abort)
+        self.check()
+
+    def __repr__(self):
+        return f"Job(event_id={self.event_id}, attempts={self.attempts}, worker={self.worker_id})"
+
+
+class WorkQueue:
+    """
+    One stage of the FDRP pipeline as a durable queue on deepface_jobs.
+
+    Claims are atomic (BEGIN IMMEDIATE), so any number of workers, in one
+    process or many, can pull from the same stage without taking the same
+    event twice. A claim is a lease: the worker must heartbeat before
+    `visibility_timeout` runs out, otherwise the job becomes visible again
+    and another worker picks it up (e.g. after a crash). Jobs that keep
+    failing are moved to `failed_status` after `max_attempts` claims.
+    A job flagged with rerun while it ran (new images arrived, see
+    enqueue_upload_batch) goes to `rerun_status` when it is released.
+
+    Args:
+        ready_status (str): Status of jobs waiting for this stage, e.g. 'unsorted'.
+        running_status (str): Status while a worker holds the job, e.g. 'cropping'.
+        failed_status (str): Status for jobs that used up their attempts.
+        rerun_status (str): Status that starts the pipeline over for a flagged job.
+    """
+
+    def __init__(self, ready_status, running_status, failed_status, db_path='database.db',
+                 visibility_timeout=300, max_attempts=3, retry_delay=30, poll_interval=30,
+                 rerun_status='unsorted'):
+        self.ready_status = ready_status
+        self.running_status = running_status
+        self.failed_status = failed_status
+        self.rerun_status = rerun_status
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval  # Fallback poll, also picks up expired leases
+        init_deepface_jobs_table(db_path)
+
+    def _connect(self):
+        conn = get_db_connection(self.db_path)
+        conn.isolation_level = None  # Transactions are managed explicitly below
+        return conn
+
+    def claim(self, worker_id):
+        """
+        Atomically takes the oldest visible job of this stage.
+
+        Returns:
+            Job or None: The claimed job, or None if nothing is ready.
+        """
+        conn = self._connect()
+        try:
+            while True:
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")  # Write lock: no other claimer can read the same row now
+                row = conn.execute("""
+                    SELECT event_id, COALESCE(attempts, 0)
+                    FROM deepface_jobs
+                    WHERE (status = ? AND (lease_expires_at IS NULL OR lease_expires_at <= ?))
+                       OR (status = ? AND lease_expires_at <= ?)
+                    ORDER BY event_id
+                    LIMIT 1
+                """, (self.ready_status, now, self.running_status, now)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                event_id, attempts = row
+                if attempts >= self.max_attempts:
+                    conn.execute("""
+                        UPDATE deepface_jobs
+                        SET status = ?, claimed_by = NULL, lease_expires_at = NULL
+                        WHERE event_id = ?
+                    """, (self.failed_status, event_id))
+                    conn.execute("COMMIT")
+                    print(f"❌ Event {event_id} failed {attempts} time(s) in '{self.running_status}', "
+                          f"marked '{self.failed_status}'.")
+                    continue
+
+                conn.execute("""
+                    UPDATE deepface_jobs
+                    SET status = ?, claimed_by = ?, lease_expires_at = ?, attempts = ?
+                    WHERE event_id = ?
+                """, (self.running_status, worker_id, now + self.visibility_timeout, attempts + 1, event_id))
+                conn.execute("COMMIT")
+                return Job(event_id, attempts + 1, worker_id)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update_owned(self, job, sql, params):
+        """Runs an UPDATE that only applies while `job` still holds its lease. Returns True if it did."""
+        conn = get_db_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(sql + " WHERE event_id = ? AND status = ? AND claimed_by = ?",
+                       (*params, job.event_id, self.running_status, job.worker_id))
+        conn.commit()
+        owned = cursor.rowcount == 1
+        conn.close()
+        if not owned:
+            job.mark_lost()
+        return owned
+
+    def heartbeat(self, job):
+        """Extends the lease of a running job. Returns False if the lease was lost."""
+        return self._update_owned(job, """
+            UPDATE deepface_jobs SET lease_expires_at = ?
+        """, (time.time() + self.visibility_timeout,))
+
+    def _release(self, job, status, lease_expires_at=None, reset_attempts=False):
+        """
+        Gives up the lease of `job`, moving it to `status`, or to `rerun_status`
+        (visible at once, attempts reset) if it was flagged with rerun meanwhile.
+        Wakes the workers of the new status if the job is visible at once.
+
+        Returns:
+            str or None: The status the job moved to, or None if the lease was lost.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+                SELECT COALESCE(rerun, 0)
+                FROM deepface_jobs
+                WHERE event_id = ? AND status = ? AND claimed_by = ?
+            """, (job.event_id, self.running_status, job.worker_id)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                job.mark_lost()
+                return None
+            rerun = row[0] == 1
+            if rerun:
+                status, lease_expires_at, reset_attempts = self.rerun_status, None, True
+            conn.execute("""
+                UPDATE deepface_jobs
+                SET status = ?, claimed_by = NULL, lease_expires_at = ?, rerun = 0,
+                    attempts = CASE WHEN ? THEN 0 ELSE attempts END
+                WHERE event_id = ?
+            """, (status, lease_expires_at, reset_attempts, job.event_id))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if rerun:
+            print(f"🔁 Event {job.event_id} received new images while in '{self.running_status}', "
+                  f"moved back to '{status}'.")
+        if lease_expires_at is None:
+            notify_waiters(status, self.db_path)
+        return status
+
+    def complete(self, job, next_status):
+        """
+        Hands a finished job to the next stage (or back to `rerun_status`, see
+        _release) and wakes its workers. Returns False (and changes nothing) if
+        the lease was lost in the meantime, e.g. because it expired and another
+        worker took the job over.
+        """
+        done = self._release(job, next_status, reset_attempts=True) is not None
+        if not done:
+            print(f"⚠️ Lost the lease on event {job.event_id}; result not recorded.")
+        return done
+
+    def fail(self, job, final=False):
+        """
+        Gives a job back after an error. It becomes visible again after
+        `retry_delay`, or goes straight to `failed_status` if `final` is True.
+        Returns False if the lease was lost in the meantime.
+        """
+        if final:
+            return self._release(job, self.failed_status) is not None
+        return self._release(job, self.ready_status, time.time() + self.retry_delay) is not None
+
+    @contextmanager
+    def lease(self, job):
+        """
+        Heartbeats `job` from a background thread for the duration of the block.
+        A failed heartbeat marks the job lost (see Job.mark_lost), which aborts
+        the work in progress.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.visibility_timeout / 3):
+                if not self.heartbeat(job):
+                    print(f"⚠️ Lease on event {job.event_id} was lost while processing, aborting.")
+                    return
+
+        thread = threading.Thread(target=beat, name=f"lease-{job.event_id}", daemon=True)
+        thread.start()
+        try:
+            yield job
+        finally:
+            stop.set()
+            thread.join()
+
+    def _seconds_until_visible(self):
+        """Time until the next delayed retry or expiring lease of this stage becomes claimable."""
+        conn = get_db_connection(self.db_path)
+        row = conn.execute("""
+            SELECT MIN(lease_expires_at)
+            FROM deepface_jobs
+            WHERE status IN (?, ?) AND lease_expires_at IS NOT NULL
+        """, (self.ready_status, self.running_status)).fetchone()
+        conn.close()
+        if row[0] is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(row[0] - time.time(), 0.05))
+
+    def wait_for_job(self, worker_id):
+        """
+        Blocks until a job can be claimed and returns it. Idle workers sleep on
+        a localhost UDP socket and are woken by notify_waiters(), or when the
+        next retry or expired lease is due; the poll interval only covers lost wakeups.
+        """
+        with _Waiter(self.ready_status, self.db_path) as waiter:
+            while True:
+                job = self.claim(worker_id)
+                if job is not None:
+                    return job
+                waiter.wait(self._seconds_until_visible())
+
+    def run_workers(self, handler, count=1, name=None):
+        """
+        Runs `count` worker threads that claim jobs forever and call
+        `handler(job)` for each one. The handler returns the next status
+        on success, or raises to have the job retried. It calls job.check()
+        between images and stages, so a job whose lease was lost is
+        abandoned (LeaseLost) instead of finished twice. Blocks the caller.
+        """
+        name = name or self.running_status
+        threads = []
+        for index in range(count):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{name}-{index}"
+            thread = threading.Thread(target=self._worker_loop, args=(handler, worker_id),
+                                      name=f"{name}-{index}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        print(f"🚀 {count} '{name}' worker(s) waiting for '{self.ready_status}' events")
+        for thread in threads:
+            thread.join()
+
+    def _worker_loop(self, handler, worker_id):
+        while True:
+            job = self.wait_for_job(worker_id)
+            print(f"[{worker_id}] Processing event_id: {job.event_id} (attempt {job.attempts})")
+            try:
+                with self.lease(job):
+                    next_status = handler(job)
+            except LeaseLost as e:
+                print(f"[{worker_id}] ⚠️ {e}; abandoned to the worker that took it over.")
+                continue
+            except Exception as e:
+                print(f"[{worker_id}] ❌ Event {job.event_id} failed: {e}")
+                self.fail(job)
+                continue
+            self.complete(job, next_status)
+
+
+class _Waiter:
+    """A localhost UDP socket registered in queue_waiters for one ready status."""
+
+    def __init__(self, status, db_path):
+        self.status = status
+        self.db_path = db_path
+        self.waiter_id = uuid.uuid4().hex
+        self.sock = None
+
+    def __enter__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self._register()
+        return self
+
+    def _register(self):
+        conn = get_db_connection(self.db_path)
+        conn.execute("""
+            INSERT OR REPLACE INTO queue_waiters (waiter_id, status, port, last_seen)
+            VALUES (?, ?, ?, ?)
+        """, (self.waiter_id, self.status, self.sock.getsockname()[1], time.time()))
+        conn.commit()
+        conn.close()
+
+    def wait(self, timeout):
+        self._register()  # Keeps the row fresh while we idle
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.recv(64)
+            self.sock.setblocking(False)
+            while True:  # Several wakeups count as one
+                self.sock.recv(64)
+        except (socket.timeout, BlockingIOError, OSError):
+            pass
+
+    def __exit__(self, *exc):
+        conn = get_db_connection(self.db_path)
+        conn.execute("DELETE FROM queue_waiters WHERE waiter_id = ?", (self.waiter_id,))
+        conn.commit()
+        conn.close()
+        self.sock.close()
@@ -1,16 +1,34 @@
 import os
 import shutil
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.responses import JSONResponse
 from typing import List
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from healpers.db_helper import insert_event_into_deepface_jobs, update_event_status, init_deepface_jobs_table
+from fastapi.concurrency import run_in_threadpool
+from healpers.db_helper import (
+    enqueue_upload_batch, init_deepface_jobs_table, get_manifest_hashes, get_manifest_names,
+    open_upload_session, get_upload_session, close_upload_session,
+    set_event_debug_artifacts, get_event_debug_artifacts
+)
+from healpers.ingest_queue import IngestGate, IngestQueueFull
+from healpers.work_queue import notify_waiters
+from healpers.upload_helper import (
+    incoming_path, commit_staged_file, write_stream_to_file, fsync_files, FSYNC_BATCH_SIZE,
+    session_folder, session_part_path, current_offset, hash_file, is_under_roots, link_or_clone
+)
 from match_face import find_best_match
 import base64
+import traceback
 
 # --- Configuration ---
 UPLOAD_DIRECTORY = "received_images"
 OUTPUT_DIRECTORY = "user_data"
+MAX_CONCURRENT_INGESTS = int(os.environ.get("FDRP_MAX_CONCURRENT_INGESTS", 4))  # Events written at the same time
+MAX_QUEUED_INGESTS = int(os.environ.get("FDRP_MAX_QUEUED_INGESTS", 16))  # Uploads allowed to wait before 429
+# Folders the Flask app may hand images over from by path (same host only), separated by os.pathsep.
+# Empty disables /handoff-images/.
+HANDOFF_ROOTS = [root for root in os.environ.get("FDRP_HANDOFF_ROOTS", "").split(os.pathsep) if root]
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
 init_deepface_jobs_table()
@@ -25,8 +43,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- Global Status ---
-app.state.status = "idle"  # Can be "idle" or "processing"
+# --- Ingest Admission ---
+# Per-event locking with a bounded queue: different events ingest concurrently,
+# only uploads for the same event are serialized.
+app.state.ingest_gate = IngestGate(max_active=MAX_CONCURRENT_INGESTS, max_waiting=MAX_QUEUED_INGESTS)
 
 @app.get("/", tags=["Status"])
 async def read_root():
@@ -36,9 +56,13 @@ async def read_root():
 @app.get("/status", tags=["Status"])
 async def get_status():
     """
-    Returns the current processing status of the API.
+    Returns the current processing status of the API, including ingest queue depth and wait times.
     """
-    return {"status": app.state.status}
+    ingest = app.state.ingest_gate.snapshot()
+    return {
+        "status": "processing" if ingest["active_count"] else "idle",
+        "ingest": ingest,
+    }
 
 
 @app.post("/upload-images/", tags=["Image Upload"])
@@ -46,65 +70,437 @@ async def upload_multiple_images(
     event_id: int = Form(..., description="Event ID this image belongs to"),
     images: List[UploadFile] = File(..., description="Select multiple image files to upload")
 ):
-    if app.state.status == "processing":
-        raise HTTPException(status_code=429, detail="Server is busy processing. Try again later.")
-
-    app.state.status = "processing"
     try:
-        if not images:
-            raise HTTPException(status_code=400, detail="No files were sent.")
+        async with app.state.ingest_gate.admit(event_id) as waited:
+            if waited > 0.01:
+                print(f"⏳ Event {event_id} waited {waited:.2f}s in the ingest queue")
+            return await _ingest_event_images(event_id, images)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"{e} Try again later.")
 
-        print(f"📥 Received {len(images)} image(s) for event ID: {event_id}")
-        saved_files = []
-        errors = []
 
-        # Create event-specific subdirectory
-        event_folder = os.path.join(UPLOAD_DIRECTORY, f"event_{event_id}")
-        os.makedirs(event_folder, exist_ok=True)
+async def _ingest_event_images(event_id, images):
+    """
+    Saves one upload batch into received_images/event_<event_id>.
+    Must be called while holding the event's ingest slot.
+    """
+    if not images:
+        raise HTTPException(status_code=400, detail="No files were sent.")
 
-        for image in images:
-            if not image.filename:
-                errors.append({"filename": None, "error": "No filename found."})
-                continue
+    print(f"📥 Received {len(images)} image(s) for event ID: {event_id}")
+    saved_files = []
+    skipped_duplicates = []
+    manifest_rows = []
+    errors = []
+
+    # Create event-specific subdirectory
+    event_folder = os.path.join(UPLOAD_DIRECTORY, f"event_{event_id}")
+    await run_in_threadpool(os.makedirs, event_folder, exist_ok=True)
+
+    # Content and names already held for this event (including images past detection)
+    known_hashes = await run_in_threadpool(get_manifest_hashes, event_id)
+    taken_names = await run_in_threadpool(get_manifest_names, event_id)
 
-            filename = os.path.basename(image.filename)
-            file_path = os.path.join(event_folder, filename)
+    # All disk I/O runs in the thread pool so /status and /match-face/ stay responsive
+    unsynced_paths = []
+    for image in images:
+        if not image.filename:
+            errors.append({"filename": None, "error": "No filename found."})
+            continue
+
+        filename = os.path.basename(image.filename)
+        staged_path = None
+        try:
+            # Stream into a staging file first; the hash decides whether we keep it
+            staged_path = await run_in_threadpool(incoming_path, UPLOAD_DIRECTORY, event_id)
+            size, sha256 = await run_in_threadpool(write_stream_to_file, image.file, staged_path)
+
+            if sha256 in known_hashes:
+                await run_in_threadpool(os.remove, staged_path)
+                skipped_duplicates.append({"filename": filename, "existing_filename": known_hashes[sha256]})
+                print(f"♻️ Skipped duplicate: {filename} (same content as {known_hashes[sha256]})")
+                continue
 
             # Prevent overwriting if filename already exists
-            base, extension = os.path.splitext(filename)
-            counter = 1
-            while os.path.exists(file_path):
-                file_path = os.path.join(event_folder, f"{base}_{counter}{extension}")
-                counter += 1
+            file_path = await run_in_threadpool(commit_staged_file, staged_path, event_folder, filename, taken_names)
+            saved_name = os.path.basename(file_path)
+            known_hashes[sha256] = saved_name
+            taken_names.add(saved_name)
+            saved_files.append(saved_name)
+            manifest_rows.append({"file_name": saved_name, "size_bytes": size, "sha256": sha256})
+            unsynced_paths.append(file_path)
+            print(f"✅ Saved: {file_path} ({size} bytes)")
+        except Exception as e:
+            print(f"❌ Error saving {filename}: {e}")
+            errors.append({"filename": filename, "error": str(e)})
+            if staged_path and os.path.exists(staged_path):
+                await run_in_threadpool(os.remove, staged_path)  # Drop the partial file
+        finally:
+            await image.close()
+
+        # fsync in batches instead of once per file
+        if len(unsynced_paths) >= FSYNC_BATCH_SIZE:
+            await run_in_threadpool(fsync_files, unsynced_paths)
+            unsynced_paths = []
+
+    if not saved_files and not skipped_duplicates:
+        raise HTTPException(status_code=400, detail="No files saved. Check errors.")
+
+    if saved_files:
+        await run_in_threadpool(fsync_files, unsynced_paths, event_folder)
+        # One job row + the whole manifest in a single transaction, only once the files are durable
+        await run_in_threadpool(enqueue_upload_batch, event_id, manifest_rows)
+        await run_in_threadpool(notify_waiters, "unsorted")  # Wake idle RetinaFace workers
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "message": f"Uploaded {len(saved_files)} file(s) for event ID {event_id}, "
+                       f"skipped {len(skipped_duplicates)} duplicate(s).",
+            "event_id": event_id,
+            "saved_filenames": saved_files,
+            "skipped_duplicates": skipped_duplicates,
+            "upload_errors": errors if errors else "None"
+        }
+    )
+
+
+class ManifestFile(BaseModel):
+    file_name: str
+    sha256: str
+    size_bytes: int = 0
+
+
+class UploadManifest(BaseModel):
+    event_id: int
+    files: List[ManifestFile]
+
+
+@app.post("/upload-manifest/", tags=["Image Upload"])
+async def compare_upload_manifest(manifest: UploadManifest):
+    """
+    Compares the sender's manifest with the images already held for the event.
+    The sender only needs to upload the files listed under 'missing'.
+    """
+    known_hashes = await run_in_threadpool(get_manifest_hashes, manifest.event_id)
+    missing = [f.file_name for f in manifest.files if f.sha256 not in known_hashes]
+    present = [f.file_name for f in manifest.files if f.sha256 in known_hashes]
+    return {
+        "event_id": manifest.event_id,
+        "missing": missing,
+        "present": present,
+    }
+
+
+class HandoffFile(BaseModel):
+    file_name: str
+    path: str
+    sha256: str
+    size_bytes: int
+
+
+class HandoffManifest(BaseModel):
+    event_id: int
+    files: List[HandoffFile]
+
+
+def _link_handoff_files(event_id, files):
+    """
+    Hardlinks/reflinks the handed-over files into received_images/event_X.
+    The sender's hashes are trusted for deduplication; sizes are checked.
+    Blocking; runs in the thread pool.
+    """
+    event_folder = os.path.join(UPLOAD_DIRECTORY, f"event_{event_id}")
+    os.makedirs(event_folder, exist_ok=True)
+    known_hashes = get_manifest_hashes(event_id)
+    taken_names = get_manifest_names(event_id)
+
+    saved_files = []
+    manifest_rows = []
+    saved_paths = []
+    skipped_duplicates = []
+    failed = []
+    for f in files:
+        if f.sha256 in known_hashes:
+            skipped_duplicates.append({"filename": f.file_name, "existing_filename": known_hashes[f.sha256]})
+            continue
+        if not is_under_roots(f.path, HANDOFF_ROOTS):
+            failed.append({"file_name": f.file_name, "error": "Path is outside FDRP_HANDOFF_ROOTS."})
+            continue
+        try:
+            if os.path.getsize(f.path) != f.size_bytes:
+                failed.append({"file_name": f.file_name, "error": "Size does not match the manifest."})
+                continue
+            staged_path = incoming_path(UPLOAD_DIRECTORY, event_id)
+            method = link_or_clone(f.path, staged_path)
+            file_path = commit_staged_file(staged_path, event_folder, os.path.basename(f.file_name), taken_names)
+        except OSError as e:
+            failed.append({"file_name": f.file_name, "error": str(e)})
+            continue
+        saved_name = os.path.basename(file_path)
+        known_hashes[f.sha256] = saved_name
+        taken_names.add(saved_name)
+        saved_files.append(saved_name)
+        saved_paths.append(file_path)
+        manifest_rows.append({"file_name": saved_name, "size_bytes": f.size_bytes, "sha256": f.sha256})
+        print(f"🔗 Linked ({method}): {file_path}")
+
+    if saved_files:
+        fsync_files([], event_folder)  # Data is already durable on the sender's side; only the entries are new
+        enqueue_upload_batch(event_id, manifest_rows)
+        notify_waiters("unsorted")  # Wake idle RetinaFace workers
+    return saved_files, skipped_duplicates, failed
+
+
+@app.post("/handoff-images/", tags=["Image Upload"])
+async def handoff_images(manifest: HandoffManifest):
+    """
+    Zero-copy ingest for a Flask app on the same host: the request carries only
+    file paths, which are hardlinked (or reflinked) into the event folder.
+    Files that cannot be linked are returned under 'failed' so the sender can
+    upload them the normal way.
+    """
+    if not HANDOFF_ROOTS:
+        raise HTTPException(status_code=403, detail="Shared-storage handoff is disabled (FDRP_HANDOFF_ROOTS is empty).")
+    try:
+        async with app.state.ingest_gate.admit(manifest.event_id):
+            saved_files, skipped_duplicates, failed = await run_in_threadpool(
+                _link_handoff_files, manifest.event_id, manifest.files
+            )
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"{e} Try again later.")
 
+    return {
+        "message": f"Linked {len(saved_files)} file(s) for event ID {manifest.event_id}, "
+                   f"skipped {len(skipped_duplicates)} duplicate(s), {len(failed)} failed.",
+        "event_id": manifest.event_id,
+        "saved_filenames": saved_files,
+        "skipped_duplicates": skipped_duplicates,
+        "failed": failed,
+    }
+
+
+# --- Resumable chunked uploads ---
+# 1. POST /upload-sessions/                  -> open (or resume) the event's session, get per-file offsets
+# 2. PUT  /upload-sessions/{id}/files/{name} -> append raw bytes at ?offset=N
+# 3. POST /upload-sessions/{id}/finalize     -> verify hashes, move files into place, enqueue the event
+
+def _session_file_offsets(session_id, files):
+    """Adds the number of bytes received so far to each session file. Blocking."""
+    result = []
+    for f in files:
+        offset = current_offset(session_part_path(UPLOAD_DIRECTORY, session_id, f["sha256"]))
+        result.append({
+            "file_name": f["file_name"],
+            "size_bytes": f["size_bytes"],
+            "offset": offset,
+            "complete": offset >= f["size_bytes"],
+        })
+    return result
+
+
+@app.post("/upload-sessions/", tags=["Chunked Upload"])
+async def open_chunked_upload(manifest: UploadManifest):
+    """
+    Opens the upload session of an event, or returns the open one after an
+    interrupted transfer. Files the event already holds are listed under
+    'present' and must not be sent again.
+    """
+    known_hashes = await run_in_threadpool(get_manifest_hashes, manifest.event_id)
+    needed = [
+        {"file_name": f.file_name, "size_bytes": f.size_bytes, "sha256": f.sha256}
+        for f in manifest.files if f.sha256 not in known_hashes
+    ]
+    present = [f.file_name for f in manifest.files if f.sha256 in known_hashes]
+
+    session_id = await run_in_threadpool(open_upload_session, manifest.event_id, needed)
+    files = await run_in_threadpool(_session_file_offsets, session_id, needed)
+    return {
+        "session_id": session_id,
+        "event_id": manifest.event_id,
+        "files": files,
+        "present": present,
+    }
+
+
+@app.get("/upload-sessions/{session_id}", tags=["Chunked Upload"])
+async def get_chunked_upload(session_id: str):
+    session = await run_in_threadpool(get_upload_session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    files = await run_in_threadpool(_session_file_offsets, session_id, session["files"])
+    return {
+        "session_id": session_id,
+        "event_id": session["event_id"],
+        "status": session["status"],
+        "files": files,
+    }
+
+
+@app.put("/upload-sessions/{session_id}/files/{file_name}", tags=["Chunked Upload"])
+async def upload_chunk(session_id: str, file_name: str, request: Request, offset: int = 0):
+    """
+    Appends the raw request body to one file of the session, starting at `offset`.
+    A mismatching offset returns 409 with the offset the server expects.
+    """
+    session = await run_in_threadpool(get_upload_session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}.")
+    entry = next((f for f in session["files"] if f["file_name"] == file_name), None)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="File is not part of this upload session.")
+
+    try:
+        async with app.state.ingest_gate.admit(session["event_id"]):
+            # A finalize that held the slot meanwhile has closed the session and removed its folder
+            session = await run_in_threadpool(get_upload_session, session_id)
+            if session["status"] != "open":
+                raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}.")
+            part_path = await run_in_threadpool(session_part_path, UPLOAD_DIRECTORY, session_id, entry["sha256"])
+            expected = await run_in_threadpool(current_offset, part_path)
+            if offset != expected:
+                return JSONResponse(
+                    status_code=409,
+                    content={"error": "Offset mismatch.", "file_name": file_name, "offset": expected}
+                )
+
+            written = 0
+            part_file = await run_in_threadpool(open, part_path, "ab")
             try:
-                with open(file_path, "wb") as f:
-                    shutil.copyfileobj(image.file, f)
-                saved_files.append(os.path.basename(file_path))
-                insert_event_into_deepface_jobs(event_id)
-                print(f"✅ Saved: {file_path}")
-            except Exception as e:
-                print(f"❌ Error saving {filename}: {e}")
-                errors.append({"filename": filename, "error": str(e)})
+                async for chunk in request.stream():
+                    if expected + written + len(chunk) > entry["size_bytes"]:
+                        raise HTTPException(status_code=400, detail="Chunk runs past the declared file size.")
+                    await run_in_threadpool(part_file.write, chunk)
+                    written += len(chunk)
             finally:
-                await image.close()
+                await run_in_threadpool(part_file.close)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"{e} Try again later.")
 
-        if not saved_files:
-            raise HTTPException(status_code=400, detail="No files saved. Check errors.")
+    new_offset = expected + written
+    return {
+        "file_name": file_name,
+        "offset": new_offset,
+        "size_bytes": entry["size_bytes"],
+        "complete": new_offset >= entry["size_bytes"],
+    }
+
+
+@app.post("/upload-sessions/{session_id}/finalize", tags=["Chunked Upload"])
+async def finalize_chunked_upload(session_id: str):
+    """
+    Verifies every file of the session against its declared size and hash,
+    moves them into received_images/event_X and enqueues the event.
+    Nothing is moved while any file is incomplete; those are returned with a 409.
+    """
+    session = await run_in_threadpool(get_upload_session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    if session["status"] != "open":
+        return {"message": f"Upload session already {session['status']}.", "session_id": session_id,
+                "event_id": session["event_id"], "saved_filenames": [], "skipped_duplicates": []}
+    try:
+        async with app.state.ingest_gate.admit(session["event_id"]):
+            session = await run_in_threadpool(get_upload_session, session_id)  # Another finalize may have won
+            if session["status"] != "open":
+                return {"message": f"Upload session already {session['status']}.", "session_id": session_id,
+                        "event_id": session["event_id"], "saved_filenames": [], "skipped_duplicates": []}
+            return await _finalize_session(session)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"{e} Try again later.")
+
+
+async def _finalize_session(session):
+    session_id = session["session_id"]
+    event_id = session["event_id"]
+    event_folder = os.path.join(UPLOAD_DIRECTORY, f"event_{event_id}")
+    await run_in_threadpool(os.makedirs, event_folder, exist_ok=True)
+    known_hashes = await run_in_threadpool(get_manifest_hashes, event_id)
+    taken_names = await run_in_threadpool(get_manifest_names, event_id)
 
+    # Pass 1: every file must be complete and match its hash
+    ready = []
+    skipped_duplicates = []
+    incomplete = []
+    for f in session["files"]:
+        part_path = session_part_path(UPLOAD_DIRECTORY, session_id, f["sha256"])
+        if f["sha256"] in known_hashes:
+            skipped_duplicates.append({"filename": f["file_name"], "existing_filename": known_hashes[f["sha256"]]})
+            continue
+        offset = await run_in_threadpool(current_offset, part_path)
+        if offset != f["size_bytes"]:
+            incomplete.append({"file_name": f["file_name"], "offset": offset, "size_bytes": f["size_bytes"]})
+            continue
+        if await run_in_threadpool(hash_file, part_path) != f["sha256"]:
+            await run_in_threadpool(os.remove, part_path)  # Corrupt; the sender restarts this file from 0
+            incomplete.append({"file_name": f["file_name"], "offset": 0, "size_bytes": f["size_bytes"],
+                               "error": "Content hash mismatch."})
+            continue
+        ready.append((f, part_path))
+
+    if incomplete:
         return JSONResponse(
-            status_code=200,
-            content={
-                "message": f"Uploaded {len(saved_files)} file(s) for event ID {event_id}.",
-                "event_id": event_id,
-                "saved_filenames": saved_files,
-                "upload_errors": errors if errors else "None"
-            }
+            status_code=409,
+            content={"error": "Upload session has incomplete files.", "session_id": session_id,
+                     "incomplete": incomplete}
         )
 
-    finally:
-        app.state.status = "idle"
-        update_event_status(event_id, "unsorted")
+    # Pass 2: move verified files into place and enqueue them in one transaction
+    saved_files = []
+    manifest_rows = []
+    saved_paths = []
+    for f, part_path in ready:
+        if f["sha256"] in known_hashes:  # Same content listed twice in one session
+            skipped_duplicates.append({"filename": f["file_name"], "existing_filename": known_hashes[f["sha256"]]})
+            continue
+        file_path = await run_in_threadpool(commit_staged_file, part_path, event_folder, f["file_name"],
+                                            taken_names)
+        saved_name = os.path.basename(file_path)
+        known_hashes[f["sha256"]] = saved_name
+        taken_names.add(saved_name)
+        saved_files.append(saved_name)
+        saved_paths.append(file_path)
+        manifest_rows.append({"file_name": saved_name, "size_bytes": f["size_bytes"], "sha256": f["sha256"]})
+
+    if saved_files:
+        await run_in_threadpool(fsync_files, saved_paths, event_folder)
+        await run_in_threadpool(enqueue_upload_batch, event_id, manifest_rows)
+        await run_in_threadpool(notify_waiters, "unsorted")  # Wake idle RetinaFace workers
+    await run_in_threadpool(close_upload_session, session_id)
+    await run_in_threadpool(shutil.rmtree, session_folder(UPLOAD_DIRECTORY, session_id), True)
+
+    print(f"📦 Finalized upload session {session_id} for event {event_id}: "
+          f"{len(saved_files)} saved, {len(skipped_duplicates)} duplicate(s)")
+    return {
+        "message": f"Uploaded {len(saved_files)} file(s) for event ID {event_id}, "
+                   f"skipped {len(skipped_duplicates)} duplicate(s).",
+        "session_id": session_id,
+        "event_id": event_id,
+        "saved_filenames": saved_files,
+        "skipped_duplicates": skipped_duplicates,
+    }
+
+
+class DebugArtifacts(BaseModel):
+    enabled: bool
+
+
+@app.put("/events/{event_id}/debug-artifacts", tags=["Processing Options"])
+async def set_debug_artifacts(event_id: int, options: DebugArtifacts):
+    """
+    Turns RetinaFace's annotated Face/ and No-Face/ images on or off for one event.
+    Off by default: production runs only write aligned crops and the face manifest.
+    """
+    await run_in_threadpool(set_event_debug_artifacts, event_id, options.enabled)
+    return {"event_id": event_id, "debug_artifacts": options.enabled}
+
+
+@app.get("/events/{event_id}/debug-artifacts", tags=["Processing Options"])
+async def get_debug_artifacts(event_id: int):
+    enabled = await run_in_threadpool(get_event_debug_artifacts, event_id)
+    return {"event_id": event_id, "debug_artifacts": enabled}
 
 
 @app.post("/match-face/")
@@ -137,16 +533,14 @@ async def match_face_endpoint(
     # Step 2: Save the uploaded image with a custom name: u-ID<user_id>-selfie.jpg
     image_filename = f"u-ID{user_id}-selfie.jpg"
     image_path = os.path.join(user_folder, image_filename)
-    with open(image_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await run_in_threadpool(write_stream_to_file, file.file, image_path)
 
-    # Step 3: Run matching
+    # Step 3: Run matching (blocking pipeline, keep it off the event loop)
     try:
-        cluster_id, best_match_filename, similarity = find_best_match(user_id, event_id)
+        cluster_id, best_match_filename, similarity = await run_in_threadpool(find_best_match, user_id, event_id)
         if cluster_id is None:
             raise ValueError("No matching cluster found.")
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
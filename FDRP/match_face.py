@@ -5,9 +5,10 @@ from sklearn.metrics.pairwise import cosine_similarity
 import subprocess
 import logging
 from pathlib import Path
-from typing import Tuple, Optional, Dict, List, Union
+from typing import Tuple, Optional, List, Union
 import argparse
 from healpers.folder_healper import clean_user_data
+from healpers.embedding_store import read_embeddings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -43,17 +44,16 @@ def run_subprocess(script_name: str, input_path: str, output_path: str, timeout:
         logger.error(f"Unexpected error in {script_name}: {str(e)}", exc_info=True)
     return False
 
-def load_embeddings(file_path: str) -> Optional[Dict[str, np.ndarray]]:
-    """Safely load embeddings with validation"""
+def load_embeddings(folder: Path) -> Optional[Tuple[List[str], np.ndarray]]:
+    """Safely load a folder's embedding store as (crop names, float32 matrix) with validation"""
     try:
-        with open(file_path, "rb") as f:
-            embeddings = pickle.load(f)
-            if not embeddings or not isinstance(embeddings, dict):
-                logger.error(f"Invalid embeddings format in {file_path}")
-                return None
-            return embeddings
+        names, matrix = read_embeddings(str(folder))
+        if not names:
+            logger.error(f"No embeddings stored in {folder}")
+            return None
+        return names, matrix
     except Exception as e:
-        logger.error(f"Failed to load embeddings from {file_path}: {str(e)}", exc_info=True)
+        logger.error(f"Failed to load embeddings from {folder}: {str(e)}", exc_info=True)
         return None
 
 def find_best_match(user_id: str, event_id: str) -> Union[Tuple[None, None, None], Tuple[int, str, float]]:
@@ -90,32 +90,26 @@ def find_best_match(user_id: str, event_id: str) -> Union[Tuple[None, None, None
         return None, None, None
 
     # Load and validate embeddings
-    user_embeddings = load_embeddings(f"{user_path}/facenet512_embeddings.pkl")
-    event_embeddings = load_embeddings(f"{event_path}/facenet512_embeddings.pkl")
+    user_embeddings = load_embeddings(user_path)
+    event_embeddings = load_embeddings(event_path)
     
     if not user_embeddings or not event_embeddings:
         return None, None, None
 
     # Get primary user embedding
-    try:
-        my_embed = next(iter(user_embeddings.values()))
-    except StopIteration:
-        logger.error("No valid user embeddings found")
-        return None, None, None
+    my_embed = np.asarray(user_embeddings[1][0]).reshape(1, -1)
 
-    # Find best match
+    # Find best match: one pass over the event's (memory-mapped) embedding matrix
     best_score = -1
     best_match = None
-    
-    for filename, embed in event_embeddings.items():
-        try:
-            score = cosine_similarity([my_embed], [embed])[0][0]
-            if score > best_score:
-                best_score = score
-                best_match = filename
-        except Exception as e:
-            logger.warning(f"Error comparing with {filename}: {str(e)}")
-            continue
+    event_names, event_matrix = event_embeddings
+    try:
+        scores = cosine_similarity(my_embed, event_matrix)[0]
+        best_index = int(np.argmax(scores))
+        best_score = float(scores[best_index])
+        best_match = event_names[best_index]
+    except Exception as e:
+        logger.warning(f"Error comparing with event embeddings: {str(e)}")
 
     if best_match is None:
         logger.error("No valid matches found")
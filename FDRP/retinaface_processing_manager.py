@@ -1,53 +1,120 @@
+import os
 import sys
-import time
+import threading
 import subprocess
 sys.path.append("FDRP-Workers")
 from datetime import datetime
-from healpers.db_helper import get_unsorted_event, update_event_status, update_retinaface_time, get_duration_string
+from healpers.db_helper import (
+    update_retinaface_time, get_duration_string, update_manifest_status, get_event_manifest, get_event_debug_artifacts
+)
+from healpers.work_queue import WorkQueue
+from healpers.detection_checkpoint import missing_images
+from healpers.embedding_store import missing_embeddings
+from healpers.warm_worker import WarmWorker
+
+WORKER_COUNT = int(os.environ.get("FDRP_RETINAFACE_WORKERS", 1))  # Events cropped at the same time
+# Keep the RetinaFace model loaded between events; set to 0 to start a fresh subprocess per event instead
+USE_WARM_WORKER = os.environ.get("FDRP_RETINAFACE_WARM", "1") == "1"
+WARM_WORKER_MAX_EVENTS = int(os.environ.get("FDRP_RETINAFACE_MAX_EVENTS", 50))  # Recycle after this many events
+WARM_WORKER_MAX_RSS_MB = int(os.environ.get("FDRP_RETINAFACE_MAX_RSS_MB", 6144))  # ...or above this much memory
+DEBUG_ARTIFACTS = os.environ.get("FDRP_DEBUG_ARTIFACTS", "0") == "1"  # Default for events without their own setting
+# The worker also embeds the crops (see FDRP_FUSED_PIPELINE in retinaface_worker.py)
+FUSED_PIPELINE = os.environ.get("FDRP_FUSED_PIPELINE", "0") == "1"
+
+_warm_workers = threading.local()  # One warm worker process per queue worker thread
 
 print("RetinaFace Working......")
 print("Looking For unsorted events")
 
-def run_face_extraction_subprocess(input_folder, output_folder):
-    try:
-        result = subprocess.run(
-            [sys.executable, "FDRP-Workers/retinaface_subprocess_entry.py", input_folder, output_folder],
-            capture_output=True, text=True
-        )
-
-        # ✅ Bonus Tip: Check exit code
-        if result.returncode != 0:
-            print(f"[ERROR] Subprocess failed with code {result.returncode}")
-            print("STDOUT:\n", result.stdout)
-            print("STDERR:\n", result.stderr)
-        else:
-            print("[INFO] Subprocess completed successfully.")
-            print("STDOUT:\n", result.stdout)
-
-    except Exception as e:
-        print(f"[EXCEPTION] Failed to run subprocess: {e}")
-
-def main_processing_loop(db_path='database.db', check_interval=5):
-    while True:
-        event_id_result = get_unsorted_event(db_path)
-        if event_id_result:
-            event_id = event_id_result[0][0]
-            print(f"Processing event_id: {event_id}")
-            input_folder = f"received_images/event_{event_id}"
-            output_folder = f"Cropped_Events/event_{event_id}"
-
-            # Run extraction in separate subprocess to fully free GPU memory after
-            start_time = datetime.now().isoformat()
-            run_face_extraction_subprocess(input_folder, output_folder)
-
-            update_event_status(event_id, "cropped")
-            end_time = datetime.now().isoformat()
-            duration_str = get_duration_string(start_time, end_time)
-            update_retinaface_time(event_id,duration_str)
-            print("RetinaFace Working......")
-            print("Looking For unsorted events")
-
-        time.sleep(check_interval)
+def run_face_extraction_subprocess(input_folder, output_folder, job):
+    """
+    Raises:
+        RuntimeError: If the subprocess exits with an error, so the queue retries the event.
+    """
+    command = [sys.executable, "FDRP-Workers/retinaface_subprocess_entry.py", input_folder, output_folder,
+               str(job.event_id)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # A lost lease kills the subprocess between (or during) images; the checkpoint keeps what it finished
+    with job.aborting(process.kill):
+        stdout, stderr = process.communicate()
+
+    # ✅ Bonus Tip: Check exit code
+    if process.returncode != 0:
+        print(f"[ERROR] Subprocess failed with code {process.returncode}")
+        print("STDOUT:\n", stdout)
+        print("STDERR:\n", stderr)
+        raise RuntimeError(f"Face extraction subprocess for {input_folder} failed with code {process.returncode}")
+    print("[INFO] Subprocess completed successfully.")
+    print("STDOUT:\n", stdout)
+
+def get_warm_worker():
+    worker = getattr(_warm_workers, "worker", None)
+    if worker is None:
+        worker = WarmWorker("FDRP-Workers/retinaface_server.py",
+                            max_jobs=WARM_WORKER_MAX_EVENTS, max_rss_mb=WARM_WORKER_MAX_RSS_MB)
+        _warm_workers.worker = worker
+    return worker
+
+def get_expected_images(event_id):
+    # Read the upload manifest instead of listing the folder (None for events uploaded without one).
+    # The hashes tell a re-upload apart from an earlier image of the same name that is already done.
+    manifest = get_event_manifest(event_id, status='received')
+    return {row['file_name']: row['sha256'] for row in manifest} if manifest else None
+
+def run_face_extraction_warm(input_folder, output_folder, job, image_names):
+    worker = get_warm_worker()
+    event_id = job.event_id
+    with job.aborting(worker.abort):  # A lost lease kills the worker; the next event starts a fresh one
+        worker.run({
+            "event_id": event_id,
+            "input_folder": input_folder,
+            "output_folder": output_folder,
+            "image_names": image_names,
+            "debug_artifacts": get_event_debug_artifacts(event_id, default=DEBUG_ARTIFACTS),
+        })
+
+def process_event(job):
+    """
+    Crops one event. Images finished by an earlier attempt are skipped by the
+    worker (see healpers/detection_checkpoint.py). If the lease is lost the
+    worker is stopped and LeaseLost is raised, leaving the event to its new owner.
+
+    Args:
+        job (Job): The claimed event.
+
+    Returns:
+        str: 'cropped' once every image of the event is accounted for, or 'emb_ext'
+             when the fused pipeline already embedded every face.
+        Raises otherwise, so the queue retries the event and it resumes.
+    """
+    event_id = job.event_id
+    input_folder = f"received_images/event_{event_id}"
+    output_folder = f"Cropped_Events/event_{event_id}"
+    image_names = get_expected_images(event_id)
+
+    start_time = datetime.now().isoformat()
+    if USE_WARM_WORKER:
+        run_face_extraction_warm(input_folder, output_folder, job, image_names)
+    else:
+        # Run extraction in separate subprocess to fully free GPU memory after
+        run_face_extraction_subprocess(input_folder, output_folder, job)
+
+    missing = missing_images(output_folder, image_names, input_folder)
+    if missing:
+        raise RuntimeError(f"{len(missing)} image(s) of event {event_id} not accounted for (first: {missing[0]})")
+
+    job.check()  # The manifest and timings belong to the new owner once the lease is gone
+    update_manifest_status(event_id, "received", "detected")
+    end_time = datetime.now().isoformat()
+    duration_str = get_duration_string(start_time, end_time)
+    update_retinaface_time(event_id,duration_str)
+    if FUSED_PIPELINE and not missing_embeddings(output_folder):
+        return "emb_ext"  # Nothing left for the FaceNet stage
+    return "cropped"
+
+def main_processing_loop(db_path='database.db', worker_count=WORKER_COUNT):
+    queue = WorkQueue("unsorted", "cropping", "failed_cropping", db_path=db_path)
+    queue.run_workers(process_event, count=worker_count, name="retinaface")
 
 if __name__ == "__main__":
     main_processing_loop()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The managers run from the FDRP folder: healpers and Sorting_Algos import from it, the workers from FDRP-Workers
+FDRP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FDRP_ROOT)
+sys.path.insert(0, os.path.join(FDRP_ROOT, "FDRP-Workers"))
@@ -0,0 +1,41 @@
+from healpers.detection_checkpoint import CHECKPOINT_FILE, DetectionCheckpoint, is_done, missing_images
+
+
+def test_torn_last_record_is_dropped(tmp_path):
+    checkpoint = DetectionCheckpoint(str(tmp_path))
+    checkpoint.record({"image": "a.jpg", "sha256": "aaa", "faces": []})
+    with open(tmp_path / CHECKPOINT_FILE, "a") as f:
+        f.write('{"image": "b.jp')
+    assert list(checkpoint.load()) == ["a.jpg"]
+    checkpoint.record({"image": "b.jpg", "sha256": "bbb", "faces": []})
+    assert list(DetectionCheckpoint(str(tmp_path)).load()) == ["a.jpg", "b.jpg"]
+
+
+def test_reupload_under_a_finished_name_is_not_done(tmp_path):
+    # a.jpg was detected and removed from received_images; a later upload got the name back
+    DetectionCheckpoint(str(tmp_path)).record({"image": "a.jpg", "sha256": "old", "faces": []})
+    assert missing_images(str(tmp_path), {"a.jpg": "new", "b.jpg": "bbb"}) == ["a.jpg", "b.jpg"]
+    assert missing_images(str(tmp_path), {"a.jpg": "old"}) == []
+
+    # Once the new image is done its record supersedes the old one
+    DetectionCheckpoint(str(tmp_path)).record({"image": "a.jpg", "sha256": "new", "faces": []})
+    assert missing_images(str(tmp_path), {"a.jpg": "new"}) == []
+    assert missing_images(str(tmp_path), {"a.jpg": "old"}) == ["a.jpg"]
+
+
+def test_names_without_hashes_match_on_the_name(tmp_path):
+    checkpoint = DetectionCheckpoint(str(tmp_path))
+    checkpoint.record({"image": "legacy.jpg", "faces": []})  # Written before records kept hashes
+    records = checkpoint.load()
+    assert is_done(records, "legacy.jpg", "any") and is_done(records, "legacy.jpg")
+    assert not is_done(records, "other.jpg")
+    assert missing_images(str(tmp_path), ["legacy.jpg", "other.jpg"]) == ["other.jpg"]
+
+
+def test_without_a_manifest_the_input_folder_is_listed(tmp_path):
+    event, received = tmp_path / "event", tmp_path / "received"
+    event.mkdir()
+    received.mkdir()
+    (received / "waiting.jpg").write_bytes(b"")
+    assert missing_images(str(event), None, str(received)) == ["waiting.jpg"]
+    assert missing_images(str(event), None, str(tmp_path / "gone")) == []
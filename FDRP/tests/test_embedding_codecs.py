@@ -0,0 +1,96 @@
+import json
+import numpy as np
+import pytest
+import healpers.embedding_store as embedding_store
+from healpers.embedding_codecs import CODECS, PQ_MIN_TRAIN, train_pq, encode, decode, encoded_size
+from healpers.embedding_store import EmbeddingStore
+
+
+def clustered(count, dim=16, clusters=8, seed=0):
+    """Rows scattered tightly around a few centers, like faces of a few people."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=count)] + 0.01 * rng.normal(size=(count, dim))).astype(np.float32)
+
+
+def round_trip(codec, vectors, codebook=None):
+    return np.asarray(decode(codec, encode(codec, vectors, codebook), codebook), dtype=np.float32)
+
+
+def test_float32_is_exact_and_float16_close():
+    vectors = clustered(20)
+    np.testing.assert_array_equal(round_trip("float32", vectors), vectors)
+    np.testing.assert_allclose(round_trip("float16", vectors), vectors, rtol=1e-3, atol=1e-3)
+    assert encode("float16", vectors)["vectors"].dtype == np.float16
+
+
+def test_int8_error_is_within_half_a_step():
+    vectors = clustered(20)
+    vectors[3] = 0.0  # An all-zero row must not divide by zero
+    columns = encode("int8", vectors)
+    assert columns["vectors"].dtype == np.int8 and columns["scales"].shape == (20, 1)
+    restored = round_trip("int8", vectors)
+    assert np.all(np.abs(restored - vectors) <= columns["scales"] / 2 + 1e-7)
+    assert not restored[3].any()
+
+
+def test_pq_round_trip():
+    vectors = clustered(300)
+    codebook = train_pq(vectors, subspaces=4, iterations=5)
+    assert codebook.shape == (4, 256, 4)
+    codes = encode("pq", vectors, codebook)["vectors"]
+    assert codes.shape == (300, 4) and codes.dtype == np.uint8
+    restored = round_trip("pq", vectors, codebook)
+    assert np.abs(restored - vectors).max() < 0.1
+    centroid_rows = codebook[np.arange(4), 0].reshape(1, -1)  # Already on the codebook: decoded exactly
+    np.testing.assert_array_equal(round_trip("pq", centroid_rows, codebook), centroid_rows)
+
+
+def test_pq_needs_divisible_dimensions_and_codecs_are_checked():
+    with pytest.raises(ValueError):
+        train_pq(clustered(10, dim=10), subspaces=4)
+    with pytest.raises(ValueError):
+        encode("bfloat16", clustered(2))
+    with pytest.raises(ValueError):
+        EmbeddingStore("unused", codec="bfloat16")
+
+
+def test_encoded_sizes():
+    assert [encoded_size(codec, 512, 64) for codec in CODECS] == [2048, 1024, 516, 64]
+
+
+@pytest.mark.parametrize("codec, tolerance", [("float16", 1e-2), ("int8", 5e-2)])
+def test_store_round_trip_after_reopen(tmp_path, codec, tolerance):
+    vectors = clustered(10)
+    names = [f"crop_{i}.jpg" for i in range(10)]
+    store = EmbeddingStore(str(tmp_path), codec=codec)
+    store.append(dict(zip(names[:6], vectors[:6])))
+    store.append(dict(zip(names[6:], vectors[6:])))
+
+    reopened = EmbeddingStore(str(tmp_path), codec="float32")  # Existing stores keep their codec
+    assert reopened.meta()["dtype"] == codec
+    read_names, matrix = reopened.read()
+    assert read_names == names
+    np.testing.assert_allclose(np.asarray(matrix, dtype=np.float32), vectors, atol=tolerance)
+
+
+def test_pq_store_trains_on_its_first_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "PQ_SUBSPACES", 4)
+    vectors = clustered(PQ_MIN_TRAIN + 4)
+    names = [f"crop_{i}.jpg" for i in range(len(vectors))]
+    store = EmbeddingStore(str(tmp_path), codec="pq")
+    store.append(dict(zip(names[:-4], vectors[:-4])))
+    store.append(dict(zip(names[-4:], vectors[-4:])))  # Encoded with the codebook trained on the first append
+
+    meta = json.load(open(store.meta_path))
+    assert meta["dtype"] == "pq" and meta["pq_subspaces"] == 4
+    read_names, matrix = EmbeddingStore(str(tmp_path)).read()
+    assert read_names == names
+    assert np.abs(matrix - vectors).max() < 0.1
+
+
+def test_pq_store_with_too_few_rows_falls_back_to_float16(tmp_path):
+    store = EmbeddingStore(str(tmp_path), codec="pq")
+    store.append({"a.jpg": clustered(1)[0]})
+    assert store.meta()["dtype"] == "float16"
+    assert store.read()[1].dtype == np.float16
@@ -0,0 +1,92 @@
+import json
+import pickle
+import numpy as np
+import pytest
+from healpers.embedding_store import (
+    EmbeddingStore, HEADER_SIZE, save_embeddings, load_embeddings, missing_embeddings
+)
+
+
+def vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def as_dict(names, matrix):
+    return {name: row for name, row in zip(names, matrix)}
+
+
+def test_append_then_reopen(tmp_path):
+    first, second = vectors(3), vectors(2, seed=1)
+    store = EmbeddingStore(str(tmp_path), codec="float32")
+    assert not store.exists() and store.read() == ([], None)
+
+    assert store.append(as_dict(["a.jpg", "b.jpg", "c.jpg"], first)) == 3
+    assert store.append(as_dict(["d.jpg", "e.jpg"], second)) == 5
+
+    names, matrix = EmbeddingStore(str(tmp_path)).read()  # A fresh instance, as another process would open it
+    assert names == ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+    assert isinstance(matrix, np.memmap)
+    np.testing.assert_array_equal(matrix, np.vstack([first, second]))
+    assert np.load(store.vectors_path).shape == (5, 8)  # Still a standard .npy file
+    assert json.load(open(store.meta_path))["dtype"] == "float32"
+
+
+def test_appending_a_crop_again_supersedes_its_row(tmp_path):
+    old, new = vectors(2), vectors(1, seed=1)
+    save_embeddings(str(tmp_path), as_dict(["a.jpg", "b.jpg"], old))
+    path, count = save_embeddings(str(tmp_path), {"a.jpg": new[0]})
+    assert count == 3
+    assert EmbeddingStore(str(tmp_path)).names() == ["a.jpg", "b.jpg"]
+    embeddings = load_embeddings(str(tmp_path))
+    np.testing.assert_array_equal(embeddings["a.jpg"], new[0])
+    np.testing.assert_array_equal(embeddings["b.jpg"], old[1])
+
+
+def test_unfinished_append_is_ignored_and_overwritten(tmp_path):
+    store = EmbeddingStore(str(tmp_path), codec="float32")
+    store.append(as_dict(["a.jpg", "b.jpg"], vectors(2)))
+    # A crash after writing rows and index lines, before the header's row count was updated
+    with open(store.vectors_path, "ab") as f:
+        f.write(vectors(1, seed=9).tobytes())
+    with open(store.index_path, "a") as f:
+        f.write(json.dumps({"row": 2, "crop": "torn.jpg"}) + "\n{\"row\": 3")
+
+    assert store.read()[0] == ["a.jpg", "b.jpg"]
+    assert store.append({"c.jpg": vectors(1, seed=2)[0]}) == 3
+    names, matrix = store.read()
+    assert names == ["a.jpg", "b.jpg", "c.jpg"]
+    np.testing.assert_array_equal(matrix[2], vectors(1, seed=2)[0])
+    with open(store.vectors_path, "rb") as f:
+        assert len(f.read()) == HEADER_SIZE + 3 * 8 * 4
+
+
+def test_legacy_pickle_is_read_and_converted_on_append(tmp_path):
+    legacy = {"a.jpg": [1.0] * 8, "b.jpg": [2.0] * 8}
+    store = EmbeddingStore(str(tmp_path))
+    with open(store.legacy_path, "wb") as f:
+        pickle.dump(legacy, f)
+    assert store.names() == ["a.jpg", "b.jpg"]
+
+    assert store.append({"c.jpg": [3.0] * 8}) == 3
+    names, matrix = store.read()
+    assert names == ["a.jpg", "b.jpg", "c.jpg"]
+    np.testing.assert_array_equal(matrix[:, 0], [1.0, 2.0, 3.0])
+
+
+def test_dimension_mismatch_is_refused(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append({"a.jpg": vectors(1)[0]})
+    with pytest.raises(ValueError):
+        store.append({"b.jpg": vectors(1, dim=4)[0]})
+    assert store.names() == ["a.jpg"]
+
+
+def test_missing_embeddings_follows_the_face_manifest(tmp_path):
+    with open(tmp_path / "faces.jsonl", "w") as f:
+        for face_id, crop in enumerate(["a.jpg", "b.jpg", "c.jpg"]):
+            f.write(json.dumps({"face_id": face_id, "crop": crop}) + "\n")
+    save_embeddings(str(tmp_path), as_dict(["a.jpg", "c.jpg"], vectors(2)))
+    assert missing_embeddings(str(tmp_path)) == ["b.jpg"]
+    # Rows are keyed by crop name only; face ids are renumbered by every detection run
+    index = [json.loads(line) for line in open(EmbeddingStore(str(tmp_path)).index_path)]
+    assert index == [{"row": 0, "crop": "a.jpg"}, {"row": 1, "crop": "c.jpg"}]
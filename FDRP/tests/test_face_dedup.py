@@ -0,0 +1,87 @@
+import json
+import numpy as np
+from Sorting_Algos.face_dedup import (
+    DUPLICATES_FILE, _Groups, similar_pairs, matching_photos, collapse_duplicates
+)
+
+# (image, width, height, phash, [(crop, bbox, score), ...])
+PHOTOS = [
+    ("p1.jpg", 200, 100, "ffff0000ffff0000", [("p1_f0.jpg", [20, 10, 60, 50], 0.90),
+                                              ("p1_f1.jpg", [120, 10, 160, 50], 0.95)]),
+    # The same shot at twice the size, hash 2 bits off: its faces pair up with p1's by position
+    ("p2.jpg", 400, 200, "ffff0000ffff0003", [("p2_f0.jpg", [40, 20, 120, 100], 0.99),
+                                              ("p2_f1.jpg", [240, 20, 320, 100], 0.50)]),
+    # Another scene: a face at the same position is not a duplicate...
+    ("p3.jpg", 200, 100, "0000ffff0000ffff", [("p3_f0.jpg", [20, 10, 60, 50], 0.80)]),
+    # ...unless its embedding says so (p5_f0 gets p3_f0's embedding below)
+    ("p5.jpg", 300, 300, "123456789abcdef0", [("p5_f0.jpg", [0, 0, 50, 50], 0.85)]),
+    ("p4.jpg", 200, 100, "ffff0000ffff0000", []),  # Same hash as p1 but no faces
+]
+
+
+def write_event(folder):
+    face_id = 0
+    names = []
+    with open(folder / "faces.jsonl", "w") as faces, open(folder / "images.jsonl", "w") as images:
+        for image, width, height, phash, crops in PHOTOS:
+            face_ids = []
+            for crop, bbox, score in crops:
+                faces.write(json.dumps({"face_id": face_id, "image": image, "crop": crop,
+                                        "bbox": bbox, "score": score}) + "\n")
+                face_ids.append(face_id)
+                names.append(crop)
+                face_id += 1
+            images.write(json.dumps({"image": image, "width": width, "height": height,
+                                     "phash": phash, "face_ids": face_ids}) + "\n")
+    return names
+
+
+def test_groups_merge_transitively():
+    groups = _Groups(5)
+    groups.union(0, 3)
+    groups.union(3, 4)
+    assert {groups.find(i) for i in (0, 3, 4)} == {0}
+    assert groups.find(1) == 1 and groups.find(2) == 2
+
+
+def test_similar_pairs_is_the_same_in_chunks():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(7, 16)).astype(np.float32)
+    vectors[5] = vectors[1] * 3 + 0.001  # Same direction, different length
+    vectors[6] = vectors[1]
+    expected = {(1, 5), (1, 6), (5, 6)}
+    assert set(similar_pairs(vectors, threshold=0.95)) == expected
+    assert set(similar_pairs(vectors, threshold=0.95, chunk=2)) == expected
+
+
+def test_matching_photos_uses_hash_distance_and_skips_photos_without_faces():
+    images = [{"image": image, "phash": phash, "face_ids": [0] if crops else []}
+              for image, _, _, phash, crops in PHOTOS]
+    pairs = [(a["image"], b["image"]) for a, b in matching_photos(images, max_distance=5)]
+    assert pairs == [("p1.jpg", "p2.jpg")]
+    assert list(matching_photos(images, max_distance=1)) == []
+
+
+def test_collapse_duplicates_groups_by_position_and_embedding(tmp_path):
+    names = write_event(tmp_path)
+    vectors = np.random.default_rng(1).normal(size=(len(names), 16)).astype(np.float32)
+    vectors[names.index("p5_f0.jpg")] = vectors[names.index("p3_f0.jpg")] + 0.001
+
+    representatives, members = collapse_duplicates(str(tmp_path), names, vectors)
+
+    assert [names[i] for i in representatives] == ["p1_f1.jpg", "p2_f0.jpg", "p5_f0.jpg"]
+    assert members == {  # Best detection score first
+        "p2_f0.jpg": ["p2_f0.jpg", "p1_f0.jpg"],
+        "p1_f1.jpg": ["p1_f1.jpg", "p2_f1.jpg"],
+        "p5_f0.jpg": ["p5_f0.jpg", "p3_f0.jpg"],
+    }
+    with open(tmp_path / DUPLICATES_FILE) as f:
+        assert json.load(f) == members
+
+
+def test_collapse_duplicates_without_manifest_uses_embeddings_only(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    vectors[3] = vectors[0]
+    representatives, members = collapse_duplicates(str(tmp_path), ["a", "b", "c", "d"], vectors)
+    assert representatives == [0, 1, 2]
+    assert members["a"] == ["a", "d"] and members["b"] == ["b"]
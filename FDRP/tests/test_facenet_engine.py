@@ -0,0 +1,68 @@
+import numpy as np
+from facenet_engine import FaceNetEngine, CropStream
+
+BAD = 7  # Crops filled with this value make the fake model fail
+
+
+class FakeNetwork:
+    """Stands in for the Keras model: one row per crop, failing on any batch holding a bad crop."""
+
+    output_shape = 2
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def model(self, batch, training=False):
+        self.batch_sizes.append(len(batch))
+        if np.any(np.isclose(batch, BAD / 255.0).all(axis=(1, 2, 3))):
+            raise ValueError("bad crop")
+        return FakeTensor(np.stack([batch.mean(axis=(1, 2, 3)), np.ones(len(batch))], axis=1))
+
+
+class FakeTensor:
+    def __init__(self, value):
+        self.value = value
+
+    def numpy(self):
+        return self.value
+
+
+def fake_represent(img_path, **kwargs):
+    if (img_path == BAD).all():
+        raise ValueError("bad crop")
+    return [{"embedding": [float(img_path.mean()), 1.0]}]
+
+
+def engine(batched, batch_size=3):
+    # Built without DeepFace: only the attributes embed_images() uses
+    engine = FaceNetEngine.__new__(FaceNetEngine)
+    engine.model_name, engine.batch_size, engine.batched = "Facenet512", batch_size, batched
+    engine.model, engine.target_size, engine.represent = FakeNetwork(), (4, 4), fake_represent
+    return engine
+
+
+def crops(*values):
+    return [np.full((4, 4, 3), value, dtype=np.uint8) for value in values]
+
+
+def test_per_crop_mode_leaves_out_only_the_bad_crop():
+    embeddings = engine(batched=False).embed_images(crops(10, BAD, 30))
+    assert embeddings[1] is None
+    assert [vector.tolist() for vector in (embeddings[0], embeddings[2])] == [[10.0, 1.0], [30.0, 1.0]]
+    assert engine(batched=False).embed_images([]) == []
+
+
+def test_failed_batch_is_retried_one_crop_at_a_time():
+    batched = engine(batched=True)
+    embeddings = batched.embed_images(crops(10, BAD, 30, 40))
+    assert batched.model.batch_sizes == [3, 1, 1, 1, 1]  # The first batch failed and was split; the second was fine
+    assert embeddings[1] is None
+    assert [round(float(vector[0]) * 255) for vector in (embeddings[0], embeddings[2], embeddings[3])] == [10, 30, 40]
+
+
+def test_stream_keeps_the_good_crops():
+    stream = CropStream(engine(batched=True))
+    for name, img in zip(["a", "b", "c"], crops(10, BAD, 30)):
+        stream.put(name, img)
+    assert sorted(stream.close()) == ["a", "c"]
+    assert stream.error is None
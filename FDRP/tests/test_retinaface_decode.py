@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from retinaface_decode import (
+    FEAT_STRIDES, NUM_ANCHORS, parse_canvas, canvas_for, letterbox, decode, detect_batch
+)
+
+FACE_CELL = (1, 2)  # (row, column) of the stride-8 cell the fake network fires on
+FACE_ANCHOR = 1     # Stride 8, anchor 1 is [0, 0, 15, 15]: with zero deltas the box is the anchor itself
+
+
+def fake_forward(batch):
+    """
+    The 9 RetinaFace outputs for a batch, all background except one confident face
+    at FACE_CELL, so the decoded box is known in canvas coordinates.
+    """
+    count, height, width, _ = batch.shape
+    outputs = []
+    for stride in FEAT_STRIDES:
+        rows, cols = height // stride, width // stride
+        scores = np.zeros((count, rows, cols, 2 * NUM_ANCHORS), dtype=np.float32)
+        scores[..., :NUM_ANCHORS] = 1.0
+        if stride == 8:
+            scores[:, FACE_CELL[0], FACE_CELL[1], NUM_ANCHORS + FACE_ANCHOR] = 0.99
+        outputs += [scores,
+                    np.zeros((count, rows, cols, 4 * NUM_ANCHORS), dtype=np.float32),
+                    np.zeros((count, rows, cols, 10 * NUM_ANCHORS), dtype=np.float32)]
+    return outputs
+
+
+def canvas_box():
+    x, y = FACE_CELL[1] * 8, FACE_CELL[0] * 8
+    return np.array([x, y, x + 15, y + 15], dtype=np.float32)
+
+
+def test_parse_canvas_rounds_up_to_the_largest_stride():
+    assert parse_canvas("1824x1024") == (1824, 1024)
+    assert parse_canvas("1000X700") == (1024, 704)
+
+
+def test_canvas_for_follows_the_image_orientation():
+    landscape, portrait = np.zeros((100, 200, 3), np.uint8), np.zeros((200, 100, 3), np.uint8)
+    assert canvas_for(landscape, (64, 32)) == (64, 32)
+    assert canvas_for(portrait, (64, 32)) == (32, 64)
+    assert canvas_for(portrait, (32, 64)) == (32, 64)
+
+
+def test_letterbox_scales_to_fit_and_pads_bottom_right():
+    img = np.full((100, 200, 3), (10, 20, 30), dtype=np.uint8)  # BGR
+    tensor, scale, content_shape = letterbox(img, (64, 64))
+    assert tensor.shape == (64, 64, 3) and tensor.dtype == np.float32
+    assert scale == pytest.approx(0.32)
+    assert content_shape == (32, 64)
+    assert tensor[:32, :64].tolist() == np.full((32, 64, 3), (30, 20, 10), np.float32).tolist()  # RGB
+    assert not tensor[32:].any()
+
+
+def test_decode_maps_boxes_back_to_the_original_image():
+    img = np.zeros((100, 200, 3), dtype=np.uint8)
+    tensor, scale, content_shape = letterbox(img, (64, 64))
+    faces = decode([out[0] for out in fake_forward(tensor[None])], scale, content_shape)
+    assert list(faces) == ["face_1"]
+    face = faces["face_1"]
+    assert face["score"] == pytest.approx(0.99)
+    assert face["facial_area"] == [int(v) for v in canvas_box() / scale]
+    center = (canvas_box()[:2] + 7.5) / scale
+    for point in face["landmarks"].values():
+        assert point == pytest.approx(center.tolist(), abs=1e-3)
+
+
+def test_decode_clips_boxes_to_the_content_not_the_padding():
+    img = np.zeros((10, 200, 3), dtype=np.uint8)  # Content is only 4 px high in the canvas
+    tensor, scale, content_shape = letterbox(img, (64, 64))
+    faces = decode([out[0] for out in fake_forward(tensor[None])], scale, content_shape)
+    x1, y1, x2, y2 = faces["face_1"]["facial_area"]
+    assert y1 >= 0 and y2 <= int((content_shape[0] - 1) / scale)
+
+
+def test_detect_batch_keeps_input_order_across_canvases():
+    images = [np.zeros((100, 200, 3), np.uint8), np.zeros((300, 150, 3), np.uint8), np.zeros((50, 80, 3), np.uint8)]
+    calls = []
+
+    def forward(batch):
+        calls.append(batch.shape)
+        return fake_forward(batch)
+
+    results = detect_batch(images, (64, 32), forward)
+    assert sorted(calls) == [(1, 64, 32, 3), (2, 32, 64, 3)]  # One forward pass per canvas orientation
+    for img, faces in zip(images, results):
+        _, scale, _ = letterbox(img, canvas_for(img, (64, 32)))
+        assert faces["face_1"]["facial_area"] == [int(v) for v in canvas_box() / scale]
+
+
+def test_detect_batch_threshold_drops_weak_faces():
+    assert detect_batch([np.zeros((100, 200, 3), np.uint8)], (64, 32), fake_forward, threshold=0.995) == [{}]
@@ -0,0 +1,35 @@
+import sqlite3
+import pytest
+from healpers.db_helper import (
+    init_deepface_jobs_table, enqueue_upload_batch, get_event_manifest, get_manifest_names
+)
+from healpers.upload_helper import reserve_unique_path, commit_staged_file
+
+
+def test_reserve_skips_names_on_disk_and_taken(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"")
+    assert reserve_unique_path(str(tmp_path), "a.jpg") == str(tmp_path / "a_1.jpg")
+    # a_2.jpg was detected and removed from the folder, but the manifest still holds it
+    assert reserve_unique_path(str(tmp_path), "a.jpg", {"a_2.jpg"}) == str(tmp_path / "a_3.jpg")
+    assert reserve_unique_path(str(tmp_path), "b.jpg", {"b.jpg"}) == str(tmp_path / "b_1.jpg")
+
+
+def test_reupload_after_detection_keeps_the_earlier_manifest_row(tmp_path):
+    db_path = str(tmp_path / "database.db")
+    init_deepface_jobs_table(db_path)
+    event_folder = tmp_path / "event_1"
+    event_folder.mkdir()
+    enqueue_upload_batch(1, [{"file_name": "a.jpg", "size_bytes": 3, "sha256": "old"}], db_path)
+    # Detection removed the original, so the folder alone no longer shows the name is used
+
+    staged = tmp_path / "staged.part"
+    staged.write_bytes(b"new")
+    file_path = commit_staged_file(str(staged), str(event_folder), "a.jpg", get_manifest_names(1, db_path))
+    assert file_path == str(event_folder / "a_1.jpg")
+    enqueue_upload_batch(1, [{"file_name": "a_1.jpg", "size_bytes": 3, "sha256": "new"}], db_path)
+
+    rows = get_event_manifest(1, db_path=db_path)
+    assert [(row["file_name"], row["sha256"]) for row in rows] == [("a.jpg", "old"), ("a_1.jpg", "new")]
+    with pytest.raises(sqlite3.IntegrityError):  # Never silently overwritten
+        enqueue_upload_batch(1, [{"file_name": "a.jpg", "size_bytes": 3, "sha256": "other"}], db_path)
+    assert get_event_manifest(1, db_path=db_path)[0]["sha256"] == "old"
@@ -0,0 +1,136 @@
+import time
+import threading
+import pytest
+from healpers.db_helper import enqueue_upload_batch, get_db_connection
+from healpers.work_queue import WorkQueue, LeaseLost
+
+
+def job_row(db_path, event_id):
+    conn = get_db_connection(db_path)
+    row = conn.execute("""
+        SELECT status, claimed_by, attempts, rerun
+        FROM deepface_jobs WHERE event_id = ?
+    """, (event_id,)).fetchone()
+    conn.close()
+    return row
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "database.db")
+
+
+def cropping_queue(db_path, visibility_timeout=300):
+    return WorkQueue("unsorted", "cropping", "failed_cropping", db_path=db_path,
+                     visibility_timeout=visibility_timeout, retry_delay=0)
+
+
+def test_claim_takes_each_event_once(db_path):
+    queue = cropping_queue(db_path)
+    enqueue_upload_batch(1, [], db_path)
+    enqueue_upload_batch(2, [], db_path)
+
+    first, second = queue.claim("w1"), queue.claim("w2")
+    assert (first.event_id, second.event_id) == (1, 2)
+    assert queue.claim("w3") is None
+    assert job_row(db_path, 1) == ("cropping", "w1", 1, 0)
+
+    assert queue.complete(first, "cropped")
+    assert job_row(db_path, 1) == ("cropped", None, 0, 0)
+
+
+def test_failed_job_is_retried_then_marked_failed(db_path):
+    queue = cropping_queue(db_path)
+    enqueue_upload_batch(1, [], db_path)
+    for attempt in range(1, queue.max_attempts + 1):
+        job = queue.claim("w1")
+        assert job.attempts == attempt
+        assert queue.fail(job)
+    assert queue.claim("w1") is None
+    assert job_row(db_path, 1)[0] == "failed_cropping"
+
+
+def test_expired_lease_is_taken_over(db_path):
+    queue = cropping_queue(db_path, visibility_timeout=0.2)
+    enqueue_upload_batch(1, [], db_path)
+    stale = queue.claim("w1")
+    assert queue.claim("w2") is None  # Still leased
+
+    time.sleep(0.3)
+    fresh = queue.claim("w2")
+    assert fresh.event_id == 1 and fresh.attempts == 2
+
+    assert not queue.heartbeat(stale)
+    assert stale.lost
+    with pytest.raises(LeaseLost):
+        stale.check()
+    assert not queue.complete(stale, "cropped")
+    assert job_row(db_path, 1) == ("cropping", "w2", 2, 0)
+    assert queue.complete(fresh, "cropped")
+
+
+def test_lost_lease_aborts_running_work(db_path):
+    queue = cropping_queue(db_path, visibility_timeout=0.3)
+    enqueue_upload_batch(1, [], db_path)
+    job = queue.claim("w1")
+    aborted = threading.Event()
+
+    with pytest.raises(LeaseLost):
+        with queue.lease(job):
+            with job.aborting(aborted.set):
+                conn = get_db_connection(db_path)  # Another worker takes the event over
+                conn.execute("UPDATE deepface_jobs SET claimed_by = 'w2' WHERE event_id = 1")
+                conn.commit()
+                conn.close()
+                assert aborted.wait(2), "the heartbeat thread did not abort the work"
+                raise RuntimeError("worker killed")  # What the killed subprocess looks like to the handler
+    assert job.lost
+
+
+def test_worker_loop_abandons_lost_job(db_path):
+    queue = cropping_queue(db_path, visibility_timeout=0.3)
+    enqueue_upload_batch(1, [], db_path)
+    handled = threading.Event()
+
+    def handler(job):
+        conn = get_db_connection(db_path)
+        conn.execute("""
+            UPDATE deepface_jobs SET claimed_by = 'other', lease_expires_at = ?
+            WHERE event_id = 1
+        """, (time.time() + 60,))
+        conn.commit()
+        conn.close()
+        job.lost_event.wait(2)
+        handled.set()
+        job.check()
+        return "cropped"
+
+    threading.Thread(target=queue._worker_loop, args=(handler, "w1"), daemon=True).start()
+    assert handled.wait(5)
+    time.sleep(0.2)
+    assert job_row(db_path, 1)[:2] == ("cropping", "other")  # Neither completed nor failed by w1
+
+
+def test_new_batch_while_running_waits_for_the_running_stage(db_path):
+    queue = cropping_queue(db_path)
+    enqueue_upload_batch(1, [], db_path)
+    job = queue.claim("w1")
+
+    enqueue_upload_batch(1, [], db_path)
+    assert job_row(db_path, 1) == ("cropping", "w1", 1, 1)  # Lease untouched, flagged instead
+    assert queue.claim("w2") is None
+    assert queue.heartbeat(job)
+
+    assert queue.complete(job, "cropped")
+    assert job_row(db_path, 1) == ("unsorted", None, 0, 0)  # Back to the start for the new images
+    rerun = queue.claim("w2")
+    assert rerun.event_id == 1 and rerun.attempts == 1
+
+
+def test_new_batch_for_a_later_stage_event_requeues_it(db_path):
+    queue = cropping_queue(db_path)
+    enqueue_upload_batch(1, [], db_path)
+    assert queue.complete(queue.claim("w1"), "cropped")
+
+    enqueue_upload_batch(1, [], db_path)
+    assert job_row(db_path, 1) == ("unsorted", None, 0, 0)
@@ -5,6 +5,7 @@ from app.utils.helpers import validate_required_fields, is_logged_in, rename_new
 from app.services.album_service import add_images_to_album_service
 from app.services.event_service import set_banner_image, update_event_status
 from app.db.dbhelper import get_db_connection
+from app.utils.event_notify import notify_event_ready
 import os
 
 uploads_bp = Blueprint('uploads', __name__, url_prefix='/uploads')
@@ -94,6 +95,7 @@ def upload_event_images(event_id):
             # flash("Could not reset event sorting status, processing might be delayed.", "warning")
         else:
             print(f"[ROUTE-INFO] Event status set to 'unsorted' successfully (or event not found).")
+            notify_event_ready(event_id) # Wake the scheduler instead of waiting for its next sweep
 
     except Exception as e:
         print(f"[ERROR] Exception occurred during image upload: {str(e)}")
@@ -4,6 +4,7 @@ from app.utils.file_utils import create_event_folder, add_all_images_to_album
 from app.services.album_service import create_album, add_all_photos_to_album_db # Used in create_event
 from app.services.image_service import add_images_to_event_db                   # Used in create_event
 from app.utils.file_utils import delete_event_folder                            # Used in delete_event
+from app.utils.event_notify import notify_event_ready                           # Used in create_event
 from flask import current_app
 from werkzeug.utils import secure_filename
 import os
@@ -308,6 +309,10 @@ def create_event(user_id, name, description, category, event_date, location, num
             print(f"Error adding images to 'all_photos': {add_all_photos_response['error']}")
             return {"error": f"Event created, but failed to add images to 'all_photos' album: {add_all_photos_response['error']}"}, 500
 
+        # Step 8: Wake the scheduler so the new images are sent to FDRP right away
+        if event_images:
+            notify_event_ready(event_id)
+
         return {"success": True, "event_id": event_id, "album_id": album_response.get("album_id")}, 201
 
     except Exception as e:
@@ -1,28 +1,363 @@
 # app/tasks.py
 import os
+import uuid
 import requests
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
 import traceback # For detailed error logging
 from datetime import datetime
 # ====> 1. IMPORT allowed_file HELPER <====
 from app.utils.helpers import allowed_file
 # =======================================
+from app.utils.file_utils import compute_file_sha256
+
+# --- Shared state for the scheduler process ---
+_http_local = threading.local()     # One keep-alive requests.Session per sender thread
+_in_flight_events = set()           # Events currently being sent, so overlapping runs skip them
+_in_flight_lock = threading.Lock()
+_executor = None                    # Long-lived pool so threads (and their sessions) are reused across ticks
+                                    # (at exit the interpreter waits for the transfers it is still running)
+_executor_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Returns this thread's pooled requests.Session. Connections to FastAPI are
+    kept alive between requests instead of being opened for every call.
+    """
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_local.session = session
+    return session
+
+
+def get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fdrp-sender')
+        return _executor
+
+
+class StreamingMultipartBody:
+    """
+    A multipart/form-data request body that opens each file only while its
+    bytes are being sent, so a large event never holds more than one file
+    handle or more than one chunk in memory. It reports its total length, so
+    requests sends a Content-Length header instead of chunked encoding.
+
+    Args:
+        fields (dict): Plain form fields, e.g. {"event_id": "12"}.
+        files (list): (field_name, filename, full_path, content_type) tuples.
+    """
+
+    def __init__(self, fields, files, chunk_size=1024 * 1024):
+        self.boundary = uuid.uuid4().hex
+        self.fields = fields
+        self.files = [(field, filename, path, content_type, os.path.getsize(path))
+                      for field, filename, path, content_type in files]
+        self.chunk_size = chunk_size
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _field_part(self, name, value):
+        return (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n').encode('utf-8')
+
+    def _file_header(self, field, filename, content_type):
+        filename = filename.replace('"', '%22')
+        return (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+
+    def _closing(self):
+        return f'--{self.boundary}--\r\n'.encode('utf-8')
+
+    def __len__(self):
+        total = sum(len(self._field_part(name, value)) for name, value in self.fields.items())
+        for field, filename, path, content_type, size in self.files:
+            total += len(self._file_header(field, filename, content_type)) + size + 2
+        return total + len(self._closing())
+
+    def __iter__(self):
+        for name, value in self.fields.items():
+            yield self._field_part(name, value)
+        for field, filename, path, content_type, size in self.files:
+            yield self._file_header(field, filename, content_type)
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    yield chunk
+            yield b'\r\n'
+        yield self._closing()
+
+def build_upload_manifest(candidates):
+    """
+    Returns the manifest FastAPI expects (file name, size, SHA-256) for the candidates.
+
+    Args:
+        candidates (list): (image_filename, full_image_path) tuples.
+    """
+    manifest = []
+    for image_filename, full_image_path in candidates:
+        manifest.append({
+            "file_name": image_filename,
+            "sha256": compute_file_sha256(full_image_path),
+            "size_bytes": os.path.getsize(full_image_path),
+        })
+    return manifest
+
+
+def request_missing_files(manifest_url, event_id, candidates):
+    """
+    Sends the event's manifest to FastAPI and returns only the candidates it
+    does not hold yet, so a retry never re-sends images.
+    Falls back to all candidates if the manifest exchange fails.
+    """
+    manifest = build_upload_manifest(candidates)
+    try:
+        response = get_http_session().post(manifest_url, json={"event_id": event_id, "files": manifest}, timeout=30)
+        response.raise_for_status()
+        missing = set(response.json().get('missing', []))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"  -> WARNING: Manifest exchange failed ({e}). Sending every file.")
+        return candidates
+
+    print(f"  -> Manifest exchange: FastAPI already holds {len(candidates) - len(missing)} of {len(candidates)} file(s).")
+    return [c for c in candidates if c[0] in missing]
+
+
+def guess_content_type(image_filename):
+    """Returns the MIME type sent to FastAPI for an (already validated) image filename."""
+    lower_name = image_filename.lower()
+    if lower_name.endswith(('.jpg', '.jpeg')): return 'image/jpeg'
+    elif lower_name.endswith('.png'): return 'image/png'
+    elif lower_name.endswith('.gif'): return 'image/gif'
+    # Add webp if needed by FastAPI endpoint
+    elif lower_name.endswith('.webp'): return 'image/webp'
+    return 'application/octet-stream'
+
+
+def send_event_multipart(fastapi_url, manifest_url, event_id, candidates):
+    """
+    Sends the event's missing images to FastAPI in one multipart request.
+    Returns True if FastAPI accepted the batch (or already held every image).
+    """
+    # --- Only send what FastAPI does not already hold (idempotent retries) ---
+    candidates = request_missing_files(manifest_url, event_id, candidates)
+    if not candidates:
+        # Everything already arrived on an earlier (timed out) attempt
+        print(f"  -> FastAPI already holds every image for event {event_id}. Nothing to send.")
+        return True
+
+    # --- Stream files; each one is opened only while it is being sent ---
+    body = StreamingMultipartBody(
+        fields={"event_id": str(event_id)},  # Send event ID as a form field
+        files=[('images', image_filename, full_image_path, guess_content_type(image_filename))
+               for image_filename, full_image_path in candidates]
+    )
+
+    print(f"  -> Attempting to send {len(candidates)} allowed file(s) ({len(body)} bytes)...")
+    api_call_successful = False
+    try:
+        response = get_http_session().post(
+            fastapi_url,
+            data=body,
+            headers={"Content-Type": body.content_type},
+            timeout=180
+        )
+
+        if response.status_code == 200:
+            api_call_successful = True
+            try: msg = response.json().get('message', 'OK')
+            except: msg = response.text[:100]
+            print(f"  -> SUCCESS: FastAPI processed images for event {event_id}. Response: {msg}")
+        else:
+            print(f"  -> ERROR: FastAPI returned status {response.status_code} for event {event_id}. Response: {response.text}")
+    except requests.exceptions.Timeout: print(f"  -> ERROR: Request timed out.")
+    except requests.exceptions.ConnectionError: print(f"  -> ERROR: Connection error.")
+    except requests.exceptions.RequestException as e: print(f"  -> ERROR: Network error: {e}")
+    except Exception as e_api: print(f"  -> ERROR during API call: {e_api}")
+    return api_call_successful
+
+
+def send_file_chunks(session_base_url, entry, full_image_path, chunk_size):
+    """
+    Sends one file of an upload session from the offset FastAPI reported,
+    one chunk per PUT. Returns True once FastAPI holds the whole file.
+    """
+    file_url = f"{session_base_url}/files/{quote(entry['file_name'])}"
+    offset = entry['offset']
+    with open(full_image_path, 'rb') as f:
+        while offset < entry['size_bytes']:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            if not chunk:
+                print(f"  -> ERROR: {full_image_path} is shorter than its manifest size.")
+                return False
+            try:
+                response = get_http_session().put(
+                    file_url,
+                    params={"offset": offset},
+                    data=chunk,
+                    headers={"Content-Type": "application/octet-stream"},
+                    timeout=120
+                )
+            except requests.exceptions.RequestException as e:
+                print(f"  -> ERROR: Chunk upload of {entry['file_name']} failed at offset {offset}: {e}")
+                return False
+
+            if response.status_code == 409 and 'offset' in response.json():
+                # Server is at a different offset (e.g. a previous chunk landed but its reply was lost)
+                offset = response.json()['offset']
+                continue
+            if response.status_code != 200:
+                print(f"  -> ERROR: FastAPI returned status {response.status_code} for {entry['file_name']}: {response.text[:200]}")
+                return False
+            offset = response.json()['offset']
+    return True
+
+
+def send_event_chunked(session_url, event_id, candidates, chunk_size):
+    """
+    Uploads the event through FastAPI's resumable session API. After an
+    interruption the next call reopens the same session and continues each
+    file from the offset FastAPI already holds.
+    Returns True once the session has been finalized.
+    """
+    manifest = build_upload_manifest(candidates)
+    paths = dict(candidates)
+    try:
+        response = get_http_session().post(session_url, json={"event_id": event_id, "files": manifest}, timeout=60)
+        response.raise_for_status()
+        session = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"  -> ERROR: Could not open upload session for event {event_id}: {e}")
+        return False
+
+    session_base_url = f"{session_url.rstrip('/')}/{session['session_id']}"
+    pending = [entry for entry in session['files'] if not entry['complete']]
+    print(f"  -> Upload session {session['session_id']}: {len(pending)} file(s) to send, "
+          f"{len(session['files']) - len(pending)} resumed complete, {len(session.get('present', []))} already held.")
+
+    for attempt in range(2):
+        for entry in pending:
+            if entry['file_name'] not in paths:
+                print(f"  -> WARNING: Session expects {entry['file_name']}, which is no longer on disk. Skipping.")
+                continue
+            if not send_file_chunks(session_base_url, entry, paths[entry['file_name']], chunk_size):
+                return False # Resume from here on the next run
+
+        try:
+            response = get_http_session().post(f"{session_base_url}/finalize", timeout=300)
+        except requests.exceptions.RequestException as e:
+            print(f"  -> ERROR: Finalizing upload session failed: {e}")
+            return False
+        if response.status_code == 200:
+            print(f"  -> SUCCESS: {response.json().get('message', 'OK')}")
+            return True
+        if response.status_code == 409 and 'incomplete' in response.json():
+            # Some files failed verification; resend them from the offsets FastAPI reports
+            pending = response.json()['incomplete']
+            print(f"  -> Finalize reported {len(pending)} incomplete file(s). Resending...")
+            continue
+        print(f"  -> ERROR: FastAPI returned status {response.status_code} on finalize: {response.text[:200]}")
+        return False
+    return False
+
+
+def send_event_shared(handoff_url, session_url, event_id, candidates, chunk_size):
+    """
+    Zero-copy handoff for when FastAPI runs on the same host: only a manifest of
+    absolute paths is sent and FastAPI hardlinks/reflinks the originals into its
+    workspace. Files it cannot link (or a disabled handoff endpoint) fall back
+    to the chunked upload.
+    Returns True once FastAPI holds every image.
+    """
+    manifest = build_upload_manifest(candidates)
+    for entry, (image_filename, full_image_path) in zip(manifest, candidates):
+        entry["path"] = os.path.abspath(full_image_path)
+    try:
+        response = get_http_session().post(handoff_url, json={"event_id": event_id, "files": manifest}, timeout=60)
+        response.raise_for_status()
+        result = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"  -> WARNING: Shared-storage handoff unavailable ({e}). Falling back to chunked upload.")
+        return send_event_chunked(session_url, event_id, candidates, chunk_size)
+
+    print(f"  -> Handoff: {result.get('message', 'OK')}")
+    failed_names = {f['file_name'] for f in result.get('failed', [])}
+    if not failed_names:
+        return True
+    for failure in result['failed']:
+        print(f"    -> Could not link {failure['file_name']}: {failure.get('error')}")
+    return send_event_chunked(session_url, event_id, [c for c in candidates if c[0] in failed_names], chunk_size)
+
 
 # Function accepts the app instance from the scheduler
 def check_and_process_unsorted_events(app_instance):
     """
-    Finds and processes *only one* unsorted event per execution.
+    Finds up to SCHEDULER_MAX_EVENTS_PER_TICK unsorted events and sends them
+    to FastAPI, SCHEDULER_EVENT_CONCURRENCY at a time. Returns as soon as they
+    are handed to the sender pool; events still being sent from an earlier
+    call are skipped.
+    """
+    with app_instance.app_context():
+        db_path = app_instance.config['DATABASE']
+        max_events = app_instance.config['SCHEDULER_MAX_EVENTS_PER_TICK']
+        concurrency = app_instance.config['SCHEDULER_EVENT_CONCURRENCY']
+
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT id FROM events WHERE status = 'unsorted' ORDER BY id ASC LIMIT ?",
+            (max_events + len(_in_flight_events),)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"SCHEDULER TASK ERROR: DB error while listing unsorted events: {e}")
+        return
+    finally:
+        if conn:
+            conn.close()
+
+    with _in_flight_lock:
+        event_ids = [row['id'] for row in rows if row['id'] not in _in_flight_events][:max_events]
+        _in_flight_events.update(event_ids)
+
+    if not event_ids:
+        return
+
+    print(f"SCHEDULER TASK: Sending {len(event_ids)} unsorted event(s): {event_ids}")
+    executor = get_executor(concurrency)
+    for event_id in event_ids:
+        executor.submit(process_unsorted_event, app_instance, event_id)  # Removes itself from _in_flight_events
+
+
+def process_unsorted_event(app_instance, event_id):
+    """
+    Sends one unsorted event's images to FastAPI and marks it 'processing'.
     Checks file types using allowed_file before processing.
     Relies on the finally block for all cursor and connection closing.
     """
     with app_instance.app_context():
         db_path = app_instance.config['DATABASE']
         fastapi_url = app_instance.config['FASTAPI_UPLOAD_URL']
+        manifest_url = app_instance.config['FASTAPI_MANIFEST_URL']
+        session_url = app_instance.config['FASTAPI_SESSION_URL']
+        handoff_url = app_instance.config['FASTAPI_HANDOFF_URL']
+        transfer_mode = app_instance.config['FDRP_TRANSFER_MODE']
+        chunk_size = app_instance.config['UPLOAD_CHUNK_SIZE']
         uploads_base_dir = app_instance.config['UPLOAD_FOLDER']
 
-        # print("-" * 60)
-        # print(f"SCHEDULER TASK: Checking for ONE unsorted event in DB -> {db_path}")
-
         conn = None
         cursor = None
 
@@ -31,15 +366,7 @@ def check_and_process_unsorted_events(app_instance):
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
-            cursor.execute("SELECT id FROM events WHERE status = 'unsorted' ORDER BY id ASC LIMIT 1")
-            event_row = cursor.fetchone()
-
-            if not event_row:
-                # print("SCHEDULER TASK: No unsorted events found.")
-                return # Finally block will close conn/cursor
-
-            event_id = event_row['id']
-            print(f"  -> Found unsorted Event ID: {event_id}. Processing this event only.")
+            print(f"  -> Processing unsorted Event ID: {event_id}.")
 
             cursor.execute("""
                 SELECT image_path 
@@ -60,10 +387,8 @@ def check_and_process_unsorted_events(app_instance):
                     conn.rollback()
                 return # Finally block will close conn/cursor
 
-            # --- Prepare files ---
-            files_to_upload = []
-            file_handles = []
-            has_valid_files = False
+            # --- Collect candidate files ---
+            candidates = []
             image_dir = os.path.join(uploads_base_dir, f'event_{event_id}', 'original_images')
             print(f"  -> Base image directory for event: {image_dir}")
 
@@ -84,58 +409,21 @@ def check_and_process_unsorted_events(app_instance):
                 print(f"  -> Checking allowed file: {full_image_path}") # Updated log
 
                 if os.path.exists(full_image_path):
-                    try:
-                        file_handle = open(full_image_path, 'rb')
-                        file_handles.append(file_handle)
-                        content_type = 'application/octet-stream'
-                        # Determine content type (using the already validated filename)
-                        if image_filename.lower().endswith(('.jpg', '.jpeg')): content_type = 'image/jpeg'
-                        elif image_filename.lower().endswith('.png'): content_type = 'image/png'
-                        elif image_filename.lower().endswith('.gif'): content_type = 'image/gif'
-                        # Add webp if needed by FastAPI endpoint
-                        elif image_filename.lower().endswith('.webp'): content_type = 'image/webp'
-
-                        files_to_upload.append(('images', (image_filename, file_handle, content_type)))
-                        has_valid_files = True
-                    except Exception as e_open:
-                         print(f"  -> Error opening file {full_image_path}: {e_open}")
+                    candidates.append((image_filename, full_image_path))
                 else:
                     print(f"  -> CRITICAL WARNING: Image file not found: {full_image_path} (Event {event_id}). Skipping.")
 
-            if not has_valid_files:
+            if not candidates:
                 print(f"  -> No *accessible and allowed* image files found/prepared for event {event_id}.") # Refined log
-                for fh in file_handles: fh.close()
                 return # Finally block will close conn/cursor
 
             # --- Send images ---
-            print(f"  -> Attempting to send {len(files_to_upload)} allowed file(s)...")
-            api_call_successful = False
-            try:
-                response = requests.post(
-                    fastapi_url,
-                    files=files_to_upload,
-                    data={"event_id": str(event_id)},  # Send event ID as a form field
-                    timeout=180
-                )
-
-                if response.status_code == 200:
-                    api_call_successful = True
-                    try: msg = response.json().get('message', 'OK')
-                    except: msg = response.text[:100]
-                    print(f"  -> SUCCESS: FastAPI processed images for event {event_id}. Response: {msg}")
-                else:
-                    print(f"  -> ERROR: FastAPI returned status {response.status_code} for event {event_id}. Response: {response.text}")
-            # (Requests exception handling remains the same...)
-            except requests.exceptions.Timeout: print(f"  -> ERROR: Request timed out.")
-            except requests.exceptions.ConnectionError: print(f"  -> ERROR: Connection error.")
-            except requests.exceptions.RequestException as e: print(f"  -> ERROR: Network error: {e}")
-            except Exception as e_api: print(f"  -> ERROR during API call: {e_api}")
-            finally:
-                # Close file handles here
-                print(f"  -> Closing {len(file_handles)} file handles...")
-                for fh in file_handles:
-                    try: fh.close()
-                    except Exception as e_close: print(f"    -> Error closing handle: {e_close}")
+            if transfer_mode == 'shared':
+                api_call_successful = send_event_shared(handoff_url, session_url, event_id, candidates, chunk_size)
+            elif transfer_mode == 'chunked':
+                api_call_successful = send_event_chunked(session_url, event_id, candidates, chunk_size)
+            else:
+                api_call_successful = send_event_multipart(fastapi_url, manifest_url, event_id, candidates)
 
             # --- Update status ---
             if api_call_successful:
@@ -148,7 +436,7 @@ def check_and_process_unsorted_events(app_instance):
                             status = 'processing', 
                             processing_start_time = ?, 
                             processing_end_time = 'Not yet!'
-                        WHERE id = ?
+                        WHERE id = ? AND status = 'unsorted'
                     """, (current_processing_time, event_id,))
                     cursor.execute("""
                         UPDATE event_images 
@@ -176,4 +464,6 @@ def check_and_process_unsorted_events(app_instance):
             if conn:
                 try: conn.close(); #print("SCHEDULER TASK: Database connection closed.")
                 except Exception as ce: print(f"Error closing connection: {ce}")
+            with _in_flight_lock:
+                _in_flight_events.discard(event_id)
             print("-" * 60)
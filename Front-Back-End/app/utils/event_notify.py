@@ -0,0 +1,98 @@
+import socket
+import threading
+from flask import current_app
+
+
+def notify_event_ready(event_id, host=None, port=None):
+    """
+    Tells the scheduler process that an event has images waiting, so it can
+    start sending them right away instead of waiting for the next sweep.
+
+    The notification is a single localhost UDP datagram. It is only a wakeup:
+    the events table stays the source of truth, so a lost datagram (scheduler
+    not running, restart, ...) just means the fallback sweep picks the event up.
+
+    Args:
+        event_id (int): The event that became 'unsorted'.
+        host (str): Listener host; defaults to EVENT_NOTIFY_HOST from the app config.
+        port (int): Listener port; defaults to EVENT_NOTIFY_PORT from the app config.
+
+    Returns:
+        bool: True if the datagram was handed to the OS, False otherwise.
+    """
+    try:
+        if host is None:
+            host = current_app.config['EVENT_NOTIFY_HOST']
+        if port is None:
+            port = current_app.config['EVENT_NOTIFY_PORT']
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(f"event:{event_id}".encode('utf-8'), (host, port))
+        print(f"[NOTIFY] Event {event_id} queued for processing ({host}:{port}).")
+        return True
+    except Exception as e:
+        print(f"[NOTIFY-WARN] Could not notify scheduler about event {event_id}: {e}")
+        return False
+
+
+class EventNotificationListener:
+    """
+    Receives notify_event_ready() datagrams in the scheduler process and runs
+    `dispatch` on a single background thread.
+
+    Notifications that arrive while a dispatch is running are coalesced into
+    one follow-up run, so a burst of uploads does not queue a burst of scans.
+    """
+
+    def __init__(self, host, port, dispatch):
+        self.host = host
+        self.port = port
+        self.dispatch = dispatch
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._sock = None
+        self._threads = []
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self.host, self.port))
+        self._sock.settimeout(1.0)  # Lets the receive loop notice stop()
+        for target, name in ((self._receive_loop, 'event-notify-receiver'),
+                             (self._dispatch_loop, 'event-notify-dispatcher')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[NOTIFY] Listening for event notifications on {self.host}:{self.port}", flush=True)
+
+    def wake(self):
+        """Requests a dispatch run without a datagram, e.g. once at startup."""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._sock:
+            self._sock.close()
+
+    def _receive_loop(self):
+        while not self._stopped.is_set():
+            try:
+                data, _ = self._sock.recvfrom(256)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            print(f"[NOTIFY] Received '{data.decode('utf-8', 'replace')}'", flush=True)
+            self._wake.set()
+
+    def _dispatch_loop(self):
+        while True:
+            self._wake.wait()
+            if self._stopped.is_set():
+                break
+            self._wake.clear()
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"[NOTIFY-ERROR] Dispatch failed: {e}", flush=True)
@@ -3,6 +3,7 @@ from app.utils.helpers import allowed_file
 from werkzeug.utils import secure_filename
 from flask import current_app
 import shutil
+import hashlib
 UPLOADS_FOLDER = "uploads"  # Root uploads folder
 
 
@@ -247,4 +248,16 @@ def delete_image_files(event_id, image_paths):
                     os.remove(path)
                     print(f"Deleted: {path}")
             except Exception as e:
-                print(f"Error deleting file {path}: {e}")
\ No newline at end of file
+                print(f"Error deleting file {path}: {e}")
+
+
+def compute_file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks so large images
+    are never loaded into memory at once.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
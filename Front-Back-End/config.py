@@ -17,6 +17,16 @@ class Config:
     # --- ADDED Settings for Background Scheduler and FastAPI Integration ---
     SCHEDULER_API_ENABLED = True  # Optional: Enables an API endpoint to view scheduler status.
     FASTAPI_UPLOAD_URL = os.environ.get('FASTAPI_UPLOAD_URL', "http://127.0.0.1:8000/upload-images/") # URL of your FastAPI image upload endpoint. ADJUST IP/PORT AS NEEDED!
+    FASTAPI_MANIFEST_URL = os.environ.get('FASTAPI_MANIFEST_URL', "http://127.0.0.1:8000/upload-manifest/") # Tells us which images FastAPI is still missing for an event
+    FASTAPI_SESSION_URL = os.environ.get('FASTAPI_SESSION_URL', "http://127.0.0.1:8000/upload-sessions/") # Resumable chunked upload API
+    FASTAPI_HANDOFF_URL = os.environ.get('FASTAPI_HANDOFF_URL', "http://127.0.0.1:8000/handoff-images/") # Zero-copy handoff by file path (same host only)
+    FDRP_TRANSFER_MODE = os.environ.get('FDRP_TRANSFER_MODE', 'chunked') # 'chunked' (resumable, default), 'multipart' (one request per event) or 'shared' (same-host hardlink handoff)
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)) # Bytes per chunk in 'chunked' mode
+    SCHEDULER_MAX_EVENTS_PER_TICK = int(os.environ.get('SCHEDULER_MAX_EVENTS_PER_TICK', 8)) # Unsorted events picked up per scheduler run
+    SCHEDULER_EVENT_CONCURRENCY = int(os.environ.get('SCHEDULER_EVENT_CONCURRENCY', 2)) # Events sent to FastAPI at the same time
+    SCHEDULER_SWEEP_MINUTES = int(os.environ.get('SCHEDULER_SWEEP_MINUTES', 5)) # Fallback scan for unsorted events whose notification was lost
+    EVENT_NOTIFY_HOST = os.environ.get('EVENT_NOTIFY_HOST', '127.0.0.1') # Where the scheduler listens for "event ready" wakeups
+    EVENT_NOTIFY_PORT = int(os.environ.get('EVENT_NOTIFY_PORT', 5055))
     # --- End ADDED Settings ---
 
 
@@ -3,6 +3,7 @@ import os
 import traceback
 from app import create_app, scheduler
 from app.tasks import check_and_process_unsorted_events
+from app.utils.event_notify import EventNotificationListener
 import atexit
 
 app = create_app()
@@ -21,7 +22,9 @@ try:
         print(f"[PID {main_pid}] scheduler.py: Scheduler already running (unexpected).", flush=True)
 
     if not scheduler.get_job(job_id):
-        run_interval_minutes = 1
+        # Uploads wake the dispatcher directly (see event_listener below);
+        # this interval job is only a fallback sweep for missed notifications.
+        run_interval_minutes = app.config['SCHEDULER_SWEEP_MINUTES']
         scheduler.add_job(
             id=job_id,
             func=check_and_process_unsorted_events,
@@ -42,8 +45,23 @@ except Exception as e:
     print(f"[PID {main_pid}] scheduler.py: Error in scheduler setup: {e}", flush=True)
     traceback.print_exc()
 
+# Event-driven dispatch: the Flask app notifies us as soon as an event becomes 'unsorted'
+event_listener = EventNotificationListener(
+    app.config['EVENT_NOTIFY_HOST'],
+    app.config['EVENT_NOTIFY_PORT'],
+    dispatch=lambda: check_and_process_unsorted_events(app)
+)
+try:
+    event_listener.start()
+except OSError as e:
+    print(f"[PID {main_pid}] scheduler.py: Could not start event listener ({e}); relying on the periodic sweep only.", flush=True)
+
+# Catch up on anything that became 'unsorted' while the scheduler was down
+event_listener.wake()
+
 # Ensure scheduler shuts down cleanly on exit
 def shutdown_scheduler_on_exit():
+    event_listener.stop()
     if scheduler.running:
         print(f"[PID {os.getpid()}] scheduler.py: Shutting down scheduler...", flush=True)
         try:
@@ -20,12 +20,14 @@ tmux send-keys -t $SESSION 'gunicorn -w 4 -b 0.0.0.0:5000 --timeout 120 run:app'
 tmux new-window -t $SESSION -n 'scheduler'
 tmux send-keys -t $SESSION:1 'source ~/Python-Environments/flaskenv/bin/activate' C-m
 tmux send-keys -t $SESSION:1 'cd /home/archmax/startup/FYP-Project/identify/Front-Back-End' C-m
+tmux send-keys -t $SESSION:1 'export FDRP_TRANSFER_MODE=shared' C-m  # Same host: hand images to FDRP by hardlink
 tmux send-keys -t $SESSION:1 'python scheduler.py' C-m
 
 # Window 3: Uvicorn (FastAPI)
 tmux new-window -t $SESSION -n 'uvicorn'
 tmux send-keys -t $SESSION:2 'source ~/Python-Environments/Cuda-Deep-Fast/bin/activate' C-m
 tmux send-keys -t $SESSION:2 'cd /home/archmax/startup/FYP-Project/identify/FDRP' C-m
+tmux send-keys -t $SESSION:2 'export FDRP_HANDOFF_ROOTS=/home/archmax/startup/FYP-Project/identify/Front-Back-End/uploads' C-m
 tmux send-keys -t $SESSION:2 'uvicorn main:app --reload' C-m
 
 # Window 4: Retinaface Manager